@@ -0,0 +1,9 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path('auth/profile/', async_views.profile),
+    path('auth/following/', async_views.following),
+    path('auth/user-followers/', async_views.user_followers),
+    path('auth/user-following/', async_views.user_following),
+]
@@ -0,0 +1,64 @@
+"""Async versions of the profile and follow list endpoints (see backend.asyncapi)."""
+from django.contrib.auth.models import User
+
+from backend.asyncapi import conditional, read_view, render
+from .cache import aget_profile_by_username
+from .models import Follow
+from .pagination import FollowCursorPagination
+from .serializers import FollowEntrySerializer
+
+
+async def follow_list_response(request, follows, side):
+    """views.follow_list_response through the async ORM."""
+    paginator = FollowCursorPagination()
+    page = await paginator.apaginate_queryset(follows.select_related(f'{side}__profile'), request)
+    user_ids = [getattr(follow, f'{side}_id') for follow in page]
+    following_ids = set()
+    if request.user.is_authenticated and user_ids:
+        following_ids = {
+            user_id async for user_id in Follow.objects.filter(
+                follower=request.user, followed_id__in=user_ids
+            ).values_list('followed_id', flat=True)
+        }
+    serializer = FollowEntrySerializer(page, many=True, context={'side': side, 'following_ids': following_ids})
+    return render(paginator.get_paginated_data(serializer.data))
+
+
+async def _user_id(request):
+    """Id of the `username` query parameter's user, or an error response."""
+    username = request.query_params.get('username')
+    if not username:
+        return None, render({'detail': 'username query parameter is required'}, 400)
+    user_id = await User.objects.filter(username=username).values_list('pk', flat=True).afirst()
+    if user_id is None:
+        return None, render({'detail': 'User not found'}, 404)
+    return user_id, None
+
+
+@read_view()
+async def profile(request):
+    username = request.query_params.get('username')
+    if not username:
+        return render({'detail': 'username query parameter is required'}, 400)
+    try:
+        data, etag = await aget_profile_by_username(username, request.user)
+    except User.DoesNotExist:
+        return render({'detail': 'User not found'}, 404)
+    return conditional(request, data, etag)
+
+
+@read_view(auth_required=True)
+async def following(request):
+    return await follow_list_response(request, Follow.objects.filter(follower=request.user), 'followed')
+
+
+@read_view()
+async def user_followers(request):
+    user_id, error = await _user_id(request)
+    return error or await follow_list_response(request, Follow.objects.filter(followed_id=user_id), 'follower')
+
+
+@read_view()
+async def user_following(request):
+    user_id, error = await _user_id(request)
+    return error or await follow_list_response(request, Follow.objects.filter(follower_id=user_id), 'followed')
@@ -0,0 +1,254 @@
+"""
+JWT authentication without a user query per request.
+
+Tokens carry the user's `token_version` (UserProfile.token_version) in a
+`ver` claim. CachedJWTAuthentication resolves the user, with its profile
+already joined, from a small in-process cache (AUTH_LOCAL_CACHE_TTL
+seconds) and then from Django's cache (AUTH_CACHE_TIMEOUT seconds); only a
+miss in both reads the database.
+
+Bumping the version (`revoke_tokens`, done on password changes) rejects
+every token issued before. Anything that changes the cached user must call
+`invalidate_auth`; saving a User does so through a signal, queryset
+updates must do it themselves. Entries already copied into other
+processes' local caches live on for at most AUTH_LOCAL_CACHE_TTL.
+
+`invalidate_auth` also stamps a fresh generation token for the user before
+deleting the entry. A fill reads the token before loading the user, and
+drops what it stored if the token changed meanwhile, so a fill racing an
+invalidation cannot put the old user back.
+"""
+import pickle
+import threading
+import time
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import F
+from django.utils.translation import gettext_lazy as _
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+VERSION_CLAIM = 'ver'
+AUTH_KEY = 'auth:v1:user:{}'
+GENERATION_KEY = 'auth:v1:generation:{}'
+
+_local_lock = threading.Lock()
+_local = {}
+
+
+def token_version(user):
+    """The user's current token version (0 for users without a profile)."""
+    try:
+        return user.profile.token_version
+    except User.profile.RelatedObjectDoesNotExist:
+        return 0
+
+
+class VersionedRefreshToken(RefreshToken):
+    """Refresh token (and, through it, access token) stamped with the user's token version."""
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token[VERSION_CLAIM] = token_version(user)
+        return token
+
+
+class VersionedTokenObtainPairSerializer(TokenObtainPairSerializer):
+    token_class = VersionedRefreshToken
+
+
+class VersionedTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses refresh tokens issued before the user's last revocation."""
+
+    def validate(self, attrs):
+        refresh = self.token_class(attrs['refresh'])
+        user_id = refresh.payload.get(api_settings.USER_ID_CLAIM)
+        user = User.objects.select_related('profile').filter(pk=user_id).first()
+        if user is not None and refresh.payload.get(VERSION_CLAIM, 0) != token_version(user):
+            raise AuthenticationFailed(_('Token has been revoked.'), code='token_revoked')
+        return super().validate(attrs)
+
+
+def tokens_for(user):
+    """Response fields with a new refresh/access token pair for `user`."""
+    refresh = VersionedRefreshToken.for_user(user)
+    return {'refresh': str(refresh), 'access': str(refresh.access_token)}
+
+
+def revoke_tokens(user):
+    """Invalidate every token issued to `user` so far, and end the streams they opened."""
+    from posts.live import access_revoked
+    from .models import UserProfile
+
+    UserProfile.objects.filter(user_id=user.pk).update(token_version=F('token_version') + 1)
+    if hasattr(user, 'profile'):
+        user.profile.refresh_from_db(fields=['token_version'])
+    invalidate_auth(user.pk)
+    access_revoked(user.pk, version=token_version(user))
+
+
+def invalidate_auth(user_id):
+    """Forget the cached user `user_id` here and in the shared cache."""
+    # Stamp before deleting: see _store
+    cache.set(GENERATION_KEY.format(user_id), uuid.uuid4().hex, settings.AUTH_CACHE_TIMEOUT)
+    with _local_lock:
+        _local.pop(user_id, None)
+    cache.delete(AUTH_KEY.format(user_id))
+
+
+def _local_get(user_id):
+    with _local_lock:
+        entry = _local.get(user_id)
+    if entry is None or entry[0] < time.monotonic():
+        return None
+    return entry[1]
+
+
+def _local_set(user_id, blob):
+    with _local_lock:
+        if len(_local) >= settings.AUTH_LOCAL_CACHE_SIZE:
+            now = time.monotonic()
+            for key in [key for key, entry in _local.items() if entry[0] < now]:
+                del _local[key]
+            if len(_local) >= settings.AUTH_LOCAL_CACHE_SIZE:
+                _local.clear()
+        _local[user_id] = (time.monotonic() + settings.AUTH_LOCAL_CACHE_TTL, blob)
+
+
+def _pack(user):
+    return pickle.dumps((token_version(user), user), pickle.HIGHEST_PROTOCOL)
+
+
+def _store(user_id, blob, generation):
+    """
+    Cache `blob`, loaded after reading `generation`, unless invalidate_auth
+    ran since. True if the entry stands.
+    """
+    key, generation_key = AUTH_KEY.format(user_id), GENERATION_KEY.format(user_id)
+    if cache.get(generation_key) != generation:
+        return False
+    cache.set(key, blob, settings.AUTH_CACHE_TIMEOUT)
+    # invalidate_auth stamps before it deletes, so one that raced the set shows here
+    if cache.get(generation_key) != generation:
+        cache.delete(key)
+        return False
+    return True
+
+
+async def _astore(user_id, blob, generation):
+    """_store for async callers."""
+    key, generation_key = AUTH_KEY.format(user_id), GENERATION_KEY.format(user_id)
+    if await cache.aget(generation_key) != generation:
+        return False
+    await cache.aset(key, blob, settings.AUTH_CACHE_TIMEOUT)
+    if await cache.aget(generation_key) != generation:
+        await cache.adelete(key)
+        return False
+    return True
+
+
+def cached_user(user_id):
+    """
+    (version, user with profile) for `user_id`, or None if no such user.
+    Every call returns a fresh copy, so a request may modify its user.
+    """
+    blob = _local_get(user_id)
+    if blob is None:
+        blob = cache.get(AUTH_KEY.format(user_id))
+        if blob is None:
+            generation = cache.get(GENERATION_KEY.format(user_id))
+            # Fills read the primary: a lagging replica would re-cache a
+            # revoked version or an inactive user right after invalidate_auth
+            user = User.objects.using(DEFAULT_DB_ALIAS).select_related('profile').filter(pk=user_id).first()
+            if user is None:
+                return None
+            blob = _pack(user)
+            if not _store(user_id, blob, generation):
+                return pickle.loads(blob)
+        _local_set(user_id, blob)
+    return pickle.loads(blob)
+
+
+async def acached_user(user_id):
+    """cached_user for async views."""
+    blob = _local_get(user_id)
+    if blob is None:
+        blob = await cache.aget(AUTH_KEY.format(user_id))
+        if blob is None:
+            generation = await cache.aget(GENERATION_KEY.format(user_id))
+            user = await User.objects.using(DEFAULT_DB_ALIAS).select_related('profile').filter(pk=user_id).afirst()
+            if user is None:
+                return None
+            blob = _pack(user)
+            if not await _astore(user_id, blob, generation):
+                return pickle.loads(blob)
+        _local_set(user_id, blob)
+    return pickle.loads(blob)
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication reading the user from the auth cache."""
+
+    def get_user(self, validated_token):
+        user_id, claimed = self.claims(validated_token)
+        found = cached_user(user_id)
+        if found is not None and found[0] < claimed:
+            # Token issued after the cached entry was made elsewhere
+            invalidate_auth(user_id)
+            found = cached_user(user_id)
+        return self.check(found, claimed)
+
+    def authenticate_request(self, request, raw_token=None):
+        """
+        `authenticate` for plain Django requests: (user, validated token), or
+        None without credentials. The Authorization header wins over `raw_token`.
+        """
+        raw_token = self.request_token(request, raw_token)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return self.get_user(validated_token), validated_token
+
+    async def aauthenticate(self, request, raw_token=None):
+        """authenticate_request for async views."""
+        raw_token = self.request_token(request, raw_token)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        user_id, claimed = self.claims(validated_token)
+        found = await acached_user(user_id)
+        if found is not None and found[0] < claimed:
+            await sync_to_async(invalidate_auth)(user_id)
+            found = await acached_user(user_id)
+        return self.check(found, claimed), validated_token
+
+    def request_token(self, request, raw_token=None):
+        header = self.get_header(request)
+        return self.get_raw_token(header) if header is not None else raw_token
+
+    def claims(self, validated_token):
+        try:
+            user_id = int(validated_token[api_settings.USER_ID_CLAIM])
+        except (KeyError, TypeError, ValueError) as e:
+            raise InvalidToken(_('Token contained no recognizable user identification')) from e
+        return user_id, validated_token.get(VERSION_CLAIM, 0)
+
+    def check(self, found, claimed):
+        if found is None:
+            raise AuthenticationFailed(_('User not found'), code='user_not_found')
+        version, user = found
+        if claimed != version:
+            raise AuthenticationFailed(_('Token has been revoked.'), code='token_revoked')
+        if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+            raise AuthenticationFailed(_('User is inactive'), code='user_inactive')
+        return user
@@ -0,0 +1,232 @@
+"""
+Profile picture pipeline.
+
+The request only checks the upload's magic bytes and copies it to a local
+staging directory, then answers. A background job (accounts.tasks)
+decodes the image, stores the original through the default storage
+(Cloudinary, or FileSystemStorage without Cloudinary credentials), renders
+square WebP variants of AVATAR_VARIANT_SIZES and points the profile at
+them.
+
+The staging directory must be readable by the job workers (same host or
+a shared volume).
+
+UserProfile.profile_picture_pending holds the staging token of the upload
+being processed. A newer upload replaces the token; a worker whose token
+is no longer current throws its output away. Replaced and deleted assets
+are removed from storage by background jobs as well (see the signal
+handlers in models.py).
+"""
+import io
+import logging
+import os
+import uuid
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from PIL import Image, ImageOps
+
+from jobs.queue import enqueue
+
+logger = logging.getLogger(__name__)
+
+# Same directory as UserProfile.profile_picture's upload_to
+UPLOAD_DIR = 'profile_pictures/'
+MAX_PICTURE_SIZE = 5 * 1024 * 1024
+# Variant used wherever avatars are shown small (post lists, follow lists, search)
+LIST_AVATAR_SIZE = 96
+SNIFF_BYTES = 12
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def variant_sizes():
+    return tuple(sorted(settings.AVATAR_VARIANT_SIZES))
+
+
+def staging_dir():
+    return settings.AVATAR_STAGING_DIR
+
+
+def sniff_image_type(upload):
+    """File extension matching the magic bytes of `upload`, or None if not an accepted image."""
+    upload.seek(0)
+    head = upload.read(SNIFF_BYTES)
+    upload.seek(0)
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in SIGNATURES:
+        if head.startswith(signature):
+            return extension
+    return None
+
+
+def stage_upload(upload, extension):
+    """Copy `upload` to the staging directory chunk by chunk; returns its token."""
+    token = f'{uuid.uuid4().hex}.{extension}'
+    os.makedirs(staging_dir(), exist_ok=True)
+    with open(os.path.join(staging_dir(), token), 'wb') as handle:
+        for chunk in upload.chunks():
+            handle.write(chunk)
+    return token
+
+
+def request_processing(profile, token):
+    """Make `token` the profile's pending upload and queue its processing."""
+    from .models import UserProfile
+
+    UserProfile.objects.filter(pk=profile.pk).update(profile_picture_pending=token)
+    profile.profile_picture_pending = token
+    # The user is waiting to see the new picture
+    enqueue('accounts.process_profile_picture', {'profile_id': profile.pk, 'token': token}, priority=10)
+
+
+def _decode(path, largest):
+    """The staged image as RGB(A), upright, decoded no larger than needed for `largest`."""
+    with Image.open(path) as source:
+        if source.width * source.height > settings.AVATAR_MAX_PIXELS:
+            raise InvalidImage(f'{source.width}x{source.height} exceeds AVATAR_MAX_PIXELS')
+        # JPEG only: let the decoder downscale by 1/2..1/8 while reading
+        source.draft('RGB', (largest, largest))
+        image = ImageOps.exif_transpose(source)
+        return image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+
+
+def render_variant(image, size):
+    """`image` center-cropped to a `size` x `size` square, as WebP bytes."""
+    buffer = io.BytesIO()
+    ImageOps.fit(image, (size, size), Image.LANCZOS).save(buffer, 'WEBP', quality=85)
+    return buffer.getvalue()
+
+
+def process_upload(profile_id, token):
+    """
+    Store the staged upload `token` and its variants, then switch the
+    profile over to them. Unreadable images are given up on; storage
+    errors propagate so the job is retried.
+    """
+    from .cache import invalidate_profile
+    from .models import UserProfile
+
+    path = os.path.join(staging_dir(), token)
+    if not UserProfile.objects.filter(pk=profile_id, profile_picture_pending=token).exists():
+        _remove_staged(path)
+        return
+    sizes = variant_sizes()
+    try:
+        image = _decode(path, sizes[-1])
+    except (OSError, InvalidImage, Image.DecompressionBombError):
+        logger.warning('Profile picture %s of profile %s is unreadable', token, profile_id, exc_info=True)
+        abandon_upload(profile_id, token)
+        return
+
+    stem = os.path.splitext(token)[0]
+    stored = []
+    try:
+        with open(path, 'rb') as handle:
+            original = default_storage.save(f'{UPLOAD_DIR}{token}', File(handle))
+        stored.append(original)
+        variants = {}
+        for size in sizes:
+            name = default_storage.save(f'{UPLOAD_DIR}{stem}_{size}.webp', ContentFile(render_variant(image, size)))
+            stored.append(name)
+            variants[str(size)] = name
+
+        with transaction.atomic():
+            profile = UserProfile.objects.select_for_update().filter(
+                pk=profile_id, profile_picture_pending=token
+            ).first()
+            if profile is not None:
+                profile.profile_picture = original
+                profile.profile_picture_variants = variants
+                profile.profile_picture_pending = ''
+                profile.save(update_fields=['profile_picture', 'profile_picture_variants', 'profile_picture_pending'])
+    except Exception:
+        delete_assets(stored)
+        raise
+    if profile is None:
+        # Superseded by a newer upload while this one was processed
+        delete_assets(stored)
+    else:
+        invalidate_profile(profile.user_id)
+    _remove_staged(path)
+
+
+def abandon_upload(profile_id, token):
+    """Stop reporting `token` as processing and drop its staged file."""
+    from .cache import invalidate_profile
+    from .models import UserProfile
+
+    profile = UserProfile.objects.filter(pk=profile_id, profile_picture_pending=token).first()
+    if profile is not None:
+        UserProfile.objects.filter(pk=profile_id, profile_picture_pending=token).update(profile_picture_pending='')
+        invalidate_profile(profile.user_id)
+    _remove_staged(os.path.join(staging_dir(), token))
+
+
+def _remove_staged(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def delete_assets(names):
+    """Delete `names` from storage; returns the ones that could not be deleted."""
+    failed = []
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except Exception:
+            logger.exception('Could not delete %s from storage', name)
+            failed.append(name)
+    return failed
+
+
+def delete_assets_later(names):
+    """Queue deletion of stored files; the job only exists if the current transaction commits."""
+    names = sorted(names)
+    if names:
+        enqueue('accounts.delete_assets', {'names': names}, priority=-10)
+
+
+def asset_names(profile):
+    """
+    Storage names of the profile's picture and variants, read from the
+    instance without touching the database; None if either field is deferred.
+    """
+    data = profile.__dict__
+    if 'profile_picture' not in data or 'profile_picture_variants' not in data:
+        return None
+    picture = data['profile_picture']
+    names = {getattr(picture, 'name', picture)} | set((data['profile_picture_variants'] or {}).values())
+    return {name for name in names if name}
+
+
+def variant_urls(profile):
+    return {size: default_storage.url(name) for size, name in (profile.profile_picture_variants or {}).items()}
+
+
+def avatar_url(profile, size=LIST_AVATAR_SIZE):
+    """
+    URL of the smallest variant at least `size` pixels wide (else the
+    largest one, else the original); None without a picture.
+    """
+    if not profile.profile_picture:
+        return None
+    variants = sorted((int(width), name) for width, name in (profile.profile_picture_variants or {}).items())
+    if not variants:
+        return profile.profile_picture.url
+    name = next((name for width, name in variants if width >= size), variants[-1][1])
+    return default_storage.url(name)
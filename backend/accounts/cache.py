@@ -0,0 +1,147 @@
+"""
+Cache of the viewer-independent part of profile responses.
+
+The public payload (everything UserDetailSerializer renders except
+`is_following`) is stored per user id in Django's cache framework, with a
+username -> id pointer for `profile?username=` lookups. Only
+`is_following` is computed per request. Write paths that change what the
+payload shows must call `invalidate_profile`.
+
+Each cached payload carries a random version stamp; together with the
+viewer's follow state it is the profile's ETag.
+
+Payloads are always built from the primary database: with read replicas,
+a fill right after `invalidate_profile` could otherwise cache the row a
+lagging replica still has.
+"""
+import threading
+import uuid
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+from backend.conditional import weak_etag
+from .models import Follow
+from .serializers import UserDetailSerializer
+
+PROFILE_KEY = 'profile:v1:user:{}'
+USERNAME_KEY = 'profile:v1:name:{}'
+
+_stats_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+
+def _timeout():
+    return settings.PROFILE_CACHE_TIMEOUT
+
+
+def _record(event):
+    with _stats_lock:
+        _stats[event] += 1
+
+
+def profile_cache_stats():
+    """Hit/miss counters for this process."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else None
+    return stats
+
+
+def _users():
+    return User.objects.using(DEFAULT_DB_ALIAS).select_related('profile')
+
+
+def _build_payload(user):
+    data = dict(UserDetailSerializer(user).data)
+    data.pop('is_following', None)
+    return data
+
+
+def _cached_payload(user_id, load_user):
+    entry = cache.get(PROFILE_KEY.format(user_id))
+    if entry is not None:
+        _record('hits')
+        return entry
+    _record('misses')
+    entry = {'version': uuid.uuid4().hex, 'data': _build_payload(load_user())}
+    cache.set(PROFILE_KEY.format(user_id), entry, _timeout())
+    return entry
+
+
+def get_profile(user, viewer=None):
+    """(payload, etag) for `user`, read back from the database on a miss."""
+    # `user` may come from the auth cache, whose counters lag behind
+    entry = _cached_payload(
+        user.pk, lambda: _users().get(pk=user.pk),
+    )
+    return _with_viewer_state(entry, viewer)
+
+
+def get_profile_by_username(username, viewer=None):
+    """(payload, etag) for `username`; raises User.DoesNotExist."""
+    user_id = cache.get(USERNAME_KEY.format(username))
+    if user_id is None:
+        user = _users().get(username=username)
+        user_id = user.pk
+        cache.set(USERNAME_KEY.format(username), user_id, _timeout())
+        entry = _cached_payload(user_id, lambda: user)
+    else:
+        entry = _cached_payload(
+            user_id, lambda: _users().get(pk=user_id),
+        )
+    return _with_viewer_state(entry, viewer)
+
+
+async def aget_profile_by_username(username, viewer=None):
+    """get_profile_by_username for async views."""
+    user = None
+    user_id = await cache.aget(USERNAME_KEY.format(username))
+    if user_id is None:
+        user = await _users().aget(username=username)
+        user_id = user.pk
+        await cache.aset(USERNAME_KEY.format(username), user_id, _timeout())
+
+    entry = await cache.aget(PROFILE_KEY.format(user_id))
+    if entry is not None:
+        _record('hits')
+    else:
+        _record('misses')
+        if user is None:
+            user = await _users().aget(pk=user_id)
+        # Users without a profile row fall back to COUNT queries
+        entry = {'version': uuid.uuid4().hex, 'data': await sync_to_async(_build_payload)(user)}
+        await cache.aset(PROFILE_KEY.format(user_id), entry, _timeout())
+
+    following = _follows(entry, viewer)
+    return _viewer_payload(entry, following is not None and await following.aexists())
+
+
+def _follows(entry, viewer):
+    """The viewer's Follow row for the profile, None when there is nothing to look up."""
+    if viewer is None or not viewer.is_authenticated or viewer.pk == entry['data']['id']:
+        return None
+    return Follow.objects.filter(follower=viewer, followed_id=entry['data']['id'])
+
+
+def _with_viewer_state(entry, viewer):
+    following = _follows(entry, viewer)
+    return _viewer_payload(entry, following is not None and following.exists())
+
+
+def _viewer_payload(entry, is_following):
+    data = dict(entry['data'])
+    data['is_following'] = bool(is_following)
+    return data, weak_etag(entry['version'], data['is_following'])
+
+
+def invalidate_profile(user_id, *usernames):
+    """Drop a user's cached payload and any username pointers to it."""
+    _record('invalidations')
+    cache.delete_many(
+        [PROFILE_KEY.format(user_id)] + [USERNAME_KEY.format(name) for name in usernames]
+    )
@@ -1,52 +1,225 @@
 """
-CPF validation utility using external API.
-Validates CPF format and checks validity via external service.
+CPF validation pipeline.
+
+1. Format and mod-11 check digits are verified locally; invalid CPFs are
+   rejected without any network call.
+2. Verdicts from the external service are cached (positive and negative).
+3. Remote calls go through a pooled requests.Session and a circuit breaker
+   that stops calling the service after repeated failures.
+4. With CPF_EXTERNAL_CHECK = 'deferred' the remote check runs after the
+   account is created, as a background job retried while the service is
+   unavailable.
 """
+import logging
+import re
+import threading
+import time
+
 import requests
-from rest_framework import serializers
+from django.conf import settings
+from django.core.cache import cache
+from requests.adapters import HTTPAdapter
 
+logger = logging.getLogger(__name__)
 
-def validate_cpf_external(cpf: str) -> bool:
+CPF_PATTERN = re.compile(r'^\d{3}\.\d{3}\.\d{3}-\d{2}$')
+VERDICT_KEY = 'cpf:verdict:{}'
+
+
+def clean_cpf(cpf: str) -> str:
+    return cpf.replace('.', '').replace('-', '')
+
+
+def validate_cpf_format(cpf: str) -> bool:
     """
-    Validate CPF using external API.
-    CPF should be in format: XXX.XXX.XXX-XX
-    
-    Uses a free CPF validation API. Returns True if valid, False otherwise.
+    Validate CPF format (must be XXX.XXX.XXX-XX).
+    Returns True if format is valid, False otherwise.
+    """
+    return bool(CPF_PATTERN.match(cpf))
+
+
+def cpf_check_digits(base: str) -> str:
+    """The two mod-11 check digits for the first nine CPF digits."""
+    digits = [int(d) for d in base]
+    for weight_start in (10, 11):
+        total = sum(d * w for d, w in zip(digits, range(weight_start, 1, -1)))
+        remainder = (total * 10) % 11
+        digits.append(0 if remainder == 10 else remainder)
+    return f'{digits[-2]}{digits[-1]}'
+
+
+def validate_cpf_check_digits(cpf: str) -> bool:
     """
+    Validate the CPF check digits locally (no network).
+    Sequences of a single repeated digit are rejected.
+    """
+    digits = clean_cpf(cpf)
+    if len(digits) != 11 or not digits.isdigit() or len(set(digits)) == 1:
+        return False
+    return cpf_check_digits(digits[:9]) == digits[9:]
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures; while open
+    calls are refused until `reset_timeout` seconds pass, then one trial call
+    is let through (half-open) and its outcome closes or re-opens it.
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return 'half-open'
+        return 'open'
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == 'closed':
+                return True
+            if state == 'half-open' and not self._trial_in_flight:
+                self._trial_in_flight = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.opened_at is not None or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+
+breaker = CircuitBreaker(
+    failure_threshold=settings.CPF_BREAKER_FAILURES,
+    reset_timeout=settings.CPF_BREAKER_RESET_SECONDS,
+)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session() -> requests.Session:
+    """Process-wide session so connections to the API are reused."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=4, pool_maxsize=settings.CPF_API_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def _query_remote(cpf_clean: str):
+    """True/False verdict from the API, or None if it could not be obtained."""
+    if not breaker.allow():
+        return None
+    url = settings.CPF_API_URL.format(cpf=cpf_clean)
     try:
-        # Remove formatting for API call
-        cpf_clean = cpf.replace('.', '').replace('-', '')
-        
-        # Use a free CPF validation API
-        # https://www.receitaws.com.br/v1/cpf/{cpf}
-        response = requests.get(
-            f"https://www.receitaws.com.br/v1/cpf/{cpf_clean}",
-            timeout=5
-        )
-        
-        # Check if response is successful
-        if response.status_code == 200:
-            data = response.json()
-            # API returns status 'ok' if CPF is valid
-            return data.get('status') == 'ok'
-        else:
-            # If API is unavailable, allow registration (graceful degradation)
-            # In production, you might want different behavior
-            return True
-            
+        response = get_session().get(url, timeout=settings.CPF_API_TIMEOUT)
     except requests.RequestException:
-        # If external API is down, allow registration (graceful degradation)
-        return True
-    except Exception:
-        # Any other error, allow registration
-        return True
+        breaker.record_failure()
+        return None
 
+    if response.status_code != 200:
+        # Server-side trouble counts against the breaker; any other reply means
+        # the API is up. Either way there is no verdict, but the outcome must
+        # be recorded so a half-open trial does not stay in flight.
+        if response.status_code >= 500 or response.status_code == 429:
+            breaker.record_failure()
+        else:
+            breaker.record_success()
+        return None
+    try:
+        data = response.json()
+    except ValueError:
+        breaker.record_failure()
+        return None
+    breaker.record_success()
+    # API returns status 'ok' if CPF is valid
+    return data.get('status') == 'ok'
 
-def validate_cpf_format(cpf: str) -> bool:
+
+def external_verdict(cpf: str):
     """
-    Validate CPF format (must be XXX.XXX.XXX-XX).
-    Returns True if format is valid, False otherwise.
+    True/False verdict for a CPF from the local check digits, then the
+    (cached) external API; None if the API is unavailable.
+    """
+    if not validate_cpf_check_digits(cpf):
+        return False
+
+    cpf_clean = clean_cpf(cpf)
+    key = VERDICT_KEY.format(cpf_clean)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+
+    verdict = _query_remote(cpf_clean)
+    if verdict is None:
+        return None
+    timeout = settings.CPF_VALID_CACHE_SECONDS if verdict else settings.CPF_INVALID_CACHE_SECONDS
+    cache.set(key, verdict, timeout)
+    return verdict
+
+
+def validate_cpf_external(cpf: str) -> bool:
+    """
+    Validate CPF using the local check digits, then the external API.
+    CPF should be in format: XXX.XXX.XXX-XX
+
+    Returns False only for a definite negative. If the API is unavailable
+    (error, timeout or open breaker) registration is allowed (graceful
+    degradation) and nothing is cached.
     """
-    import re
-    pattern = r'^\d{3}\.\d{3}\.\d{3}-\d{2}$'
-    return bool(re.match(pattern, cpf))
+    return external_verdict(cpf) is not False
+
+
+def external_check_mode() -> str:
+    """'sync' (during registration), 'deferred' (after it) or 'off'."""
+    return settings.CPF_EXTERNAL_CHECK
+
+
+def verify_registered_cpf(user_id: int):
+    """
+    Deferred external check: deactivate the account if the service
+    definitively rejects its CPF. Returns the verdict (None while the
+    service is unavailable).
+    """
+    from django.contrib.auth.models import User
+
+    from posts.live import access_revoked
+    from .authentication import invalidate_auth
+
+    user = User.objects.select_related('profile').filter(pk=user_id).first()
+    if user is None or not hasattr(user, 'profile'):
+        return True
+    verdict = external_verdict(user.profile.cpf)
+    if verdict is False:
+        logger.warning('Deactivating user %s: CPF rejected by external validation', user_id)
+        User.objects.filter(pk=user_id).update(is_active=False)
+        invalidate_auth(user_id)
+        access_revoked(user_id)
+    return verdict
@@ -0,0 +1,65 @@
+import array
+import json
+import time
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.recommendations import FollowGraph, build_recommendations
+
+
+def synthetic_edges(users, edges, seed, block=100000):
+    """
+    About `edges` distinct follows among user ids 1..users, grouped by
+    follower: out-degrees around the mean, followed ids skewed towards a
+    few popular accounts.
+    """
+    followers, followed = array.array('i'), array.array('i')
+    rng = np.random.default_rng(seed)
+    for first in range(1, users + 1, block):
+        count = min(block, users + 1 - first)
+        sources = np.repeat(np.arange(first, first + count, dtype=np.int64),
+                            rng.poisson(edges / users, size=count))
+        targets = (users * rng.random(len(sources), dtype=np.float32) ** 3).astype(np.int64) + 1
+        keys = np.unique(sources[sources != targets] * (users + 1) + targets[sources != targets])
+        followers.frombytes((keys // (users + 1)).astype(np.int32).tobytes())
+        followed.frombytes((keys % (users + 1)).astype(np.int32).tobytes())
+    return followers, followed
+
+
+class Command(BaseCommand):
+    help = ('Recompute "who to follow" suggestions (FollowSuggestion) from the follow graph and print '
+            'a JSON report of graph size, timings and peak memory. '
+            '--synthetic-users/--synthetic-edges score a generated graph instead, without writing, '
+            'to size a run.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=1, help='Scoring processes.')
+        parser.add_argument('--per-user', type=int, help='Suggestions kept per user.')
+        parser.add_argument('--max-fanout', type=int, help='Skip intermediates following more accounts.')
+        parser.add_argument('--chunk-paths', type=int, help='Friend-of-friend paths scored per chunk.')
+        parser.add_argument('--batch-size', type=int, default=100000, help='Follow rows read per query.')
+        parser.add_argument('--synthetic-users', type=int, help='Users of a generated graph.')
+        parser.add_argument('--synthetic-edges', type=int, help='Follows of a generated graph.')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if options['workers'] < 1:
+            raise CommandError('--workers must be at least 1.')
+        graph = None
+        if options['synthetic_users'] or options['synthetic_edges']:
+            if not (options['synthetic_users'] and options['synthetic_edges']):
+                raise CommandError('Give both --synthetic-users and --synthetic-edges.')
+            started = time.perf_counter()
+            graph = FollowGraph.from_edges(*synthetic_edges(
+                options['synthetic_users'], options['synthetic_edges'], options['seed'],
+            ))
+            generated = round(time.perf_counter() - started, 2)
+        report = build_recommendations(
+            graph=graph, workers=options['workers'], per_user=options['per_user'],
+            max_fanout=options['max_fanout'], chunk_paths=options['chunk_paths'],
+            write=graph is None, batch_size=options['batch_size'],
+        )
+        if graph is not None:
+            report['seconds']['generate'] = generated
+        self.stdout.write(json.dumps(report, indent=2))
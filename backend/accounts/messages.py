@@ -6,9 +6,12 @@ EMAIL_EXISTS = "Email já registrado"
 EMAIL_INVALID = "Email inválido"
 CPF_EXISTS = "CPF já registrado"
 CPF_INVALID = "CPF deve estar no formato: 123.456.789-00"
+CPF_INVALID_CHECK_DIGITS = "CPF inválido (dígitos verificadores não conferem)"
 CPF_INVALID_EXTERNAL = "CPF inválido (não encontrado na base de dados)"
 PASSWORD_MISMATCH = "As senhas não coincidem"
 PASSWORD_WEAK = "A senha deve conter pelo menos 8 caracteres, incluindo letras maiúsculas, minúsculas e números."
 REGISTER_ERROR_GENERIC = "Erro ao registrar usuário. Tente novamente mais tarde."
 INVALID_CREDENTIALS = "Credenciais inválidas"
 LOGIN_REQUIRED = "Nome de usuário e senha são obrigatórios"
+PICTURE_TOO_LARGE = "A imagem não pode ter mais de 5MB"
+PICTURE_INVALID_TYPE = "Apenas imagens JPEG, PNG, GIF e WebP são permitidas"
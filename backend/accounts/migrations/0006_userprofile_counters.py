@@ -0,0 +1,56 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:49
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def _count_of(model, fk):
+    return Coalesce(Subquery(
+        model.objects.filter(**{fk: OuterRef('user_id')})
+        .values(fk).annotate(total=Count('id')).values('total')
+    ), 0)
+
+
+def backfill_counters(apps, schema_editor):
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    Follow = apps.get_model('accounts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    UserProfile.objects.update(
+        followers_count=_count_of(Follow, 'followed'),
+        following_count=_count_of(Follow, 'follower'),
+        posts_count=_count_of(Post, 'author'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_remove_follow_accounts_fo_followe_6d6ab4_idx_and_more'),
+        ('posts', '0007_post_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='following_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='posts_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['-followers_count'], name='accounts_us_followe_976555_idx'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# Case-insensitive prefix index on auth_user.username for autocomplete.
+# auth.User is not ours to add Meta.indexes to, hence raw SQL per vendor:
+# PostgreSQL needs text_pattern_ops for left-anchored LIKE on lower(username);
+# SQLite uses a plain expression index, queried as a range.
+
+STATEMENTS = {
+    'postgresql': (
+        'CREATE INDEX IF NOT EXISTS accounts_username_lower_idx '
+        'ON auth_user (lower(username) text_pattern_ops)'
+    ),
+    'sqlite': 'CREATE INDEX IF NOT EXISTS accounts_username_lower_idx ON auth_user (lower(username))',
+}
+
+
+def create_index(apps, schema_editor):
+    sql = STATEMENTS.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor in STATEMENTS:
+        schema_editor.execute('DROP INDEX IF EXISTS accounts_username_lower_idx')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('accounts', '0006_userprofile_counters'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_index, drop_index),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.9 on 2026-10-18 06:19
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_existing_follows(apps, schema_editor):
+    """Existing follows already have their timeline rows (posts 0006 and the follow views)."""
+    Follow = apps.get_model('accounts', 'Follow')
+    Follow.objects.update(timeline_backfilled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_follow_suggestion'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='timeline_backfilled',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(mark_existing_follows, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='follow',
+            index=models.Index(condition=models.Q(('timeline_backfilled', False)), fields=['follower'], name='follow_pending_backfill_idx'),
+        ),
+    ]
@@ -1,9 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.core.validators import RegexValidator
-from django.db.models.signals import pre_delete, pre_save
+from django.db.models.signals import post_delete, post_init, post_save
 from django.dispatch import receiver
 
+from .authentication import invalidate_auth
+from .avatars import asset_names, delete_assets_later
+
 
 class UserProfile(models.Model):
     """Extended user profile with CPF and profile picture."""
@@ -24,11 +27,24 @@ class UserProfile(models.Model):
         null=True,
         blank=True
     )
+    # Square WebP renditions of profile_picture, {"<size>": storage name}
+    profile_picture_variants = models.JSONField(default=dict, blank=True)
+    # Staging token of an upload still being processed (see accounts.avatars)
+    profile_picture_pending = models.CharField(max_length=64, blank=True, default='')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Denormalized counters, maintained with F() updates by the write views
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    posts_count = models.PositiveIntegerField(default=0)
+    # Stamped into JWTs; bumping it revokes every token issued before (see accounts.authentication)
+    token_version = models.PositiveIntegerField(default=0)
 
     class Meta:
         verbose_name = 'User Profile'
         verbose_name_plural = 'User Profiles'
+        indexes = [
+            models.Index(fields=['-followers_count']),
+        ]
 
     def __str__(self):
         return f"{self.user.username}"
@@ -47,37 +63,85 @@ class Follow(models.Model):
         related_name='followers'
     )
     created_at = models.DateTimeField(auto_now_add=True)
+    # Set once the followed user's recent posts were copied into the
+    # follower's materialized timeline (see posts/timeline.py)
+    timeline_backfilled = models.BooleanField(default=False)
 
     class Meta:
         unique_together = ('follower', 'followed')
         indexes = [
             models.Index(fields=['follower', '-created_at']),
-            models.Index(fields=['followed']),
+            models.Index(fields=['followed', '-created_at']),
+            models.Index(
+                fields=['follower'], name='follow_pending_backfill_idx',
+                condition=models.Q(timeline_backfilled=False),
+            ),
         ]
 
     def __str__(self):
         return f"{self.follower.username} → {self.followed.username}"
 
 
-# Signal to delete old profile picture from Cloudinary when updating
-@receiver(pre_save, sender=UserProfile)
-def delete_old_profile_picture_on_update(sender, instance, **kwargs):
-    """Delete old profile picture from Cloudinary when updating to a new one."""
-    if not instance.pk:
-        return  # New instance, no old picture to delete
+class FollowSuggestion(models.Model):
+    """
+    Precomputed "who to follow" entry: `suggested` is followed by
+    `mutual_count` of the accounts `user` follows. Rebuilt offline by
+    `manage.py build_recommendations` (see accounts.recommendations).
+    """
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follow_suggestions')
+    suggested = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    # Adamic-Adar score; `rank` 0 is the best suggestion
+    score = models.FloatField()
+    mutual_count = models.PositiveIntegerField()
+    rank = models.PositiveSmallIntegerField()
+    computed_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'suggested')
+        indexes = [
+            models.Index(fields=['user', 'rank']),
+        ]
 
-    try:
-        old_profile = UserProfile.objects.get(pk=instance.pk)
-        if old_profile.profile_picture and old_profile.profile_picture != instance.profile_picture:
-            # Delete the old file from Cloudinary
-            old_profile.profile_picture.delete(save=False)
-    except UserProfile.DoesNotExist:
-        pass  # Profile doesn't exist yet
+    def __str__(self):
+        return f"{self.user_id} ⇢ {self.suggested_id} ({self.score:.2f})"
 
 
-# Signal to delete profile picture from Cloudinary when profile is deleted
-@receiver(pre_delete, sender=UserProfile)
+# Stored assets are tracked from the moment an instance is loaded, so a
+# save can tell what it replaced without reading the old row back.
+@receiver(post_init, sender=UserProfile)
+def remember_profile_picture(sender, instance, **kwargs):
+    instance._stored_assets = asset_names(instance)
+
+
+@receiver(post_save, sender=UserProfile)
+def delete_replaced_profile_picture(sender, instance, created, **kwargs):
+    """Delete the previous picture and variants from storage after commit, in the background."""
+    previous, current = instance._stored_assets, asset_names(instance)
+    if previous is not None and current is not None and previous - current:
+        if instance.profile_picture_variants and not set(instance.profile_picture_variants.values()) - previous:
+            # Picture replaced outside the pipeline (e.g. in the admin): its variants are stale
+            sender.objects.filter(pk=instance.pk).update(profile_picture_variants={})
+            instance.profile_picture_variants = {}
+            current = asset_names(instance)
+        delete_assets_later(previous - current)
+    instance._stored_assets = current
+
+
+@receiver(post_delete, sender=UserProfile)
 def delete_profile_picture_on_profile_delete(sender, instance, **kwargs):
-    """Delete profile picture from Cloudinary when UserProfile is deleted."""
-    if instance.profile_picture:
-        instance.profile_picture.delete(save=False)
\ No newline at end of file
+    """Delete the picture and its variants from storage once the profile is gone."""
+    delete_assets_later(asset_names(instance) or ())
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    """
+    Drop the user from the authentication cache whenever the row changes,
+    and end the live streams of a deactivated or deleted account.
+    """
+    from posts.live import access_revoked
+
+    invalidate_auth(instance.pk)
+    if kwargs['signal'] is post_delete or not instance.is_active:
+        access_revoked(instance.pk)
@@ -0,0 +1,8 @@
+from backend.pagination import KeysetPagination
+
+
+class FollowCursorPagination(KeysetPagination):
+    """Most recent follows first, keyed on (Follow.created_at, Follow.id)."""
+    ordering = ('-created_at', '-id')
+    page_size = 50
+    max_page_size = 200
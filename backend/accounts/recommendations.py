@@ -0,0 +1,328 @@
+"""
+"Who to follow" suggestions from the follow graph, computed offline.
+
+`build_recommendations` (the build_recommendations command) loads every
+Follow edge into a FollowGraph: users renumbered densely by id, and each
+user's followed accounts stored contiguously (CSR: `indptr` row offsets
+into one `indices` array), 4 bytes per edge. Candidates for a user u are
+the accounts followed by the accounts u follows (friends of friends), not
+u itself and not already followed. Each path u -> v -> w adds
+1 / log(degree(v)) to w's Adamic-Adar score, so a path through a small
+circle counts more than one through a celebrity; intermediates following
+more than RECOMMENDATIONS_MAX_FANOUT accounts are skipped, which bounds
+the work per user.
+
+Users are scored with numpy, a whole chunk of about
+RECOMMENDATIONS_CHUNK_PATHS paths at once, by `workers` processes sharing
+the graph. The parent process replaces each chunk's FollowSuggestion rows
+(the top RECOMMENDATIONS_PER_USER per user) in one transaction as results
+come in, so readers see either the old or the new suggestions of a user.
+
+`suggestions_for` serves them, leaving out accounts the user followed
+since the build; users without any (new accounts, no follows yet) get the
+most-followed accounts instead.
+"""
+import array
+import multiprocessing
+import resource
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import Follow, FollowSuggestion, UserProfile
+
+DEFAULT_LIMIT = 10
+
+
+def suggestions_for(user, limit=DEFAULT_LIMIT):
+    """
+    Up to `limit` FollowSuggestions for `user`, best first, with the
+    suggested users' profiles joined. The popular-accounts fallback is
+    returned as unsaved FollowSuggestions with no mutual follows.
+    """
+    suggestions = list(
+        FollowSuggestion.objects.filter(user=user)
+        .exclude(suggested__followers__follower=user)
+        .select_related('suggested__profile')
+        .order_by('rank')[:limit]
+    )
+    if suggestions:
+        return suggestions
+    popular = (
+        UserProfile.objects.exclude(user=user)
+        .exclude(user__followers__follower=user)
+        .select_related('user')
+        .order_by('-followers_count', 'user_id')[:limit]
+    )
+    return [
+        FollowSuggestion(user=user, suggested=profile.user, score=0.0, mutual_count=0, rank=rank)
+        for rank, profile in enumerate(popular)
+    ]
+
+
+class FollowGraph:
+    """
+    Follow edges over dense user indexes. `ids[i]` is the user id of index
+    i; the accounts i follows are indices[indptr[i]:indptr[i + 1]], and
+    `degree[i]` counts its followers plus followed accounts.
+    """
+
+    def __init__(self, ids, indptr, indices, degree):
+        self.ids = ids
+        self.indptr = indptr
+        self.indices = indices
+        self.degree = degree
+
+    @classmethod
+    def from_edges(cls, followers, followed):
+        """
+        Graph of the edges followers[k] -> followed[k] (array('i') of user
+        ids), cheapest when they come sorted by follower.
+        """
+        followers = np.frombuffer(followers, dtype=np.int32)
+        followed = np.frombuffer(followed, dtype=np.int32)
+        if not len(followers):
+            return cls(np.zeros(0, np.int32), np.zeros(1, np.int64), np.zeros(0, np.int32), np.zeros(0, np.int32))
+        # Dense indexes from a bitmap over user ids: no sort, O(max id)
+        present = np.zeros(int(max(followers.max(), followed.max())) + 1, dtype=bool)
+        present[followers] = True
+        present[followed] = True
+        ids = np.flatnonzero(present).astype(np.int32)
+        index = np.cumsum(present, dtype=np.int32) - 1
+        del present
+        sources, indices = index[followers], index[followed]
+        del index
+        if len(sources) > 1 and (sources[1:] < sources[:-1]).any():
+            order = np.argsort(sources, kind='stable')
+            sources, indices = sources[order], indices[order]
+            del order
+        out_degree = np.bincount(sources, minlength=len(ids))
+        del sources
+        indptr = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(out_degree, out=indptr[1:])
+        degree = (out_degree + np.bincount(indices, minlength=len(ids))).astype(np.int32)
+        return cls(ids, indptr, indices, degree)
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def edge_count(self):
+        return len(self.indices)
+
+    @property
+    def nbytes(self):
+        return sum(part.nbytes for part in (self.ids, self.indptr, self.indices, self.degree))
+
+    def chunks(self, max_fanout, budget):
+        """
+        [(first, end)] node ranges covering the graph, each with about
+        `budget` friend-of-friend paths to walk.
+        """
+        out_degree = np.diff(self.indptr)
+        # Paths through each edge u -> v: the accounts v follows, if walked
+        per_edge = out_degree[self.indices]
+        per_edge[per_edge > max_fanout] = 0
+        cumulative = np.zeros(self.edge_count + 1, dtype=np.int64)
+        np.cumsum(per_edge, out=cumulative[1:])
+        work = cumulative[self.indptr]
+        bounds = np.searchsorted(work, np.arange(budget, work[-1], budget), side='right')
+        bounds = [0] + sorted(set(bounds.tolist()) - {0, len(self)}) + [len(self)]
+        return [(first, end) for first, end in zip(bounds, bounds[1:]) if end > first]
+
+
+def load_graph(batch_size=100000):
+    """
+    FollowGraph of every Follow row, read in batches along the (follower,
+    followed) unique index so the edges arrive grouped by follower.
+    """
+    followers, followed = array.array('i'), array.array('i')
+    edges = Follow.objects.order_by('follower_id', 'followed_id').values_list('follower_id', 'followed_id')
+    rows = list(edges[:batch_size])
+    while rows:
+        for follower, target in rows:
+            followers.append(follower)
+            followed.append(target)
+        last_follower, last_followed = rows[-1]
+        rows = list(edges.filter(
+            Q(follower_id__gt=last_follower) | Q(follower_id=last_follower, followed_id__gt=last_followed)
+        )[:batch_size])
+    return FollowGraph.from_edges(followers, followed)
+
+
+def score_chunk(graph, first, end, per_user, max_fanout):
+    """
+    Suggestions for nodes first..end-1 as parallel sequences (users,
+    candidates, scores, mutual counts) of node indexes, each user's best
+    first, at most `per_user` each.
+    """
+    if end <= first:
+        return [], [], [], []
+    indptr, indices, n = graph.indptr, graph.indices, len(graph)
+    # First hop: every edge u -> v of the chunk's users (rows are contiguous)
+    users = np.repeat(np.arange(first, end, dtype=np.int64), np.diff(indptr[first:end + 1]))
+    middle = indices[indptr[first]:indptr[end]].astype(np.int64)
+    followed = users * n + middle
+
+    fanout = indptr[middle + 1] - indptr[middle]
+    walk = fanout <= max_fanout
+    users, middle, fanout = users[walk], middle[walk], fanout[walk]
+    weight = 1.0 / np.log(np.maximum(graph.degree[middle], 2))
+
+    # Second hop: v -> w for each walked v, as one gather from `indices`
+    total = int(fanout.sum())
+    starts = np.repeat(indptr[middle] - (np.cumsum(fanout) - fanout), fanout)
+    candidates = indices[starts + np.arange(total)].astype(np.int64)
+    users = np.repeat(users, fanout)
+    weight = np.repeat(weight, fanout)
+
+    pairs, inverse = np.unique(users * n + candidates, return_inverse=True)
+    scores = np.bincount(inverse, weights=weight, minlength=len(pairs))
+    mutual = np.bincount(inverse, minlength=len(pairs))
+
+    # Drop u itself and the accounts u follows: look their keys up in the
+    # sorted pairs rather than testing every path
+    excluded = np.concatenate([followed, np.arange(first, end, dtype=np.int64) * (n + 1)])
+    found = np.searchsorted(pairs, excluded)
+    inside = found < len(pairs)
+    found = found[inside][pairs[found[inside]] == excluded[inside]]
+    keep = np.ones(len(pairs), dtype=bool)
+    keep[found] = False
+    pairs, scores, mutual = pairs[keep], scores[keep], mutual[keep]
+    if not len(pairs):
+        return [], [], [], []
+    users, candidates = pairs // n, pairs % n
+
+    # Users with more than `per_user` candidates keep those scoring at
+    # least their per_user-th best (ties included), found by partitioning
+    starts = np.flatnonzero(np.concatenate([[True], users[1:] != users[:-1]]))
+    stops = np.append(starts[1:], len(users))
+    keep = np.ones(len(users), dtype=bool)
+    for start, stop in zip(starts.tolist(), stops.tolist()):
+        if stop - start > per_user:
+            group = scores[start:stop]
+            keep[start:stop] = group >= -np.partition(-group, per_user - 1)[per_user - 1]
+    users, candidates, scores, mutual = users[keep], candidates[keep], scores[keep], mutual[keep]
+
+    # Best first within each user, then the first `per_user`
+    order = np.lexsort((candidates, -mutual, -scores, users))
+    users, candidates, scores, mutual = users[order], candidates[order], scores[order], mutual[order]
+    rank = np.arange(len(users)) - np.searchsorted(users, users, side='left')
+    top = rank < per_user
+    return users[top], candidates[top], scores[top], mutual[top]
+
+
+# Worker processes get the graph once, at start (inherited when forked)
+_worker = {}
+
+
+def _init_worker(graph, per_user, max_fanout):
+    _worker.update(graph=graph, per_user=per_user, max_fanout=max_fanout)
+
+
+def _score_in_worker(bounds):
+    first, end = bounds
+    return bounds, score_chunk(_worker['graph'], first, end, _worker['per_user'], _worker['max_fanout'])
+
+
+def _as_list(column):
+    return column.tolist() if hasattr(column, 'tolist') else column
+
+
+def write_suggestions(graph, first, end, scored, computed_at, batch_size=5000):
+    """
+    Replace the suggestions of every user id from ids[first] up to (not
+    including) ids[end] with `scored` (score_chunk's result); the first
+    and last chunk also cover the ids below and above the graph.
+    """
+    users, candidates, scores, mutual = (_as_list(column) for column in scored)
+    ids = graph.ids
+    rows, rank, previous = [], 0, None
+    for user, candidate, score, count in zip(users, candidates, scores, mutual):
+        rank = rank + 1 if user == previous else 0
+        previous = user
+        rows.append(FollowSuggestion(
+            user_id=int(ids[user]), suggested_id=int(ids[candidate]), score=score,
+            mutual_count=count, rank=rank, computed_at=computed_at,
+        ))
+    stale = FollowSuggestion.objects.all()
+    if first > 0:
+        stale = stale.filter(user_id__gte=int(ids[first]))
+    if end < len(graph):
+        stale = stale.filter(user_id__lt=int(ids[end]))
+    with transaction.atomic():
+        stale.delete()
+        FollowSuggestion.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def _peak_rss_mib(who):
+    # ru_maxrss is in KiB on Linux
+    return round(resource.getrusage(who).ru_maxrss / 1024, 1)
+
+
+def build_recommendations(graph=None, workers=1, per_user=None, max_fanout=None, chunk_paths=None,
+                          write=True, batch_size=100000):
+    """
+    Score every user of `graph` (default: the Follow table) and, with
+    `write`, replace the FollowSuggestion table. Returns a report of
+    sizes, timings and peak memory.
+    """
+    per_user = per_user or settings.RECOMMENDATIONS_PER_USER
+    max_fanout = max_fanout or settings.RECOMMENDATIONS_MAX_FANOUT
+    chunk_paths = chunk_paths or settings.RECOMMENDATIONS_CHUNK_PATHS
+    timings = {}
+
+    started = time.perf_counter()
+    if graph is None:
+        graph = load_graph(batch_size)
+        timings['load'] = round(time.perf_counter() - started, 2)
+    chunks = graph.chunks(max_fanout, chunk_paths)
+    computed_at = timezone.now()
+
+    started = time.perf_counter()
+    suggestions = scored_users = 0
+    write_seconds = 0.0
+
+    def collect(bounds, scored):
+        nonlocal suggestions, scored_users, write_seconds
+        suggestions += len(scored[0])
+        scored_users += len(set(_as_list(scored[0])))
+        if write:
+            write_started = time.perf_counter()
+            write_suggestions(graph, *bounds, scored, computed_at)
+            write_seconds += time.perf_counter() - write_started
+
+    pooled = workers > 1 and len(chunks) > 1
+    if pooled:
+        # The workers never use the database; only this process writes
+        with multiprocessing.Pool(workers, initializer=_init_worker,
+                                  initargs=(graph, per_user, max_fanout)) as pool:
+            for bounds, scored in pool.imap(_score_in_worker, chunks):
+                collect(bounds, scored)
+    else:
+        for first, end in chunks:
+            collect((first, end), score_chunk(graph, first, end, per_user, max_fanout))
+    if write and not chunks:
+        FollowSuggestion.objects.all().delete()
+    timings['score_and_write'] = round(time.perf_counter() - started, 2)
+    timings['write'] = round(write_seconds, 2)
+
+    return {
+        'workers': workers,
+        'users': len(graph),
+        'edges': graph.edge_count,
+        'graph_mib': round(graph.nbytes / 2 ** 20, 1),
+        'chunks': len(chunks),
+        'users_with_suggestions': scored_users,
+        'suggestions': suggestions,
+        'seconds': timings,
+        'peak_rss_mib': {
+            'main': _peak_rss_mib(resource.RUSAGE_SELF),
+            'largest_worker': _peak_rss_mib(resource.RUSAGE_CHILDREN) if pooled else None,
+        },
+    }
@@ -0,0 +1,164 @@
+"""
+Username prefix autocomplete, ranked by follower count.
+
+The database path filters lower(username) through the functional index
+from migration 0007 (LIKE 'prefix%' on PostgreSQL, a range on SQLite) and
+orders the matches by followers_count.
+
+In front of it each process keeps `hot_usernames`: the
+USERNAME_HOT_CACHE_SIZE most-followed users as a sorted array of
+lowercased names, so a prefix lookup is a bisect plus a top-k over the
+slice. Everyone outside the array has at most `threshold` followers, so a
+slice that alone fills the page is the answer; otherwise the database is
+asked. While the array holds every user it is authoritative, and it is
+kept current on register and username change. Follower counts in it are
+refreshed when it is reloaded (every USERNAME_HOT_CACHE_TTL seconds).
+"""
+import bisect
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.db import connection
+from django.db.models.functions import Lower
+
+from .models import UserProfile
+
+MAX_PREFIX_LENGTH = 150
+DEFAULT_LIMIT = 10
+MAX_LIMIT = 20
+# Slices at least this long get their top-k memoized (short prefixes)
+MEMO_MIN_SLICE = 1000
+
+
+def normalize_prefix(prefix):
+    return (prefix or '').strip().lower()[:MAX_PREFIX_LENGTH]
+
+
+def _prefix_successor(prefix):
+    """Smallest string sorting after every string that starts with `prefix`."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+def _database_lookup(prefix, limit):
+    queryset = UserProfile.objects.annotate(username_lower=Lower('user__username'))
+    if connection.vendor == 'postgresql':
+        queryset = queryset.filter(username_lower__startswith=prefix)
+    else:
+        queryset = queryset.filter(username_lower__gte=prefix, username_lower__lt=_prefix_successor(prefix))
+    return list(
+        queryset.order_by('-followers_count', 'username_lower').values_list('user_id', flat=True)[:limit]
+    )
+
+
+class HotUsernames:
+    """Sorted in-process array of the most-followed usernames."""
+
+    def __init__(self, size, ttl):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._keys = []      # lowercased usernames, sorted
+            self._entries = []   # (followers_count, user_id), parallel to _keys
+            self._memo = {}
+            self._loaded_at = None
+            self.full = False
+            self.threshold = 0
+
+    def reload(self):
+        rows = list(
+            UserProfile.objects.annotate(username_lower=Lower('user__username'))
+            .order_by('-followers_count', 'user_id')
+            .values_list('username_lower', 'followers_count', 'user_id')[:self.size]
+        )
+        full = len(rows) >= self.size
+        threshold = rows[-1][1] if full else 0
+        rows.sort()
+        with self._lock:
+            self._keys = [row[0] for row in rows]
+            self._entries = [(row[1], row[2]) for row in rows]
+            self._memo = {}
+            self.full = full
+            self.threshold = threshold
+            self._loaded_at = time.monotonic()
+
+    def _stale(self):
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+
+    def lookup(self, prefix, limit):
+        """Top `limit` user ids for `prefix`, or None if the database must be asked."""
+        if self.size <= 0:
+            return None
+        if self._stale():
+            self.reload()
+        with self._lock:
+            memo = self._memo.get(prefix)
+            if memo is not None and len(memo) >= limit:
+                return memo[:limit]
+            lo = bisect.bisect_left(self._keys, prefix)
+            hi = bisect.bisect_left(self._keys, _prefix_successor(prefix), lo)
+            if self.full and hi - lo < limit:
+                return None
+            best = heapq.nsmallest(
+                limit, range(lo, hi), key=lambda i: (-self._entries[i][0], self._keys[i]),
+            )
+            ids = [self._entries[i][1] for i in best]
+            if hi - lo >= MEMO_MIN_SLICE:
+                self._memo[prefix] = ids
+            return ids
+
+    def add(self, user_id, username):
+        """Track a newly registered user while every user still fits."""
+        with self._lock:
+            if self._loaded_at is None or self.full:
+                return
+            self._insert(username.lower(), (0, user_id))
+            if len(self._keys) >= self.size:
+                self.full = True
+                self.threshold = min(entry[0] for entry in self._entries)
+
+    def rename(self, user_id, old_username, new_username):
+        with self._lock:
+            key = old_username.lower()
+            i = bisect.bisect_left(self._keys, key)
+            while i < len(self._keys) and self._keys[i] == key:
+                if self._entries[i][1] == user_id:
+                    del self._keys[i]
+                    entry = self._entries.pop(i)
+                    self._forget(key)
+                    self._insert(new_username.lower(), entry)
+                    return
+                i += 1
+
+    def _insert(self, key, entry):
+        i = bisect.bisect_right(self._keys, key)
+        self._keys.insert(i, key)
+        self._entries.insert(i, entry)
+        self._forget(key)
+
+    def _forget(self, key):
+        for end in range(1, len(key) + 1):
+            self._memo.pop(key[:end], None)
+
+
+hot_usernames = HotUsernames(
+    size=settings.USERNAME_HOT_CACHE_SIZE,
+    ttl=settings.USERNAME_HOT_CACHE_TTL,
+)
+
+
+def search_usernames(prefix, limit=DEFAULT_LIMIT):
+    """Profiles (user joined) whose username starts with `prefix`, most-followed first."""
+    prefix = normalize_prefix(prefix)
+    if not prefix:
+        return []
+    ids = hot_usernames.lookup(prefix, limit)
+    if ids is None:
+        ids = _database_lookup(prefix, limit)
+    profiles = UserProfile.objects.select_related('user').in_bulk(ids, field_name='user_id')
+    return [profiles[user_id] for user_id in ids if user_id in profiles]
@@ -3,17 +3,26 @@ from django.contrib.auth.models import User
 from django.contrib.auth.password_validation import validate_password
 from django.core.exceptions import ValidationError as DjangoValidationError
 from rest_framework.validators import UniqueValidator
-from .models import UserProfile, Follow
+from .models import UserProfile, Follow, FollowSuggestion
 from . import messages
-from .cpf_validator import validate_cpf_external, validate_cpf_format
+from django.db import transaction
+from .avatars import MAX_PICTURE_SIZE, avatar_url, request_processing, sniff_image_type, stage_upload, variant_urls
+from jobs.queue import enqueue
+from .cpf_validator import (
+    external_check_mode,
+    validate_cpf_check_digits,
+    validate_cpf_external,
+)
 
 
 class UserProfileSerializer(serializers.ModelSerializer):
     profile_picture = serializers.SerializerMethodField()
+    profile_picture_variants = serializers.SerializerMethodField()
+    profile_picture_processing = serializers.SerializerMethodField()
 
     class Meta:
         model = UserProfile
-        fields = ['cpf', 'profile_picture', 'created_at']
+        fields = ['cpf', 'profile_picture', 'profile_picture_variants', 'profile_picture_processing', 'created_at']
 
     def get_profile_picture(self, obj):
         """Return URL for profile picture (Cloudinary or default)"""
@@ -23,6 +32,13 @@ class UserProfileSerializer(serializers.ModelSerializer):
         # Retorna None se não tiver foto (frontend usa default)
         return None
 
+    def get_profile_picture_variants(self, obj):
+        """Square renditions of the picture, {"<size>": URL}"""
+        return variant_urls(obj)
+
+    def get_profile_picture_processing(self, obj):
+        return bool(obj.profile_picture_pending)
+
 
 class UserSerializer(serializers.ModelSerializer):
     profile = UserProfileSerializer(read_only=True)
@@ -32,24 +48,114 @@ class UserSerializer(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'profile']
 
 
+class UserSearchResultSerializer(serializers.ModelSerializer):
+    """Autocomplete entry, rendered from a UserProfile with its user joined"""
+    id = serializers.IntegerField(source='user_id')
+    username = serializers.CharField(source='user.username')
+    profile_picture = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UserProfile
+        fields = ['id', 'username', 'profile_picture', 'followers_count']
+
+    def get_profile_picture(self, obj):
+        return avatar_url(obj)
+
+
+class FollowSuggestionSerializer(serializers.ModelSerializer):
+    """Who-to-follow entry, rendered from a FollowSuggestion with the suggested user's profile joined"""
+    id = serializers.IntegerField(source='suggested_id')
+    username = serializers.CharField(source='suggested.username')
+    profile_picture = serializers.SerializerMethodField()
+    followers_count = serializers.SerializerMethodField()
+
+    class Meta:
+        model = FollowSuggestion
+        fields = ['id', 'username', 'profile_picture', 'followers_count', 'mutual_count']
+
+    def _profile(self, obj):
+        try:
+            return obj.suggested.profile
+        except UserProfile.DoesNotExist:
+            return None
+
+    def get_profile_picture(self, obj):
+        profile = self._profile(obj)
+        return avatar_url(profile) if profile is not None else None
+
+    def get_followers_count(self, obj):
+        profile = self._profile(obj)
+        return profile.followers_count if profile is not None else 0
+
+
+class FollowEntrySerializer(serializers.ModelSerializer):
+    """
+    One row of a follower/following list, rendered from a Follow.
+    Context: `side` ('follower' or 'followed', the user to show) and
+    `following_ids` (ids among them the viewer follows, loaded in batch).
+    """
+    id = serializers.SerializerMethodField()
+    username = serializers.SerializerMethodField()
+    profile_picture = serializers.SerializerMethodField()
+    is_following = serializers.SerializerMethodField()
+    followed_at = serializers.DateTimeField(source='created_at')
+
+    class Meta:
+        model = Follow
+        fields = ['id', 'username', 'profile_picture', 'is_following', 'followed_at']
+
+    def _user(self, obj):
+        return getattr(obj, self.context['side'])
+
+    def get_id(self, obj):
+        return getattr(obj, f"{self.context['side']}_id")
+
+    def get_username(self, obj):
+        return self._user(obj).username
+
+    def get_profile_picture(self, obj):
+        try:
+            profile = self._user(obj).profile
+        except UserProfile.DoesNotExist:
+            return None
+        return avatar_url(profile)
+
+    def get_is_following(self, obj):
+        return self.get_id(obj) in self.context['following_ids']
+
+
 class UserDetailSerializer(serializers.ModelSerializer):
     """Extended user serializer with follow counts and follow status"""
     profile = UserProfileSerializer(read_only=True)
     followers_count = serializers.SerializerMethodField()
     following_count = serializers.SerializerMethodField()
+    posts_count = serializers.SerializerMethodField()
     is_following = serializers.SerializerMethodField()
 
     class Meta:
         model = User
-        fields = ['id', 'username', 'email', 'profile', 'followers_count', 'following_count', 'is_following']
+        fields = ['id', 'username', 'email', 'profile', 'followers_count', 'following_count', 'posts_count', 'is_following']
+
+    def _profile(self, obj):
+        try:
+            return obj.profile
+        except UserProfile.DoesNotExist:
+            return None
 
     def get_followers_count(self, obj):
-        """Count of users following this user"""
-        return obj.followers.count()
+        """Count of users following this user (denormalized on the profile)"""
+        profile = self._profile(obj)
+        return profile.followers_count if profile else obj.followers.count()
 
     def get_following_count(self, obj):
-        """Count of users this user is following"""
-        return obj.following.count()
+        """Count of users this user is following (denormalized on the profile)"""
+        profile = self._profile(obj)
+        return profile.following_count if profile else obj.following.count()
+
+    def get_posts_count(self, obj):
+        """Count of posts written by this user (denormalized on the profile)"""
+        profile = self._profile(obj)
+        return profile.posts_count if profile else obj.posts.count()
 
     def get_is_following(self, obj):
         """Check if current user follows this user"""
@@ -91,7 +197,8 @@ class RegisterSerializer(serializers.ModelSerializer):
         error_messages={'invalid': messages.CPF_INVALID},
         validators=[UniqueValidator(queryset=UserProfile.objects.all(), message=messages.CPF_EXISTS)]
     )
-    profile_picture = serializers.ImageField(
+    # Checked by magic bytes only; decoding happens in the avatar pipeline
+    profile_picture = serializers.FileField(
         required=False,
         allow_null=True
     )
@@ -111,24 +218,44 @@ class RegisterSerializer(serializers.ModelSerializer):
         except DjangoValidationError:
             raise serializers.ValidationError({"password": messages.PASSWORD_WEAK})
 
-        # CPF external validation
+        # CPF check digits (local, no network)
         cpf = attrs.get('cpf')
-        if cpf and not validate_cpf_external(cpf):
+        if cpf and not validate_cpf_check_digits(cpf):
+            raise serializers.ValidationError({"cpf": messages.CPF_INVALID_CHECK_DIGITS})
+
+        # CPF external validation (deferred mode runs it after the account exists)
+        if cpf and external_check_mode() == 'sync' and not validate_cpf_external(cpf):
             raise serializers.ValidationError({"cpf": messages.CPF_INVALID_EXTERNAL})
 
         return attrs
 
+    def validate_profile_picture(self, value):
+        if value is None:
+            return value
+        if value.size > MAX_PICTURE_SIZE:
+            raise serializers.ValidationError(messages.PICTURE_TOO_LARGE)
+        value.image_type = sniff_image_type(value)
+        if value.image_type is None:
+            raise serializers.ValidationError(messages.PICTURE_INVALID_TYPE)
+        return value
+
     def create(self, validated_data):
         cpf = validated_data.pop('cpf')
         profile_picture = validated_data.pop('profile_picture', None)
         validated_data.pop('password_confirm')
         
-        user = User.objects.create_user(**validated_data)
-        UserProfile.objects.create(
-            user=user,
-            cpf=cpf,
-            profile_picture=profile_picture
-        )
+        token = stage_upload(profile_picture, profile_picture.image_type) if profile_picture is not None else None
+        # Background jobs are queued in the same transaction as the account
+        with transaction.atomic():
+            user = User.objects.create_user(**validated_data)
+            profile = UserProfile.objects.create(
+                user=user,
+                cpf=cpf
+            )
+            if token is not None:
+                request_processing(profile, token)
+            if external_check_mode() == 'deferred':
+                enqueue('accounts.verify_cpf', {'user_id': user.pk}, key=f'cpf:{user.pk}')
         return user
 
 
@@ -0,0 +1,23 @@
+"""Background tasks of the accounts app, run by the job workers (see jobs.queue)."""
+from jobs.queue import Retry, task
+
+from . import avatars
+from .cpf_validator import verify_registered_cpf
+
+
+@task('accounts.process_profile_picture', on_failure=avatars.abandon_upload)
+def process_profile_picture(profile_id, token):
+    avatars.process_upload(profile_id, token)
+
+
+@task('accounts.delete_assets')
+def delete_assets(names):
+    failed = avatars.delete_assets(names)
+    if failed:
+        raise Retry(f'{len(failed)} of {len(names)} files not deleted')
+
+
+@task('accounts.verify_cpf')
+def verify_cpf(user_id):
+    if verify_registered_cpf(user_id) is None:
+        raise Retry('CPF service unavailable')
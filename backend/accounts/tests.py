@@ -1,3 +1,560 @@
-from django.test import TestCase
+import io
+import json
+import math
+import os
+import shutil
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
-# Create your tests here.
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import AsyncClient, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from jobs.models import Job
+from jobs.queue import claim, execute
+from . import authentication, avatars, cpf_validator
+from .authentication import tokens_for
+from .models import Follow, FollowSuggestion, UserProfile
+from .search import hot_usernames
+
+
+def make_user(username, cpf):
+    user = User.objects.create_user(username=username, password='pass12345')
+    UserProfile.objects.create(user=user, cpf=cpf)
+    return user
+
+
+class FollowCounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.alice = make_user('alice', '111.444.777-35')
+        self.bob = make_user('bob_user', '529.982.247-25')
+        self.client.force_authenticate(self.alice)
+
+    def counts(self, user):
+        data = self.client.get('/api/accounts/auth/profile/', {'username': user.username}).data
+        return data['followers_count'], data['following_count']
+
+    def test_follow_and_unfollow_update_both_profiles(self):
+        self.client.post('/api/accounts/auth/follow/', {'username': 'bob_user'})
+        self.client.post('/api/accounts/auth/follow/', {'username': 'bob_user'})
+        self.assertEqual(self.counts(self.bob), (1, 0))
+        self.assertEqual(self.counts(self.alice), (0, 1))
+
+        self.client.post('/api/accounts/auth/unfollow/', {'username': 'bob_user'})
+        self.client.post('/api/accounts/auth/unfollow/', {'username': 'bob_user'})
+        self.assertEqual(self.counts(self.bob), (0, 0))
+        self.assertEqual(self.counts(self.alice), (0, 0))
+
+    def test_profile_read_does_not_count_rows(self):
+        with self.assertNumQueries(2):  # user+profile, is_following
+            self.client.get('/api/accounts/auth/profile/', {'username': 'bob_user'})
+
+
+class ProfileCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.alice = make_user('alice', '111.444.777-35')
+        self.bob = make_user('bob_user', '529.982.247-25')
+
+    def profile(self, username, viewer=None):
+        client = APIClient()
+        if viewer is not None:
+            client.force_authenticate(viewer)
+        return client.get('/api/accounts/auth/profile/', {'username': username})
+
+    def test_second_read_only_checks_follow_state(self):
+        self.profile('bob_user', self.alice)
+        with self.assertNumQueries(1):
+            data = self.profile('bob_user', self.alice).data
+        self.assertEqual(data['username'], 'bob_user')
+        self.assertFalse(data['is_following'])
+        with self.assertNumQueries(0):
+            self.profile('bob_user')
+
+    def test_is_following_is_per_viewer(self):
+        self.client.force_authenticate(self.alice)
+        self.client.post('/api/accounts/auth/follow/', {'username': 'bob_user'})
+        self.assertTrue(self.profile('bob_user', self.alice).data['is_following'])
+        self.assertFalse(self.profile('bob_user', self.bob).data['is_following'])
+        self.assertFalse(self.profile('bob_user').data['is_following'])
+
+    def test_follow_invalidates_counts(self):
+        self.assertEqual(self.profile('bob_user').data['followers_count'], 0)
+        self.client.force_authenticate(self.alice)
+        self.client.post('/api/accounts/auth/follow/', {'username': 'bob_user'})
+        self.assertEqual(self.profile('bob_user').data['followers_count'], 1)
+        self.client.force_authenticate(User.objects.get(pk=self.alice.pk))
+        self.assertEqual(self.client.get('/api/accounts/auth/me/').data['following_count'], 1)
+
+    def test_username_change_invalidates_old_name(self):
+        self.profile('bob_user')
+        self.client.force_authenticate(self.bob)
+        self.client.post('/api/accounts/auth/update-username/', {'username': 'robert'})
+        self.assertEqual(self.profile('bob_user').status_code, 404)
+        self.assertEqual(self.profile('robert').data['id'], self.bob.id)
+
+    def test_stats_are_admin_only(self):
+        self.profile('bob_user')
+        self.profile('bob_user')
+        self.client.force_authenticate(self.alice)
+        self.assertEqual(self.client.get('/api/accounts/auth/cache-stats/').status_code, 403)
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pass12345')
+        self.client.force_authenticate(admin)
+        stats = self.client.get('/api/accounts/auth/cache-stats/').data['profile']
+        self.assertGreaterEqual(stats['hits'], 1)
+
+    def test_profile_revalidation(self):
+        first = self.profile('bob_user', self.alice)
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        url = '/api/accounts/auth/profile/?username=bob_user'
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        client.post('/api/accounts/auth/follow/', {'username': 'bob_user'})
+        self.assertEqual(client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+
+
+class StubCPFHandler(BaseHTTPRequestHandler):
+    """Answers like the CPF API: 'ok' for CPFs in `valid`, else 'ERROR'."""
+    valid = set()
+    status = 200
+    calls = 0
+
+    def do_GET(self):
+        type(self).calls += 1
+        cpf = self.path.rstrip('/').rsplit('/', 1)[-1]
+        body = json.dumps({'status': 'ok' if cpf in self.valid else 'ERROR'}).encode()
+        self.send_response(self.status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class CPFValidationTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), StubCPFHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.api_url = f'http://127.0.0.1:{cls.server.server_port}/v1/cpf/{{cpf}}'
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        cpf_validator.breaker.reset()
+        StubCPFHandler.valid = {'11144477735'}
+        StubCPFHandler.status = 200
+        StubCPFHandler.calls = 0
+        self.settings_override = override_settings(CPF_API_URL=self.api_url, CPF_API_TIMEOUT=1)
+        self.settings_override.enable()
+        self.addCleanup(self.settings_override.disable)
+
+    def test_check_digits(self):
+        self.assertTrue(cpf_validator.validate_cpf_check_digits('111.444.777-35'))
+        self.assertFalse(cpf_validator.validate_cpf_check_digits('111.444.777-36'))
+        self.assertFalse(cpf_validator.validate_cpf_check_digits('111.111.111-11'))
+
+    def test_bad_check_digits_never_reach_the_api(self):
+        self.assertFalse(cpf_validator.validate_cpf_external('123.456.789-00'))
+        self.assertEqual(StubCPFHandler.calls, 0)
+
+    def test_verdicts_are_cached(self):
+        self.assertTrue(cpf_validator.validate_cpf_external('111.444.777-35'))
+        self.assertFalse(cpf_validator.validate_cpf_external('529.982.247-25'))
+        self.assertTrue(cpf_validator.validate_cpf_external('111.444.777-35'))
+        self.assertFalse(cpf_validator.validate_cpf_external('529.982.247-25'))
+        self.assertEqual(StubCPFHandler.calls, 2)
+
+    def test_breaker_opens_after_repeated_failures(self):
+        StubCPFHandler.status = 503
+        for _ in range(cpf_validator.breaker.failure_threshold):
+            self.assertTrue(cpf_validator.validate_cpf_external('529.982.247-25'))
+        self.assertEqual(cpf_validator.breaker.state, 'open')
+        calls = StubCPFHandler.calls
+        self.assertTrue(cpf_validator.validate_cpf_external('529.982.247-25'))
+        self.assertEqual(StubCPFHandler.calls, calls)
+
+    def test_half_open_trial_answered_with_client_error_closes_the_breaker(self):
+        StubCPFHandler.status = 503
+        for _ in range(cpf_validator.breaker.failure_threshold):
+            cpf_validator.validate_cpf_external('529.982.247-25')
+        cpf_validator.breaker.opened_at -= cpf_validator.breaker.reset_timeout
+        StubCPFHandler.status = 404
+        self.assertTrue(cpf_validator.validate_cpf_external('529.982.247-25'))
+        self.assertEqual(cpf_validator.breaker.state, 'closed')
+
+    def test_register_rejects_cpf_refused_by_api(self):
+        response = APIClient().post('/api/accounts/auth/register/', {
+            'username': 'newuser', 'email': 'new@example.com', 'cpf': '529.982.247-25',
+            'password': 'Str0ngPassw0rd', 'password_confirm': 'Str0ngPassw0rd',
+        })
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cpf', response.data)
+
+    @override_settings(CPF_EXTERNAL_CHECK='deferred')
+    def test_deferred_check_deactivates_rejected_account(self):
+        response = APIClient().post('/api/accounts/auth/register/', {
+            'username': 'newuser', 'email': 'new@example.com', 'cpf': '529.982.247-25',
+            'password': 'Str0ngPassw0rd', 'password_confirm': 'Str0ngPassw0rd',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(StubCPFHandler.calls, 0)
+        [job] = claim('test-worker')
+        self.assertEqual((job.name, job.kwargs), ('accounts.verify_cpf', {'user_id': response.data['user']['id']}))
+        self.assertEqual(execute(job), Job.DONE)
+        self.assertFalse(User.objects.get(username='newuser').is_active)
+
+
+class CachedAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = make_user('alice', '111.444.777-35')
+        self.client = APIClient()
+
+    def login(self):
+        self.tokens = self.client.post('/api/accounts/auth/login/', {'username': 'alice', 'password': 'pass12345'}).data
+        return self.tokens['access']
+
+    def me(self, access):
+        return APIClient().get('/api/accounts/auth/me/', HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_repeat_requests_skip_the_user_query(self):
+        access = self.login()
+        self.assertEqual(self.me(access).status_code, 200)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.me(access).data['username'], 'alice')
+
+    def test_password_change_revokes_old_tokens(self):
+        access = self.login()
+        self.me(access)
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+        data = client.post('/api/accounts/auth/update-email-password/',
+                           {'current_password': 'pass12345', 'new_password': 'newpass123'}).data
+        self.assertEqual(self.me(access).status_code, 401)
+        self.assertEqual(self.me(data['access']).status_code, 200)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': data['refresh']}).status_code, 200)
+        self.assertEqual(self.client.post('/api/token/refresh/', {'refresh': self.tokens['refresh']}).status_code, 401)
+
+    def test_deactivation_is_seen_immediately(self):
+        access = self.login()
+        self.me(access)
+        self.alice.is_active = False
+        self.alice.save()
+        self.assertEqual(self.me(access).status_code, 401)
+
+    def test_fill_racing_an_invalidation_is_dropped(self):
+        pack = authentication._pack
+
+        def pack_then_deactivate(user):
+            # The deactivation commits between the fill's read and its cache set
+            User.objects.filter(pk=user.pk).update(is_active=False)
+            authentication.invalidate_auth(user.pk)
+            return pack(user)
+
+        with mock.patch.object(authentication, '_pack', pack_then_deactivate):
+            self.assertTrue(authentication.cached_user(self.alice.pk)[1].is_active)
+        self.assertIsNone(cache.get(authentication.AUTH_KEY.format(self.alice.pk)))
+        self.assertFalse(authentication.cached_user(self.alice.pk)[1].is_active)
+
+
+class RelationshipBatchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.me = make_user('me_user', '111.444.777-35')
+        self.others = [make_user(f'other{i}', f'{cpf}') for i, cpf in
+                       enumerate(['529.982.247-25', '453.178.287-91', '935.411.347-80'])]
+        self.client.force_authenticate(self.me)
+
+    def test_relationships_use_constant_queries(self):
+        Follow.objects.create(follower=self.me, followed=self.others[0])
+        Follow.objects.create(follower=self.others[1], followed=self.me)
+        with self.assertNumQueries(3):  # resolve users, following, followed_by
+            response = self.client.post('/api/accounts/auth/relationships/', {
+                'usernames': ['other0', 'other1', 'other2', 'ghost'],
+            }, format='json')
+        flags = {r['username']: (r['following'], r['followed_by']) for r in response.data['relationships']}
+        self.assertEqual(flags, {
+            'other0': (True, False), 'other1': (False, True), 'other2': (False, False),
+        })
+        self.assertEqual(response.data['not_found'], ['ghost'])
+
+    def test_batch_limit(self):
+        response = self.client.post('/api/accounts/auth/relationships/', {
+            'ids': list(range(1000)),
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_bulk_follow_and_unfollow_keep_counters(self):
+        Follow.objects.create(follower=self.me, followed=self.others[0])
+        UserProfile.objects.filter(user=self.me).update(following_count=1)
+        UserProfile.objects.filter(user=self.others[0]).update(followers_count=1)
+
+        response = self.client.post('/api/accounts/auth/bulk-follow/', {
+            'usernames': ['other0', 'other1', 'other2', 'me_user'],
+        }, format='json')
+        self.assertEqual(sorted(response.data['followed']), ['other1', 'other2'])
+        self.assertEqual(response.data['already_following'], ['other0'])
+        self.assertEqual(UserProfile.objects.get(user=self.me).following_count, 3)
+        self.assertEqual(UserProfile.objects.get(user=self.others[2]).followers_count, 1)
+
+        response = self.client.post('/api/accounts/auth/bulk-unfollow/', {
+            'ids': [self.others[0].id, self.others[1].id],
+        }, format='json')
+        self.assertEqual(sorted(response.data['unfollowed']), ['other0', 'other1'])
+        self.assertEqual(UserProfile.objects.get(user=self.me).following_count, 1)
+        self.assertEqual(UserProfile.objects.get(user=self.others[0]).followers_count, 0)
+        self.assertEqual(Follow.objects.filter(follower=self.me).count(), 1)
+
+    def test_every_follow_write_locks_the_follower_first(self):
+        with mock.patch('accounts.views.lock_follower') as lock:
+            self.client.post('/api/accounts/auth/follow/', {'username': 'other0'})
+            self.client.post('/api/accounts/auth/unfollow/', {'username': 'other0'})
+            self.client.post('/api/accounts/auth/bulk-follow/', {'ids': [self.others[1].id]}, format='json')
+            self.client.post('/api/accounts/auth/bulk-unfollow/', {'ids': [self.others[1].id]}, format='json')
+        self.assertEqual([call.args[0].pk for call in lock.call_args_list], [self.me.pk] * 4)
+
+
+class FollowListTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.me = make_user('me_user', '111.444.777-35')
+        self.star = make_user('star', '529.982.247-25')
+        self.fans = [make_user(f'fan{i}', f'000.000.{i:03d}-00') for i in range(7)]
+        for fan in self.fans:
+            Follow.objects.create(follower=fan, followed=self.star)
+        Follow.objects.create(follower=self.me, followed=self.fans[2])
+        self.client.force_authenticate(self.me)
+
+    def test_followers_walk_newest_first_with_follow_state(self):
+        url = '/api/accounts/auth/user-followers/?username=star&page_size=3'
+        seen = []
+        while url:
+            with self.assertNumQueries(3):  # target user, page with profiles, viewer follow state
+                response = self.client.get(url)
+            seen += response.data['results']
+            url = response.data['next']
+        self.assertEqual([row['username'] for row in seen], [f'fan{i}' for i in reversed(range(7))])
+        self.assertEqual([row['username'] for row in seen if row['is_following']], ['fan2'])
+        self.assertEqual(set(seen[0]), {'id', 'username', 'profile_picture', 'is_following', 'followed_at'})
+
+    def test_own_following_list(self):
+        response = self.client.get('/api/accounts/auth/following/')
+        self.assertEqual([(r['username'], r['is_following']) for r in response.data['results']], [('fan2', True)])
+        self.assertIsNone(response.data['next'])
+
+    def test_async_endpoints_match(self):
+        headers = {'Authorization': f"Bearer {tokens_for(self.me)['access']}"}
+        for path in ['user-followers/?username=star&page_size=3', 'user-following/?username=fan2',
+                     'following/', 'profile/?username=star', 'profile/?username=nobody']:
+            expected = self.client.get(f'/api/accounts/auth/{path}')
+            response = async_to_sync(AsyncClient().get)(f'/api/async/accounts/auth/{path}', headers=headers)
+            self.assertEqual(response.status_code, expected.status_code, path)
+            # Pagination links point back at the async endpoints
+            self.assertEqual(json.loads(response.content.replace(b'/api/async/', b'/api/')),
+                             json.loads(expected.content), path)
+
+
+class UsernameSearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        hot_usernames.reset()
+        self.addCleanup(setattr, hot_usernames, 'size', hot_usernames.size)
+        self.client = APIClient()
+        self.users = {}
+        for (name, followers), cpf in zip(
+            [('Ana_b', 5), ('anakin', 9), ('andre', 1), ('bruno', 50)],
+            ['111.444.777-35', '529.982.247-25', '453.178.287-91', '935.411.347-80'],
+        ):
+            self.users[name] = make_user(name, cpf)
+            UserProfile.objects.filter(user=self.users[name]).update(followers_count=followers)
+
+    def search(self, prefix, **params):
+        response = self.client.get('/api/accounts/auth/search/', {'prefix': prefix, **params})
+        self.assertEqual(response.status_code, 200)
+        return [row['username'] for row in response.data['results']]
+
+    def test_prefix_is_case_insensitive_and_ranked_by_followers(self):
+        self.assertEqual(self.search('AN'), ['anakin', 'Ana_b', 'andre'])
+        self.assertEqual(self.search('ana', limit=1), ['anakin'])
+        self.assertEqual(self.search('z'), [])
+
+    def test_database_path_matches_hot_cache(self):
+        cached = self.search('an')
+        hot_usernames.size = 0
+        self.assertEqual(self.search('an'), cached)
+
+    def test_full_hot_cache_falls_back_for_short_slices(self):
+        hot_usernames.size = 2  # holds bruno and anakin only
+        hot_usernames.reset()
+        self.assertEqual(self.search('an', limit=1), ['anakin'])
+        self.assertEqual(self.search('an'), ['anakin', 'Ana_b', 'andre'])
+
+    @override_settings(CPF_EXTERNAL_CHECK='off')
+    def test_register_and_rename_update_the_hot_cache(self):
+        self.search('a')  # load it
+        response = APIClient().post('/api/accounts/auth/register/', {
+            'username': 'anabela', 'email': 'anabela@example.com', 'cpf': '123.456.789-09',
+            'password': 'Str0ngPassw0rd', 'password_confirm': 'Str0ngPassw0rd',
+        })
+        self.assertEqual(response.status_code, 201)
+        self.assertIn('anabela', self.search('anab'))
+
+        self.client.force_authenticate(self.users['andre'])
+        self.client.post('/api/accounts/auth/update-username/', {'username': 'zeca'})
+        self.assertEqual(self.search('zec'), ['zeca'])
+        self.assertEqual(self.search('andre'), [])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.users = {
+            name: make_user(name, f'000.000.000-{i:02d}')
+            for i, name in enumerate(['alice', 'bob', 'carol', 'dave', 'erin', 'fred'])
+        }
+        for follower, followed in [('alice', 'bob'), ('alice', 'carol'), ('bob', 'dave'), ('bob', 'erin'),
+                                   ('carol', 'dave'), ('carol', 'alice'), ('dave', 'fred')]:
+            Follow.objects.create(follower=self.users[follower], followed=self.users[followed])
+        UserProfile.objects.filter(user=self.users['fred']).update(followers_count=7)
+        UserProfile.objects.filter(user=self.users['erin']).update(followers_count=3)
+
+    def build(self, **options):
+        call_command('build_recommendations', stdout=io.StringIO(), **options)
+        return sorted(FollowSuggestion.objects.values_list('user__username', 'suggested__username', 'rank', 'mutual_count'))
+
+    def suggested(self, name, **params):
+        self.client.force_authenticate(self.users[name])
+        response = self.client.get('/api/accounts/auth/suggestions/', params)
+        self.assertEqual(response.status_code, 200)
+        return [(row['username'], row['mutual_count']) for row in response.data['results']]
+
+    def test_friends_of_friends_ranked_by_adamic_adar(self):
+        self.assertEqual(self.build(), [
+            ('alice', 'dave', 0, 2), ('alice', 'erin', 1, 1),
+            ('bob', 'fred', 0, 1),
+            ('carol', 'bob', 0, 1), ('carol', 'fred', 1, 1),
+        ])
+        # alice -> bob -> dave and alice -> carol -> dave; bob and carol have degree 3
+        self.assertAlmostEqual(
+            FollowSuggestion.objects.get(user=self.users['alice'], suggested=self.users['dave']).score,
+            2 / math.log(3),
+        )
+        self.assertEqual(self.suggested('alice'), [('dave', 2), ('erin', 1)])
+        self.assertEqual(self.suggested('alice', limit=1), [('dave', 2)])
+
+        self.client.post('/api/accounts/auth/follow/', {'username': 'dave'})
+        self.assertEqual(self.suggested('alice'), [('erin', 1)])
+
+    def test_users_without_suggestions_get_popular_accounts(self):
+        self.build()
+        self.assertEqual(self.suggested('fred', limit=2), [('erin', 0), ('alice', 0)])
+        self.assertEqual(self.suggested('erin', limit=1), [('fred', 0)])
+
+    def test_rebuild_replaces_rows_and_matches_across_workers(self):
+        expected = self.build()
+        Follow.objects.filter(follower=self.users['dave']).delete()
+        FollowSuggestion.objects.create(user=self.users['fred'], suggested=self.users['alice'], score=1,
+                                        mutual_count=1, rank=0, computed_at=self.users['fred'].date_joined)
+        without_dave = [row for row in expected if row[1] != 'fred']
+        self.assertEqual(self.build(chunk_paths=1), without_dave)
+        self.assertEqual(self.build(workers=2, chunk_paths=1), without_dave)
+
+
+def image_upload(size=(800, 600), name='photo.png', fmt='PNG'):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 30, 90)).save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+
+class ProfilePictureTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media, True)
+        # Jobs run inline so the test sees their effects
+        settings = override_settings(MEDIA_ROOT=media, AVATAR_STAGING_DIR=os.path.join(media, 'staging'),
+                                     JOBS_EAGER=True)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.media = media
+        self.client = APIClient()
+        self.user = make_user('alice', '111.444.777-35')
+        self.client.force_authenticate(self.user)
+
+    def upload(self, upload):
+        return self.client.post('/api/accounts/auth/update-profile-picture/', {'profile_picture': upload})
+
+    def stored(self, name):
+        return os.path.exists(os.path.join(self.media, name))
+
+    def test_upload_is_processed_into_variants(self):
+        response = self.upload(image_upload())
+        self.assertEqual(response.status_code, 202)
+
+        profile = UserProfile.objects.get(user=self.user)
+        self.assertEqual(profile.profile_picture_pending, '')
+        self.assertTrue(self.stored(profile.profile_picture.name))
+        self.assertEqual(set(profile.profile_picture_variants), {'96', '400'})
+        with Image.open(os.path.join(self.media, profile.profile_picture_variants['96'])) as variant:
+            self.assertEqual((variant.format, variant.size), ('WEBP', (96, 96)))
+        self.assertEqual(os.listdir(os.path.join(self.media, 'staging')), [])
+
+        self.client.force_authenticate(User.objects.get(pk=self.user.pk))
+        me = self.client.get('/api/accounts/auth/me/').data['profile']
+        self.assertFalse(me['profile_picture_processing'])
+        self.assertTrue(me['profile_picture_variants']['400'].endswith('_400.webp'))
+
+    def test_rejects_non_images_by_content(self):
+        fake = SimpleUploadedFile('photo.png', b'<?php echo 1; ?>' * 10, content_type='image/png')
+        response = self.upload(fake)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(UserProfile.objects.get(user=self.user).profile_picture)
+
+    def test_replacing_deletes_old_assets_without_reading_the_row(self):
+        self.upload(image_upload())
+        old = UserProfile.objects.get(user=self.user)
+        old_names = [old.profile_picture.name, *old.profile_picture_variants.values()]
+
+        self.upload(image_upload(name='other.jpg', fmt='JPEG'))
+        new = UserProfile.objects.get(user=self.user)
+        self.assertTrue(new.profile_picture.name.endswith('.jpg'))
+        self.assertFalse(any(self.stored(name) for name in old_names))
+        with self.assertNumQueries(1):
+            new.save(update_fields=['followers_count'])
+
+    @override_settings(JOBS_EAGER=False)
+    def test_superseded_upload_is_discarded(self):
+        profile = UserProfile.objects.get(user=self.user)
+        first = avatars.stage_upload(image_upload(), 'png')
+        second = avatars.stage_upload(image_upload(), 'png')
+        avatars.request_processing(profile, first)
+        avatars.request_processing(profile, second)
+        self.assertEqual(Job.objects.filter(name='accounts.process_profile_picture').count(), 2)
+        avatars.process_upload(profile.pk, first)
+        self.assertFalse(UserProfile.objects.get(pk=profile.pk).profile_picture)
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'profile_pictures')))
+        avatars.process_upload(profile.pk, second)
+        self.assertTrue(UserProfile.objects.get(pk=profile.pk).profile_picture.name.endswith(second))
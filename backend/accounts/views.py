@@ -1,21 +1,112 @@
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from rest_framework.permissions import AllowAny, IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework.permissions import AllowAny, IsAdminUser, IsAuthenticated
+from django.conf import settings
 from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
+from django.db import transaction
 
+from backend.conditional import not_modified, set_validators
+from backend.counters import adjust_counters
+from posts.live import follows_changed
+from posts.timeline import queue_backfill, remove_author_from_timeline, remove_authors_from_timeline
 from .serializers import (
     RegisterSerializer,
     LoginSerializer,
     UserSerializer,
-    UserDetailSerializer,
+    UserSearchResultSerializer,
+    FollowEntrySerializer,
+    FollowSuggestionSerializer,
 )
 from .models import UserProfile, Follow
+from .cache import get_profile, get_profile_by_username, invalidate_profile, profile_cache_stats
+from .authentication import revoke_tokens, tokens_for
+from .avatars import MAX_PICTURE_SIZE, request_processing, sniff_image_type, stage_upload
+from .pagination import FollowCursorPagination
+from .recommendations import DEFAULT_LIMIT as SUGGESTIONS_DEFAULT_LIMIT, suggestions_for
+from .search import DEFAULT_LIMIT, MAX_LIMIT, hot_usernames, search_usernames
 from . import messages
 
 
+def lock_follower(user):
+    """
+    Serialize `user`'s follow changes for the current transaction, so counter
+    deltas computed from the follow rows it reads are exact. Locks the User
+    row: holding the follower's profile before adjust_follow_counters would
+    deadlock A following B against B following A.
+    """
+    list(User.objects.select_for_update().filter(pk=user.pk).values_list('pk', flat=True))
+
+
+def adjust_follow_counters(follower, followed, delta):
+    """Update both profiles' follow counters, locking rows in id order."""
+    updates = sorted([
+        (follower.pk, {'following_count': delta}),
+        (followed.pk, {'followers_count': delta}),
+    ], key=lambda update: update[0])
+    for user_id, deltas in updates:
+        adjust_counters(UserProfile.objects.filter(user_id=user_id), **deltas)
+
+
+# Maximum number of users accepted by the batch relationship endpoints
+RELATIONSHIP_BATCH_LIMIT = 200
+
+
+def resolve_batch_targets(request):
+    """
+    Read `usernames` or `ids` from the request body.
+    Returns (list of (id, username), missing inputs, error Response or None).
+    """
+    usernames = request.data.get('usernames')
+    ids = request.data.get('ids')
+    values = usernames if usernames is not None else ids
+    if not isinstance(values, list) or not values:
+        return None, None, Response(
+            {'detail': 'usernames or ids (non-empty list) is required'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+    if len(values) > RELATIONSHIP_BATCH_LIMIT:
+        return None, None, Response(
+            {'detail': f'At most {RELATIONSHIP_BATCH_LIMIT} users per request'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    if usernames is not None:
+        values = [str(value) for value in values]
+        found = list(User.objects.filter(username__in=values).values_list('id', 'username'))
+        missing = sorted(set(values) - {username for _, username in found})
+    else:
+        try:
+            values = [int(value) for value in values]
+        except (TypeError, ValueError):
+            return None, None, Response(
+                {'detail': 'ids must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        found = list(User.objects.filter(pk__in=values).values_list('id', 'username'))
+        missing = sorted(set(values) - {user_id for user_id, _ in found})
+    return found, missing, None
+
+
+def follow_list_response(request, follows, side):
+    """
+    One keyset page of `follows` (newest first) showing the user on `side`
+    ('follower' or 'followed') with avatar and whether the viewer follows
+    them. Costs the page query plus one batch query for the follow state.
+    """
+    paginator = FollowCursorPagination()
+    page = paginator.paginate_queryset(follows.select_related(f'{side}__profile'), request)
+    user_ids = [getattr(follow, f'{side}_id') for follow in page]
+    following_ids = set()
+    if request.user.is_authenticated and user_ids:
+        following_ids = set(Follow.objects.filter(
+            follower=request.user, followed_id__in=user_ids
+        ).values_list('followed_id', flat=True))
+    serializer = FollowEntrySerializer(page, many=True, context={'side': side, 'following_ids': following_ids})
+    return paginator.get_paginated_response(serializer.data)
+
+
 class AuthViewSet(viewsets.ViewSet):
     """Authentication endpoints (register and login)."""
     permission_classes = [AllowAny]
@@ -29,13 +120,12 @@ class AuthViewSet(viewsets.ViewSet):
         serializer = RegisterSerializer(data=request.data)
         if serializer.is_valid():
             user = serializer.save()
+            hot_usernames.add(user.pk, user.username)
             # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
             return Response(
                 {
                     'user': UserSerializer(user).data,
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
+                    **tokens_for(user),
                 },
                 status=status.HTTP_201_CREATED
             )
@@ -70,12 +160,10 @@ class AuthViewSet(viewsets.ViewSet):
                 )
 
             # Generate JWT tokens
-            refresh = RefreshToken.for_user(user)
             return Response(
                 {
                     'user': UserSerializer(user).data,
-                    'refresh': str(refresh),
-                    'access': str(refresh.access_token),
+                    **tokens_for(user),
                 },
                 status=status.HTTP_200_OK
             )
@@ -84,8 +172,8 @@ class AuthViewSet(viewsets.ViewSet):
     @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
     def me(self, request):
         """Get current authenticated user info with follow data."""
-        serializer = UserDetailSerializer(request.user, context={'request': request})
-        return Response(serializer.data)
+        data, etag = get_profile(request.user, request.user)
+        return not_modified(request, etag) or set_validators(Response(data), etag)
 
     @action(detail=False, methods=['get'], permission_classes=[AllowAny])
     def profile(self, request):
@@ -102,14 +190,58 @@ class AuthViewSet(viewsets.ViewSet):
             )
 
         try:
-            user = User.objects.get(username=username)
-            serializer = UserDetailSerializer(user, context={'request': request})
-            return Response(serializer.data, status=status.HTTP_200_OK)
+            data, etag = get_profile_by_username(username, request.user)
         except User.DoesNotExist:
             return Response(
                 {'detail': 'User not found'},
                 status=status.HTTP_404_NOT_FOUND
             )
+        return not_modified(request, etag) or set_validators(Response(data, status=status.HTTP_200_OK), etag)
+
+    @action(detail=False, methods=['get'], permission_classes=[AllowAny])
+    def search(self, request):
+        """
+        Username autocomplete (case-insensitive prefix), most-followed first.
+        Query params: prefix, limit (default 10, max 20)
+        Returns: results (id, username, profile_picture, followers_count)
+        """
+        prefix = request.query_params.get('prefix', '').strip()
+        if not prefix:
+            return Response(
+                {'detail': 'prefix query parameter is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = min(max(int(request.query_params.get('limit', DEFAULT_LIMIT)), 1), MAX_LIMIT)
+        except ValueError:
+            limit = DEFAULT_LIMIT
+
+        profiles = search_usernames(prefix, limit)
+        return Response(
+            {'results': UserSearchResultSerializer(profiles, many=True).data},
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def suggestions(self, request):
+        """
+        Who to follow: accounts followed by the accounts the user follows,
+        precomputed by `manage.py build_recommendations` (most-followed
+        accounts for users with none).
+        Query params: limit (default 10, max RECOMMENDATIONS_PER_USER)
+        Returns: results (id, username, profile_picture, followers_count, mutual_count)
+        """
+        max_limit = settings.RECOMMENDATIONS_PER_USER
+        try:
+            limit = min(max(int(request.query_params.get('limit', SUGGESTIONS_DEFAULT_LIMIT)), 1), max_limit)
+        except ValueError:
+            limit = SUGGESTIONS_DEFAULT_LIMIT
+
+        suggestions = suggestions_for(request.user, limit)
+        return Response(
+            {'results': FollowSuggestionSerializer(suggestions, many=True).data},
+            status=status.HTTP_200_OK
+        )
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
     def follow(self, request):
@@ -140,12 +272,20 @@ class AuthViewSet(viewsets.ViewSet):
             )
 
         # Create follow relationship
-        follow, created = Follow.objects.get_or_create(
-            follower=request.user,
-            followed=target_user
-        )
+        with transaction.atomic():
+            lock_follower(request.user)
+            follow, created = Follow.objects.get_or_create(
+                follower=request.user,
+                followed=target_user
+            )
+            if created:
+                adjust_follow_counters(request.user, target_user, 1)
+                queue_backfill(request.user, [target_user.pk])
 
         if created:
+            invalidate_profile(request.user.pk)
+            invalidate_profile(target_user.pk)
+            follows_changed(request.user.pk)
             return Response(
                 {'detail': f'You are now following {target_username}'},
                 status=status.HTTP_201_CREATED
@@ -178,12 +318,20 @@ class AuthViewSet(viewsets.ViewSet):
             )
 
         # Delete follow relationship
-        deleted_count, _ = Follow.objects.filter(
-            follower=request.user,
-            followed=target_user
-        ).delete()
+        with transaction.atomic():
+            lock_follower(request.user)
+            deleted_count, _ = Follow.objects.filter(
+                follower=request.user,
+                followed=target_user
+            ).delete()
+            if deleted_count > 0:
+                adjust_follow_counters(request.user, target_user, -1)
 
         if deleted_count > 0:
+            invalidate_profile(request.user.pk)
+            invalidate_profile(target_user.pk)
+            remove_author_from_timeline(request.user, target_user)
+            follows_changed(request.user.pk)
             return Response(
                 {'detail': f'You unfollowed {target_username}'},
                 status=status.HTTP_200_OK
@@ -194,26 +342,135 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_200_OK
             )
 
-    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
-    def following(self, request):
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated])
+    def relationships(self, request):
+        """
+        Follow state between the current user and a batch of users.
+        Expected fields: usernames (list) or ids (list), at most 200
+        Returns: relationships (list of id, username, following, followed_by), not_found
+        """
+        targets, missing, error = resolve_batch_targets(request)
+        if error:
+            return error
+
+        target_ids = [user_id for user_id, _ in targets]
+        following = set(Follow.objects.filter(
+            follower=request.user, followed_id__in=target_ids
+        ).values_list('followed_id', flat=True))
+        followed_by = set(Follow.objects.filter(
+            follower_id__in=target_ids, followed=request.user
+        ).values_list('follower_id', flat=True))
+
+        return Response(
+            {
+                'relationships': [
+                    {
+                        'id': user_id,
+                        'username': username,
+                        'following': user_id in following,
+                        'followed_by': user_id in followed_by,
+                    }
+                    for user_id, username in targets
+                ],
+                'not_found': missing,
+            },
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated], url_path='bulk-follow')
+    def bulk_follow(self, request):
+        """
+        Follow a batch of users.
+        Expected fields: usernames (list) or ids (list), at most 200
+        Returns: followed, already_following, not_found
+        """
+        targets, missing, error = resolve_batch_targets(request)
+        if error:
+            return error
+
+        targets = [(user_id, username) for user_id, username in targets if user_id != request.user.pk]
+        target_ids = [user_id for user_id, _ in targets]
+        with transaction.atomic():
+            lock_follower(request.user)
+            existing = set(Follow.objects.filter(
+                follower=request.user, followed_id__in=target_ids
+            ).values_list('followed_id', flat=True))
+            new_ids = [user_id for user_id in target_ids if user_id not in existing]
+            Follow.objects.bulk_create(
+                [Follow(follower=request.user, followed_id=user_id) for user_id in new_ids],
+                ignore_conflicts=True
+            )
+            adjust_counters(UserProfile.objects.filter(user_id__in=new_ids), followers_count=1)
+            adjust_counters(UserProfile.objects.filter(user=request.user), following_count=len(new_ids))
+            if new_ids:
+                queue_backfill(request.user, new_ids)
+
+        for user_id in new_ids:
+            invalidate_profile(user_id)
+        invalidate_profile(request.user.pk)
+        if new_ids:
+            follows_changed(request.user.pk)
+
+        return Response(
+            {
+                'followed': [username for user_id, username in targets if user_id in new_ids],
+                'already_following': [username for user_id, username in targets if user_id in existing],
+                'not_found': missing,
+            },
+            status=status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated], url_path='bulk-unfollow')
+    def bulk_unfollow(self, request):
         """
-        Get list of usernames that the current user is following.
-        Returns: list of usernames
+        Unfollow a batch of users.
+        Expected fields: usernames (list) or ids (list), at most 200
+        Returns: unfollowed, not_following, not_found
         """
-        following_users = Follow.objects.filter(
-            follower=request.user
-        ).values_list('followed__username', flat=True)
+        targets, missing, error = resolve_batch_targets(request)
+        if error:
+            return error
+
+        target_ids = [user_id for user_id, _ in targets]
+        with transaction.atomic():
+            lock_follower(request.user)
+            follows = Follow.objects.filter(follower=request.user, followed_id__in=target_ids)
+            removed = set(follows.values_list('followed_id', flat=True))
+            follows.delete()
+            adjust_counters(UserProfile.objects.filter(user_id__in=removed), followers_count=-1)
+            adjust_counters(UserProfile.objects.filter(user=request.user), following_count=-len(removed))
+
+        if removed:
+            remove_authors_from_timeline(request.user, removed)
+            follows_changed(request.user.pk)
+        for user_id in removed:
+            invalidate_profile(user_id)
+        invalidate_profile(request.user.pk)
+
         return Response(
-            {'following': list(following_users)},
+            {
+                'unfollowed': [username for user_id, username in targets if user_id in removed],
+                'not_following': [username for user_id, username in targets if user_id not in removed],
+                'not_found': missing,
+            },
             status=status.HTTP_200_OK
         )
 
+    @action(detail=False, methods=['get'], permission_classes=[IsAuthenticated])
+    def following(self, request):
+        """
+        Users the current user follows, most recent first (cursor-paginated).
+        Query params: cursor, page_size
+        Returns: next, previous, results (id, username, profile_picture, is_following, followed_at)
+        """
+        return follow_list_response(request, Follow.objects.filter(follower=request.user), 'followed')
+
     @action(detail=False, methods=['get'], permission_classes=[AllowAny], url_path='user-followers')
     def user_followers(self, request):
         """
-        Get list of users who follow a specific user.
-        Query params: username
-        Returns: list of follower usernames
+        Users who follow a specific user, most recent first (cursor-paginated).
+        Query params: username, cursor, page_size
+        Returns: next, previous, results (id, username, profile_picture, is_following, followed_at)
         """
         username = request.query_params.get('username')
         if not username:
@@ -230,21 +487,14 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        followers = Follow.objects.filter(
-            followed=user
-        ).values_list('follower__username', flat=True)
-        
-        return Response(
-            {'followers': list(followers)},
-            status=status.HTTP_200_OK
-        )
+        return follow_list_response(request, Follow.objects.filter(followed=user), 'follower')
 
     @action(detail=False, methods=['get'], permission_classes=[AllowAny], url_path='user-following')
     def user_following(self, request):
         """
-        Get list of users that a specific user is following.
-        Query params: username
-        Returns: list of following usernames
+        Users a specific user follows, most recent first (cursor-paginated).
+        Query params: username, cursor, page_size
+        Returns: next, previous, results (id, username, profile_picture, is_following, followed_at)
         """
         username = request.query_params.get('username')
         if not username:
@@ -261,24 +511,16 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_404_NOT_FOUND
             )
         
-        following = Follow.objects.filter(
-            follower=user
-        ).values_list('followed__username', flat=True)
-        
-        return Response(
-            {'following': list(following)},
-            status=status.HTTP_200_OK
-        )
+        return follow_list_response(request, Follow.objects.filter(follower=user), 'followed')
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated], url_path='update-profile-picture')
     def update_profile_picture(self, request):
         """
         Update user profile picture.
         Expected fields: profile_picture (file)
+        The upload is stored and resized in the background; the profile reports
+        profile_picture_processing until the new picture is live.
         """
-        print(f"[DEBUG] update_profile_picture called by user: {request.user.username}")
-        print(f"[DEBUG] FILES in request: {list(request.FILES.keys())}")
-        
         if 'profile_picture' not in request.FILES:
             return Response(
                 {'detail': 'profile_picture file is required'},
@@ -286,49 +528,39 @@ class AuthViewSet(viewsets.ViewSet):
             )
 
         profile_picture = request.FILES['profile_picture']
-        print(f"[DEBUG] File received: {profile_picture.name}, size: {profile_picture.size}, type: {profile_picture.content_type}")
 
         # Validate file size (max 5MB)
-        if profile_picture.size > 5 * 1024 * 1024:
+        if profile_picture.size > MAX_PICTURE_SIZE:
             return Response(
                 {'detail': 'File size cannot exceed 5MB'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Validate file type
-        allowed_types = ['image/jpeg', 'image/jpg', 'image/png', 'image/gif', 'image/webp']
-        if profile_picture.content_type not in allowed_types:
+        # Validate file type by its magic bytes, not the client's content type or name
+        image_type = sniff_image_type(profile_picture)
+        if image_type is None:
             return Response(
                 {'detail': 'Only JPEG, PNG, GIF, and WebP images are allowed'},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # Validate file extension
-        allowed_extensions = ['.jpg', '.jpeg', '.png', '.gif', '.webp']
-        file_extension = profile_picture.name.lower().split('.')[-1]
-        if f'.{file_extension}' not in allowed_extensions:
-            return Response(
-                {'detail': 'Invalid file extension'},
-                status=status.HTTP_400_BAD_REQUEST
-            )
-
         try:
             profile = request.user.profile
         except UserProfile.DoesNotExist:
             profile = UserProfile.objects.create(user=request.user)
 
-        print(f"[DEBUG] Saving new profile_picture to profile...")
-        profile.profile_picture = profile_picture
-        profile.save()
-        
-        print(f"[DEBUG] Profile saved. URL: {profile.profile_picture.url if profile.profile_picture else 'None'}")
+        token = stage_upload(profile_picture, image_type)
+        with transaction.atomic():
+            request_processing(profile, token)
+        invalidate_profile(request.user.pk)
 
         return Response(
             {
-                'detail': 'Profile picture updated successfully',
+                'detail': 'Profile picture is being processed',
+                'processing': True,
                 'url': profile.profile_picture.url if profile.profile_picture else None
             },
-            status=status.HTTP_200_OK
+            status=status.HTTP_202_ACCEPTED
         )
 
     @action(detail=False, methods=['post'], permission_classes=[IsAuthenticated], url_path='update-username')
@@ -350,8 +582,12 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        old_username = request.user.username
         request.user.username = username
-        request.user.save()
+        # request.user may come from the auth cache; write only what changed
+        request.user.save(update_fields=['username'])
+        invalidate_profile(request.user.pk, old_username, username)
+        hot_usernames.rename(request.user.pk, old_username, username)
 
         return Response(
             {'detail': 'Username updated successfully', 'username': username},
@@ -374,8 +610,11 @@ class AuthViewSet(viewsets.ViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # The cached request.user may predate a change made elsewhere
+        user = User.objects.select_related('profile').get(pk=request.user.pk)
+
         # Verify current password
-        if not request.user.check_password(current_password):
+        if not user.check_password(current_password):
             return Response(
                 {'detail': 'Current password is incorrect'},
                 status=status.HTTP_401_UNAUTHORIZED
@@ -383,12 +622,12 @@ class AuthViewSet(viewsets.ViewSet):
 
         # Update email if provided
         if email:
-            if User.objects.filter(email=email).exclude(pk=request.user.pk).exists():
+            if User.objects.filter(email=email).exclude(pk=user.pk).exists():
                 return Response(
                     {'detail': 'Email already in use'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            request.user.email = email
+            user.email = email
 
         # Update password if provided
         if new_password:
@@ -397,11 +636,22 @@ class AuthViewSet(viewsets.ViewSet):
                     {'detail': 'Password must be at least 6 characters'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            request.user.set_password(new_password)
+            user.set_password(new_password)
 
-        request.user.save()
+        user.save(update_fields=['email', 'password'])
+        invalidate_profile(user.pk)
 
-        return Response(
-            {'detail': 'Email and/or password updated successfully'},
-            status=status.HTTP_200_OK
-        )
+        data = {'detail': 'Email and/or password updated successfully'}
+        if new_password:
+            # Sign out every other session; this one continues with new tokens
+            revoke_tokens(user)
+            data.update(tokens_for(user))
+        return Response(data, status=status.HTTP_200_OK)
+
+    @action(detail=False, methods=['get'], permission_classes=[IsAdminUser], url_path='cache-stats')
+    def cache_stats(self, request):
+        """
+        Profile cache hit/miss counters for the worker serving this request.
+        Returns: hits, misses, invalidations, hit_rate
+        """
+        return Response({'profile': profile_cache_stats()}, status=status.HTTP_200_OK)
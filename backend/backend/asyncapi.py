@@ -0,0 +1,129 @@
+"""
+Async read endpoints, served under /api/async/ by the ASGI server.
+
+DRF 3.14 views are synchronous, so under ASGI each one holds a thread for
+as long as its queries take. Views decorated with `read_view` are plain
+Django coroutines instead: they authenticate through
+CachedJWTAuthentication.aauthenticate, query through the async ORM and
+render with the same serializers, paginators and validators as their DRF
+counterparts, so the JSON is identical.
+
+Serializers run in the event loop and must only read preloaded data
+(select_related, hydration); a lazy query there raises
+SynchronousOnlyOperation.
+
+Django runs the sync code an ASGI request calls (the async ORM included)
+on a thread it starts for that request and keeps, with its database
+connection, until the response ends. Long-lived responses (event
+streams) must do their sync work through `detached` instead.
+"""
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+
+from django.contrib.auth.models import AnonymousUser
+from django.http import Http404, HttpResponse
+from rest_framework import exceptions
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from accounts.authentication import CachedJWTAuthentication
+from .conditional import not_modified, page_links, set_validators, weak_etag
+from .middleware import timed
+
+_authentication = CachedJWTAuthentication()
+_renderer = JSONRenderer()
+
+
+def render(data, status=200):
+    return HttpResponse(_renderer.render(data), content_type='application/json', status=status)
+
+
+def error_response(exc):
+    """The response DRF's default exception handler gives for `exc`."""
+    detail = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+    response = render(detail, exc.status_code)
+    if isinstance(exc, (exceptions.NotAuthenticated, exceptions.AuthenticationFailed)):
+        response.status_code = 401
+        response['WWW-Authenticate'] = _authentication.authenticate_header(None)
+    return response
+
+
+async def detached(func, *args):
+    """
+    `await func(*args)` on the shared thread pool rather than the request's
+    own thread, releasing the database connection like the end of a request.
+    """
+    def call():
+        try:
+            return func(*args)
+        finally:
+            close_old_connections()
+    return await sync_to_async(call, thread_sensitive=False)()
+
+
+def read_view(auth_required=False, token_param=None, long_lived=False):
+    """
+    Turn `async def view(request, ...)` into a GET-only async Django view.
+    The view receives a DRF Request (query_params, user, and auth: the
+    validated access token) and returns a response; DRF exceptions and
+    Http404 become DRF-style error responses.
+    With `token_param`, an access token may also come in that query
+    parameter, for clients that cannot set headers (EventSource).
+    `long_lived` views are authenticated through `detached`.
+    """
+    def decorate(view):
+        @functools.wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                response = error_response(exceptions.MethodNotAllowed(request.method))
+                response['Allow'] = 'GET, HEAD'
+                return response
+            try:
+                raw_token = request.GET.get(token_param) if token_param else None
+                if long_lived:
+                    authenticated = await detached(_authentication.authenticate_request, request, raw_token)
+                else:
+                    authenticated = await _authentication.aauthenticate(request, raw_token)
+                if authenticated is None:
+                    if auth_required:
+                        raise exceptions.NotAuthenticated()
+                    authenticated = (AnonymousUser(), None)
+                api_request = Request(request)
+                api_request.user, api_request.auth = authenticated
+                return await view(api_request, *args, **kwargs)
+            except exceptions.APIException as exc:
+                return error_response(exc)
+            except Http404:
+                return error_response(exceptions.NotFound())
+        return wrapper
+    return decorate
+
+
+def conditional(request, data, etag, last_modified=None):
+    """304 if the validators match, else `data` rendered with the validators attached."""
+    return not_modified(request, etag, last_modified) or set_validators(render(data), etag, last_modified)
+
+
+async def list_page(request, paginator, queryset, serialize, fingerprint=None, prepare=None, last_modified=None):
+    """
+    Async counterpart of ConditionalListMixin.list: one keyset page of
+    `queryset`, `await prepare(rows)`, an ETag from `fingerprint(row)` of
+    every row and the page's links, then `serialize(rows)` unless the
+    client's copy is current.
+    """
+    rows = await paginator.apaginate_queryset(queryset, request)
+    if prepare is not None:
+        await prepare(rows)
+    fingerprint = fingerprint or (lambda row: row.pk)
+    etag = weak_etag(
+        request.get_full_path(), request.user.pk, [fingerprint(row) for row in rows], page_links(paginator),
+    )
+    modified = last_modified(rows) if last_modified is not None else None
+    response = not_modified(request, etag, modified)
+    if response is not None:
+        return response
+    with timed():
+        data = serialize(rows)
+    return set_validators(render(paginator.get_paginated_data(data)), etag, modified)
@@ -0,0 +1,105 @@
+"""
+Conditional GET support (weak ETag / Last-Modified) for DRF views.
+
+Validators are computed from data the view has already loaded (row keys,
+counters, version stamps), never from the rendered body, so a matching
+If-None-Match short-circuits to 304 before any serializer runs.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+from .middleware import timed
+
+
+def weak_etag(*parts):
+    digest = hashlib.blake2b(repr(parts).encode('utf-8'), digest_size=16).hexdigest()
+    return f'W/"{digest}"'
+
+
+def page_links(paginator):
+    """
+    Which of next/previous a keyset page links to: a full last page gains a
+    `next` link when a row is added after it, without its own rows changing.
+    """
+    return getattr(paginator, 'has_next', None), getattr(paginator, 'has_previous', None)
+
+
+def not_modified(request, etag=None, last_modified=None):
+    """A 304 response if the request's validators match, else None."""
+    request = getattr(request, '_request', request)
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag=None, last_modified=None):
+    """Attach validators and make clients revalidate per credential."""
+    if etag:
+        response['ETag'] = etag
+    if last_modified:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    patch_vary_headers(response, ['Authorization'])
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+class ConditionalListMixin:
+    """
+    For generic list views: fetch and prepare the page, derive an ETag from
+    `get_row_fingerprint` of every row and from which pagination links
+    exist, and answer 304 when it matches.
+    """
+
+    def get_row_fingerprint(self, row):
+        return row.pk
+
+    def get_last_modified(self, page):
+        return None
+
+    def prepare_page(self, page):
+        """Hook to batch-load whatever `get_row_fingerprint` reads."""
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        rows = page if page is not None else list(queryset)
+        self.prepare_page(rows)
+
+        etag = weak_etag(
+            request.get_full_path(),
+            request.user.pk,
+            [self.get_row_fingerprint(row) for row in rows],
+            page_links(self.paginator) if page is not None else None,
+        )
+        last_modified = self.get_last_modified(rows)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        with timed():
+            data = self.get_serializer(rows, many=True).data
+        if page is not None:
+            response = self.get_paginated_response(data)
+        else:
+            response = Response(data)
+        return set_validators(response, etag, last_modified)
+
+
+class ConditionalRetrieveMixin:
+    """Detail-view counterpart of ConditionalListMixin."""
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        self.prepare_page([instance])
+        etag = weak_etag(request.user.pk, self.get_row_fingerprint(instance))
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+        with timed():
+            data = self.get_serializer(instance).data
+        return set_validators(Response(data), etag)
@@ -0,0 +1,20 @@
+"""
+Helpers for denormalized counter columns.
+
+Counters are changed with a single UPDATE using F() expressions in the
+same transaction as the row that caused the change, so concurrent writers
+never lose increments. `reconcile_counters` repairs any drift.
+"""
+from django.db.models import F, Value
+from django.db.models.functions import Greatest
+
+
+def adjust_counters(queryset, **deltas):
+    """Add `field=delta` to every row of `queryset`, never going below zero."""
+    updates = {
+        field: Greatest(F(field) + delta, Value(0)) if delta < 0 else F(field) + delta
+        for field, delta in deltas.items()
+        if delta
+    }
+    if updates:
+        queryset.update(**updates)
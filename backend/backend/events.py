@@ -0,0 +1,157 @@
+"""
+Publish/subscribe for live events (server-sent events to browsers).
+
+Write paths `publish` small JSON-serializable dicts on named channels,
+normally through `publish_on_commit` so nothing is announced for a write
+that rolls back. Long-lived connections `subscribe` to channels and read
+what arrives from their Subscription.
+
+The default LocalBroker only reaches subscribers in the same process, so
+every web process sees the events of the requests it served itself.
+EVENTS_BROKER names another class with the same interface (e.g. one
+backed by Redis or PostgreSQL LISTEN/NOTIFY) for deployments with several
+web processes, or for events published by job workers.
+
+Publishing never blocks the writer. Each subscription has a bounded
+queue; a subscriber that falls EVENTS_QUEUE_SIZE events behind loses
+them and is told to resync. Events with a `coalesce` key (like deltas)
+are summed per key instead of queued, so a burst of likes on one post
+costs one delivery per flush interval.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+_ids = itertools.count(1)
+
+
+class Subscription:
+    """
+    One subscriber's inbox. Must be created, and read, in the event loop
+    that will consume it; brokers deliver into it with `offer`, in that loop.
+    """
+
+    def __init__(self, channels, owner=None):
+        self.id = next(_ids)
+        self.owner = owner
+        self.channels = set(channels)
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.coalesced = defaultdict(int)
+        self.overflowed = False
+        self.wake = asyncio.Event()
+
+    def offer(self, event):
+        if event.get('actor') is not None and event['actor'] == self.owner:
+            # People see their own actions already
+            return
+        if 'coalesce' in event:
+            self.coalesced[event['coalesce']] += event.get('delta', 0)
+        elif self.overflowed:
+            return
+        else:
+            try:
+                self.queue.put_nowait(event)
+            except asyncio.QueueFull:
+                self.overflowed = True
+                while not self.queue.empty():
+                    self.queue.get_nowait()
+        self.wake.set()
+
+    def drain(self):
+        """(queued events, {coalesce key: summed delta}, overflowed) and reset."""
+        events = []
+        while not self.queue.empty():
+            events.append(self.queue.get_nowait())
+        coalesced = {key: delta for key, delta in self.coalesced.items() if delta}
+        overflowed = self.overflowed
+        self.coalesced.clear()
+        self.overflowed = False
+        self.wake.clear()
+        return events, coalesced, overflowed
+
+
+class LocalBroker:
+    """In-process broker; `publish` may be called from any thread."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._channels = defaultdict(set)
+
+    def subscribe(self, channels, owner=None):
+        subscription = Subscription(channels, owner)
+        with self._lock:
+            for channel in subscription.channels:
+                self._channels[channel].add(subscription)
+        return subscription
+
+    def update(self, subscription, add=(), remove=()):
+        """Change the channels of an existing subscription."""
+        with self._lock:
+            for channel in set(remove) - set(add):
+                self._discard(subscription, channel)
+            for channel in add:
+                self._channels[channel].add(subscription)
+                subscription.channels.add(channel)
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for channel in list(subscription.channels):
+                self._discard(subscription, channel)
+
+    def _discard(self, subscription, channel):
+        subscription.channels.discard(channel)
+        subscribers = self._channels.get(channel)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._channels[channel]
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # Its event loop is closed; the connection is going away
+                pass
+        return len(subscribers)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({sub for subscribers in self._channels.values() for sub in subscribers})
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENTS_BROKER)()
+    return _broker
+
+
+def publish(channel, event):
+    """Deliver `event` to the subscribers of `channel`; never raises."""
+    try:
+        return broker().publish(channel, event)
+    except Exception:
+        logger.exception('Could not publish %s event on %s', event.get('type'), channel)
+        return 0
+
+
+def publish_on_commit(channel, event):
+    transaction.on_commit(lambda: publish(channel, event))
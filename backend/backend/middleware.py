@@ -0,0 +1,153 @@
+"""
+Opt-in per-request instrumentation (REQUEST_INSTRUMENTATION = True).
+
+Every query on every database connection is counted and timed through
+`connection.execute_wrapper`. The response carries a Server-Timing header
+(db, serialize, total), and the request is logged when it is slow or when
+one SQL statement ran DUPLICATE_QUERY_THRESHOLD times or more (an N+1).
+
+`serialize` covers `serializer.data` in the shared list/detail mixins
+(see `timed`) plus response rendering. Queries issued from inside a
+serializer count towards both db and serialize. Whatever remains of total
+is view code, authentication and external calls.
+"""
+import contextvars
+import logging
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+_current = contextvars.ContextVar('request_metrics', default=None)
+
+IN_LIST = re.compile(r'IN \((?:%s, )*%s\)')
+
+
+def fingerprint(sql):
+    """SQL with whitespace collapsed and IN lists of any length folded together."""
+    return IN_LIST.sub('IN (...)', ' '.join(sql.split()))
+
+
+class RequestMetrics:
+    """Accumulated timings of one request; also the execute wrapper."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.queries = 0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.queries += 1
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        """[(fingerprint, count)] executed at least `threshold` times, most frequent first."""
+        grouped = Counter()
+        for sql, count in self.statements.items():
+            grouped[fingerprint(sql)] += count
+        return [(sql, count) for sql, count in grouped.most_common() if count >= threshold]
+
+
+@contextmanager
+def timed():
+    """Count the enclosed block as serialization time of the current request."""
+    metrics = _current.get()
+    if metrics is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_time += time.perf_counter() - started
+
+
+class QueryInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.slow_ms = settings.SLOW_REQUEST_MS
+        self.duplicate_threshold = settings.DUPLICATE_QUERY_THRESHOLD
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self.wrapped(metrics):
+                response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    async def __acall__(self, request):
+        # The async ORM runs queries in a worker thread, but on this
+        # context's connection objects, so the wrappers still apply.
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        try:
+            with self.wrapped(metrics):
+                response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, metrics)
+
+    @staticmethod
+    def wrapped(metrics):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(metrics))
+        return stack
+
+    def finish(self, request, response, metrics):
+        total_ms = (time.perf_counter() - metrics.started) * 1000
+        db_ms = metrics.db_time * 1000
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={db_ms:.1f};desc="{metrics.queries} queries"',
+            f'serialize;dur={metrics.serialize_time * 1000:.1f}',
+            f'total;dur={total_ms:.1f}',
+        ])
+        self.report(request, metrics, total_ms, db_ms)
+        return response
+
+    def process_template_response(self, request, response):
+        # Runs right before the handler renders the response
+        metrics = _current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.serialize_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def report(self, request, metrics, total_ms, db_ms):
+        repeated = metrics.repeated(self.duplicate_threshold)
+        for sql, count in repeated[:3]:
+            logger.warning('Duplicate query x%d on %s %s: %s', count, request.method, request.path, sql)
+        if total_ms >= self.slow_ms:
+            top = '; '.join(f'x{count} {sql}' for sql, count in metrics.repeated(2)[:3]) or 'none'
+            logger.warning(
+                'Slow request %s %s: %.1f ms total, %.1f ms db in %d queries, %.1f ms serialize; repeated: %s',
+                request.method, request.path, total_ms, db_ms, metrics.queries,
+                metrics.serialize_time * 1000, top,
+            )
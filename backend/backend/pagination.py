@@ -0,0 +1,216 @@
+"""
+Keyset (cursor) pagination shared by the API apps.
+
+Pages are fetched with a range predicate on a unique ordering instead of
+OFFSET, so the cost of a page does not grow with how far the client has
+scrolled. Cursors are opaque tokens carrying the ordering values of the
+boundary row.
+"""
+import base64
+import binascii
+import datetime
+import json
+from collections import OrderedDict
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Seek pagination over `ordering`, which must be unique per row
+    (end it with the primary key as a tie-breaker).
+
+    Every field in `ordering` must be readable as an attribute of the
+    returned objects, so order by annotations rather than by `a__b` lookups.
+    """
+    ordering = ('-published_at', '-id')
+    page_size = 20
+    max_page_size = 100
+    page_size_query_param = 'page_size'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.start(request)
+        return self.finish(self.fetch(queryset, self.cursor, self.page_size + 1))
+
+    async def apaginate_queryset(self, queryset, request, view=None):
+        """paginate_queryset for async views, reading rows through `afetch`."""
+        self.start(request)
+        return self.finish(await self.afetch(queryset, self.cursor, self.page_size + 1))
+
+    def start(self, request):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.cursor = self.decode_cursor(request)
+
+    def finish(self, rows):
+        """Trim the `page_size + 1` fetched rows to the page and note which links exist."""
+        has_more = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+
+        reverse = self.cursor is not None and self.cursor[1]
+        if reverse:
+            rows.reverse()
+            self.has_next = True
+            self.has_previous = has_more
+        else:
+            self.has_next = has_more
+            self.has_previous = self.cursor is not None
+
+        self.page = rows
+        return rows
+
+    def fetch(self, queryset, cursor, limit):
+        """Up to `limit` rows strictly after `cursor`, in page order."""
+        return list(self.seek(queryset, cursor)[:limit])
+
+    async def afetch(self, queryset, cursor, limit):
+        """`fetch` through the async ORM."""
+        return [row async for row in self.seek(queryset, cursor)[:limit]]
+
+    def seek(self, queryset, cursor):
+        """Apply the cursor predicate and page ordering to `queryset`."""
+        reverse = cursor is not None and cursor[1]
+        ordering = [self._flip(f) for f in self.ordering] if reverse else list(self.ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self._seek_filter(ordering, cursor[0]))
+        return queryset.order_by(*ordering)
+
+    def get_page_size(self, request):
+        value = request.query_params.get(self.page_size_query_param)
+        if value is None:
+            return self.page_size
+        try:
+            size = int(value)
+        except ValueError:
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_data(self, data):
+        return OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ])
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self._link(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            # Walked off the end; step back from the cursor we came in with.
+            return replace_query_param(self.base_url, self.cursor_query_param,
+                                       self.encode_cursor(self.cursor[0], reverse=True))
+        return self._link(self.page[0], reverse=True)
+
+    def _link(self, row, reverse):
+        cursor = self.encode_cursor(self.row_key(row), reverse=reverse)
+        url = remove_query_param(self.base_url, self.cursor_query_param)
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def row_key(self, row):
+        """Ordering values of `row`, in `ordering` order."""
+        return [getattr(row, field.lstrip('-')) for field in self.ordering]
+
+    def encode_cursor(self, key, reverse=False):
+        values = [v.isoformat() if isinstance(v, datetime.datetime) else v for v in key]
+        payload = json.dumps({'k': values, 'r': int(bool(reverse))}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            padded = encoded + '=' * (-len(encoded) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+            values = payload['k']
+            reverse = bool(payload.get('r'))
+        except (TypeError, ValueError, KeyError, binascii.Error, UnicodeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            raise NotFound(self.invalid_cursor_message)
+        return values, reverse
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith('-') else f'-{field}'
+
+    @staticmethod
+    def _seek_filter(ordering, values):
+        """
+        Lexicographic "strictly after" predicate:
+        a >= x AND ((a > x) OR (a = x AND b > y) OR ...)
+
+        The redundant leading bound lets the database start an index range
+        scan at the cursor instead of filtering rows from the beginning.
+        """
+        predicate = Q()
+        equal = {}
+        for field, value in zip(ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            predicate |= Q(**equal, **{f'{name}__{lookup}': value})
+            equal[name] = value
+        first = ordering[0]
+        bound = Q(**{f"{first.lstrip('-')}__{'lte' if first.startswith('-') else 'gte'}": values[0]})
+        return bound & predicate
+
+
+class MergedKeysetPagination(KeysetPagination):
+    """
+    Keyset pagination over several querysets merged into one stream.
+
+    The view returns a list of querysets sharing `ordering` (all fields in
+    the same direction). Each source is seeked independently and the
+    candidates are merged, de-duplicated by primary key and truncated, so
+    a page still costs one bounded range scan per source.
+    """
+
+    def fetch(self, querysets, cursor, limit):
+        batches = []
+        for queryset in querysets:
+            batches.append(super().fetch(queryset, cursor, limit))
+        return self.merge(batches, cursor, limit)
+
+    async def afetch(self, querysets, cursor, limit):
+        batches = []
+        for queryset in querysets:
+            batches.append(await super().afetch(queryset, cursor, limit))
+        return self.merge(batches, cursor, limit)
+
+    def merge(self, batches, cursor, limit):
+        rows = {}
+        for batch in batches:
+            for row in batch:
+                rows.setdefault(row.pk, row)
+        descending = self.ordering[0].startswith('-')
+        if cursor is not None and cursor[1]:
+            descending = not descending
+        merged = sorted(rows.values(), key=self.row_key, reverse=descending)
+        return merged[:limit]
@@ -0,0 +1,235 @@
+"""
+Read replicas with read-your-writes stickiness.
+
+DATABASE_REPLICA_URLS adds replica1, replica2, ... next to `default`.
+ReplicaMiddleware marks GET/HEAD/OPTIONS requests to the views of
+REPLICA_VIEW_MODULES as replica reads, and ReplicaRouter sends the reads
+of such a request to one healthy replica (the same one for the whole
+request). Everything else, writes and reads inside a transaction on
+`default` included, uses the primary. So do the fills of the auth and
+profile caches, which read with `.using(DEFAULT_DB_ALIAS)`: a fill from a
+lagging replica right after an invalidation would re-cache stale rows.
+
+Read-your-writes: a successful unsafe request by an authenticated user
+pins that user to the primary for REPLICA_STICKY_SECONDS through a cache
+marker, so their own posts, likes and follows show up immediately. With
+several web processes the cache must be shared (see CACHES).
+
+Every REPLICA_HEALTH_INTERVAL seconds, at the next routed read, each
+process checks its replicas. Unreachable replicas and replicas more than
+REPLICA_MAX_LAG_SECONDS behind are ejected until a later check passes;
+with none left, reads go to the primary. Lag is only measured on
+PostgreSQL streaming replicas; other engines are checked for
+connectivity only.
+"""
+import asyncio
+import contextvars
+import itertools
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from accounts.authentication import CachedJWTAuthentication
+
+logger = logging.getLogger(__name__)
+
+PIN_KEY = 'replicas:v1:pin:{}'
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# Seconds since the replica last replayed the primary's WAL; 0 when it
+# has replayed everything it received (an idle primary is not lag)
+POSTGRES_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+"""
+
+_request = contextvars.ContextVar('replica_read', default=None)
+_authentication = CachedJWTAuthentication()
+
+
+def replica_aliases():
+    return [alias for alias in settings.DATABASES if alias.startswith('replica')]
+
+
+def replication_lag(alias):
+    """Seconds `alias` is behind the primary (0 when it cannot tell); raises if unreachable."""
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRES_LAG_SQL)
+            return float(cursor.fetchone()[0])
+        cursor.execute('SELECT 1')
+        return 0.0
+
+
+class ReplicaPool:
+    """Health of this process's replicas and round-robin choice among the healthy ones."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._checked_at = None
+        self._healthy = []
+        self._turn = itertools.count()
+
+    def choose(self):
+        """A healthy replica alias, or None for the primary."""
+        interval = settings.REPLICA_HEALTH_INTERVAL
+        if self._checked_at is None or time.monotonic() - self._checked_at >= interval:
+            if not _in_event_loop() and self._lock.acquire(blocking=False):
+                try:
+                    self.check()
+                finally:
+                    self._lock.release()
+        healthy = self._healthy
+        if not healthy:
+            return None
+        return healthy[next(self._turn) % len(healthy)]
+
+    def check(self):
+        max_lag = settings.REPLICA_MAX_LAG_SECONDS
+        healthy = []
+        for alias in replica_aliases():
+            try:
+                lag = replication_lag(alias)
+            except Exception as exc:
+                logger.warning('Replica %s ejected: %s', alias, exc)
+                continue
+            if lag > max_lag:
+                logger.warning('Replica %s ejected: %.1f s behind', alias, lag)
+                continue
+            healthy.append(alias)
+        self._healthy = healthy
+        self._checked_at = time.monotonic()
+        return healthy
+
+    def reset(self):
+        self._checked_at = None
+        self._healthy = []
+
+
+pool = ReplicaPool()
+
+
+def _in_event_loop():
+    # Health checks query; they wait for a routed read in a sync thread
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _user_id(request):
+    """The user id of the request's access token, without touching the database."""
+    try:
+        raw_token = _authentication.request_token(request)
+        if raw_token is None:
+            return None
+        return _authentication.claims(_authentication.get_validated_token(raw_token))[0]
+    except Exception:
+        # Invalid credentials are the view's business
+        return None
+
+
+def pin_to_primary(user_id):
+    """Read `user_id`'s requests from the primary for the next REPLICA_STICKY_SECONDS."""
+    cache.set(PIN_KEY.format(user_id), 1, settings.REPLICA_STICKY_SECONDS)
+
+
+class ReplicaRead:
+    """Routing decision for one request; the replica is picked at its first read."""
+
+    def __init__(self):
+        self.eligible = False
+        self.alias = None
+        # Reads inside a transaction the request opens stay on the primary
+        self.atomic_depth = len(connections[DEFAULT_DB_ALIAS].atomic_blocks)
+
+    def database(self):
+        if not self.eligible:
+            return None
+        if self.alias is None:
+            self.alias = pool.choose() or DEFAULT_DB_ALIAS
+        return self.alias
+
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.modules = set(settings.REPLICA_VIEW_MODULES)
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = _request.set(ReplicaRead())
+        try:
+            response = self.get_response(request)
+        finally:
+            _request.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = _request.set(ReplicaRead())
+        try:
+            response = await self.get_response(request)
+        finally:
+            _request.reset(token)
+        return self.finish(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        read = _request.get()
+        if read is None or request.method not in SAFE_METHODS:
+            return None
+        view_class = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        module = (view_class or view_func).__module__
+        if module not in self.modules:
+            return None
+        user_id = _user_id(request)
+        read.eligible = user_id is None or not cache.get(PIN_KEY.format(user_id))
+        return None
+
+    def finish(self, request, response):
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            user_id = _user_id(request)
+            if user_id is not None:
+                pin_to_primary(user_id)
+        return response
+
+
+class ReplicaRouter:
+    """Reads of replica-eligible requests go to a replica; all else to `default`."""
+
+    def db_for_read(self, model, **hints):
+        # Related lookups stay on the database their instance came from,
+        # so objects read from the primary (cache fills) keep to it
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db
+        read = _request.get()
+        if read is None or len(connections[DEFAULT_DB_ALIAS].atomic_blocks) > read.atomic_depth:
+            return None
+        return read.database()
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas receive the schema through replication
+        return db == DEFAULT_DB_ALIAS
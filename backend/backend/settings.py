@@ -12,6 +12,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 
 from pathlib import Path
 import os
+import tempfile
 from dotenv import load_dotenv
 import dj_database_url
 
@@ -49,6 +50,7 @@ INSTALLED_APPS = [
     "corsheaders",
     "accounts",
     "posts",
+    "jobs",
 ]
 
 # CORS Configuration
@@ -65,7 +67,7 @@ if not DEBUG:
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'accounts.authentication.CachedJWTAuthentication',
     ],
 }
 
@@ -76,9 +78,74 @@ SIMPLE_JWT = {
     'REFRESH_TOKEN_LIFETIME': timedelta(days=30),  # Refresh token valid for 30 days
     'ROTATE_REFRESH_TOKENS': True,  # Generate new refresh token on refresh
     'BLACKLIST_AFTER_ROTATION': False,  # Don't require blacklist app
-    'UPDATE_LAST_LOGIN': True,  # Update last_login field on authentication
+    'UPDATE_LAST_LOGIN': False,  # Nothing reads last_login; skip the write on token issue
+    'TOKEN_OBTAIN_SERIALIZER': 'accounts.authentication.VersionedTokenObtainPairSerializer',
+    'TOKEN_REFRESH_SERIALIZER': 'accounts.authentication.VersionedTokenRefreshSerializer',
 }
 
+# Authenticated users are read from an in-process cache for this many
+# seconds, then from the shared cache (see accounts.authentication)
+AUTH_LOCAL_CACHE_TTL = float(os.environ.get('AUTH_LOCAL_CACHE_TTL', '5'))
+AUTH_LOCAL_CACHE_SIZE = 10000
+AUTH_CACHE_TIMEOUT = int(os.environ.get('AUTH_CACHE_TIMEOUT', '300'))
+
+# Home timeline: 'materialized' reads fan-out-on-write TimelineEntry rows,
+# 'join' filters posts by Follow at read time.
+TIMELINE_STRATEGY = os.environ.get('TIMELINE_STRATEGY', 'materialized')
+# Authors with at least this many followers are not fanned out on write;
+# their posts are merged into followers' timelines at read time.
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.environ.get('TIMELINE_FANOUT_MAX_FOLLOWERS', '10000'))
+# A new follow copies at most this many of the author's latest posts into
+# the follower's timeline (in a background job).
+TIMELINE_BACKFILL_POSTS = int(os.environ.get('TIMELINE_BACKFILL_POSTS', '500'))
+
+# Post.like_count updates: 'direct' (one UPDATE per like) or 'buffered'
+# (deltas accumulate in the shared cache and a background job applies them
+# in batches LIKE_FLUSH_DELAY seconds later; see posts/likes.py). 'buffered'
+# needs a cache shared by all processes.
+LIKE_COUNTER_MODE = os.environ.get('LIKE_COUNTER_MODE', 'direct')
+LIKE_FLUSH_DELAY = 1
+
+# Trending posts (posts/trending.py): each post, like and comment adds its
+# weight to the post's score, halving every TRENDING_HALF_LIFE_HOURS.
+# Scores are rebased every TRENDING_EPOCH_HOURS and dropped below
+# TRENDING_MIN_SCORE.
+TRENDING_HALF_LIFE_HOURS = float(os.environ.get('TRENDING_HALF_LIFE_HOURS', '6'))
+TRENDING_EPOCH_HOURS = 6
+TRENDING_WEIGHTS = {'post': 1.0, 'like': 1.0, 'comment': 2.0}
+TRENDING_MIN_SCORE = 0.05
+
+# "Who to follow" (accounts/recommendations.py), rebuilt offline by
+# `manage.py build_recommendations`: the top RECOMMENDATIONS_PER_USER
+# friends-of-friends per user. Accounts following more than
+# RECOMMENDATIONS_MAX_FANOUT users are not walked through; scoring works
+# on chunks of about RECOMMENDATIONS_CHUNK_PATHS paths.
+RECOMMENDATIONS_PER_USER = 20
+RECOMMENDATIONS_MAX_FANOUT = 5000
+RECOMMENDATIONS_CHUNK_PATHS = 2000000
+
+# Background jobs (jobs app), run by `manage.py run_workers`. JOBS_EAGER
+# runs them synchronously at enqueue time instead, for development
+# without a worker.
+JOBS_EAGER = os.environ.get('JOBS_EAGER', 'False') == 'True'
+JOBS_MAX_ATTEMPTS = 5
+JOBS_RETRY_BASE_SECONDS = 5
+JOBS_RETRY_MAX_SECONDS = 3600
+# A running job not finished within its lease is assumed lost and rerun
+JOBS_LEASE_SECONDS = 300
+JOBS_RETENTION_SECONDS = 7 * 86400
+
+# Live events over server-sent events (backend/events.py, posts/live.py).
+# The local broker only reaches streams in the publishing process; point
+# EVENTS_BROKER at a shared broker to run several web processes.
+EVENTS_BROKER = os.environ.get('EVENTS_BROKER', 'backend.events.LocalBroker')
+# Events a stream may fall behind by before it is told to resync
+EVENTS_QUEUE_SIZE = 100
+EVENTS_HEARTBEAT_SECONDS = 15
+# Like deltas are summed and sent at most once per this many seconds
+EVENTS_LIKE_INTERVAL = 1.0
+EVENTS_RETRY_MS = 3000
+
 MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
@@ -91,6 +158,14 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Opt-in query counting/timing with Server-Timing headers and slow or
+# N+1 request logging (see backend/middleware.py)
+REQUEST_INSTRUMENTATION = os.environ.get('REQUEST_INSTRUMENTATION', 'False') == 'True'
+SLOW_REQUEST_MS = int(os.environ.get('SLOW_REQUEST_MS', '500'))
+DUPLICATE_QUERY_THRESHOLD = int(os.environ.get('DUPLICATE_QUERY_THRESHOLD', '5'))
+if REQUEST_INSTRUMENTATION:
+    MIDDLEWARE.insert(0, "backend.middleware.QueryInstrumentationMiddleware")
+
 ROOT_URLCONF = "backend.urls"
 
 TEMPLATES = [
@@ -135,6 +210,62 @@ else:
         }
     }
 
+# Read replicas (see backend/replicas.py): comma-separated database URLs,
+# added as replica1, replica2, ... Safe-method requests to the views in
+# REPLICA_VIEW_MODULES read from a healthy replica, except for users who
+# wrote in the last REPLICA_STICKY_SECONDS.
+DATABASE_REPLICA_URLS = [url.strip() for url in os.environ.get('DATABASE_REPLICA_URLS', '').split(',') if url.strip()]
+for _number, _url in enumerate(DATABASE_REPLICA_URLS, start=1):
+    DATABASES[f'replica{_number}'] = dj_database_url.parse(_url, conn_max_age=600, conn_health_checks=True)
+    # Tests read the test primary through the replica alias; run the
+    # suite without replicas, except for posts.tests.ReplicaDatabaseTests
+    DATABASES[f'replica{_number}']['TEST'] = {'MIRROR': 'default'}
+REPLICA_VIEW_MODULES = ['posts.views', 'accounts.views', 'posts.async_views', 'accounts.async_views']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', '10'))
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get('REPLICA_MAX_LAG_SECONDS', '5'))
+REPLICA_HEALTH_INTERVAL = float(os.environ.get('REPLICA_HEALTH_INTERVAL', '5'))
+if DATABASE_REPLICA_URLS:
+    DATABASE_ROUTERS = ['backend.replicas.ReplicaRouter']
+    MIDDLEWARE.append('backend.replicas.ReplicaMiddleware')
+
+
+# Cache
+# Local memory by default (per process). Point CACHE_BACKEND/CACHE_LOCATION at
+# a shared backend (e.g. django.core.cache.backends.redis.RedisCache) when
+# running several workers so invalidations reach every process. Job workers
+# (the Procfile's `worker`) invalidate caches too, so outside DEBUG they
+# refuse to start on the local-memory cache unless JOBS_EAGER is set.
+CACHES = {
+    "default": {
+        "BACKEND": os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        "LOCATION": os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+# Seconds a cached public profile payload is kept (see accounts/cache.py)
+PROFILE_CACHE_TIMEOUT = int(os.environ.get('PROFILE_CACHE_TIMEOUT', '300'))
+
+# In-process sorted array of the most-followed usernames in front of the
+# prefix index (see accounts/search.py). Size 0 disables it; each process
+# reloads it every USERNAME_HOT_CACHE_TTL seconds.
+USERNAME_HOT_CACHE_SIZE = int(os.environ.get('USERNAME_HOT_CACHE_SIZE', '50000'))
+USERNAME_HOT_CACHE_TTL = int(os.environ.get('USERNAME_HOT_CACHE_TTL', '300'))
+
+
+# CPF validation (see accounts/cpf_validator.py)
+CPF_API_URL = os.environ.get('CPF_API_URL', 'https://www.receitaws.com.br/v1/cpf/{cpf}')
+CPF_API_TIMEOUT = float(os.environ.get('CPF_API_TIMEOUT', '3'))
+# Pooled keep-alive connections to the API per process
+CPF_API_POOL_SIZE = int(os.environ.get('CPF_API_POOL_SIZE', '10'))
+# How long API verdicts are cached: accepted CPFs rarely change status
+CPF_VALID_CACHE_SECONDS = int(os.environ.get('CPF_VALID_CACHE_SECONDS', '86400'))
+CPF_INVALID_CACHE_SECONDS = int(os.environ.get('CPF_INVALID_CACHE_SECONDS', '3600'))
+# 'sync' checks during registration, 'deferred' right after the account is
+# created (rejected accounts are deactivated), 'off' only checks digits locally
+CPF_EXTERNAL_CHECK = os.environ.get('CPF_EXTERNAL_CHECK', 'sync')
+CPF_BREAKER_FAILURES = int(os.environ.get('CPF_BREAKER_FAILURES', '5'))
+CPF_BREAKER_RESET_SECONDS = float(os.environ.get('CPF_BREAKER_RESET_SECONDS', '30'))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -191,10 +322,15 @@ CLOUDINARY_STORAGE = {
     'API_SECRET': os.environ.get('CLOUDINARY_API_SECRET'),
 }
 
-# Storage backends (Django 4.2+)
+# Storage backends (Django 4.2+). Without Cloudinary credentials media
+# files go to MEDIA_ROOT on the local filesystem.
 STORAGES = {
     "default": {
-        "BACKEND": "cloudinary_storage.storage.MediaCloudinaryStorage",
+        "BACKEND": (
+            "cloudinary_storage.storage.MediaCloudinaryStorage"
+            if os.environ.get('CLOUDINARY_CLOUD_NAME')
+            else "django.core.files.storage.FileSystemStorage"
+        ),
     },
     "staticfiles": {
         "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
@@ -202,6 +338,13 @@ STORAGES = {
 }
 
 MEDIA_URL = '/media/'
+MEDIA_ROOT = os.environ.get('MEDIA_ROOT', BASE_DIR / 'media')
+
+# Profile picture pipeline (accounts/avatars.py): uploads are staged on
+# local disk and processed into square WebP variants in the background
+AVATAR_VARIANT_SIZES = (96, 400)
+AVATAR_MAX_PIXELS = 40_000_000
+AVATAR_STAGING_DIR = os.environ.get('AVATAR_STAGING_DIR', os.path.join(tempfile.gettempdir(), 'avatar-staging'))
 
 # File Upload Settings
 FILE_UPLOAD_MAX_MEMORY_SIZE = 5242880  # 5MB
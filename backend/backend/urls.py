@@ -29,6 +29,10 @@ urlpatterns = [
 
     path('api/accounts/', include('accounts.urls')),
     path('api/posts/', include('posts.urls')),
+
+    # Async read endpoints; same responses, served without a thread per request under ASGI
+    path('api/async/accounts/', include('accounts.async_urls')),
+    path('api/async/posts/', include('posts.async_urls')),
 ]
 
 # Serve media files in development
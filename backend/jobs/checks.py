@@ -0,0 +1,29 @@
+"""System checks for running jobs in separate worker processes."""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHE_BACKENDS = ('django.core.cache.backends.locmem.LocMemCache',)
+
+
+def workers_without_shared_cache():
+    """
+    True when jobs run in worker processes (not JOBS_EAGER) outside DEBUG
+    while the default cache lives in each process: cache invalidations
+    made by a job (profiles, auth entries) then never reach the web
+    processes.
+    """
+    return (
+        not settings.JOBS_EAGER and not settings.DEBUG
+        and settings.CACHES['default']['BACKEND'] in LOCAL_CACHE_BACKENDS
+    )
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    if not workers_without_shared_cache():
+        return []
+    return [Warning(
+        'Background jobs run in separate worker processes but the default cache is local to each process.',
+        hint='Point CACHE_BACKEND/CACHE_LOCATION at a shared cache such as Redis, or set JOBS_EAGER=True.',
+        id='jobs.W001',
+    )]
@@ -0,0 +1,15 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from jobs.metrics import queue_stats
+
+
+class Command(BaseCommand):
+    help = 'Print job queue depth per task and recent wait/run latency percentiles as JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--window', type=int, default=900, help='Seconds of finished jobs to sample.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(json.dumps(queue_stats(options['window']), indent=2, default=str))
@@ -0,0 +1,96 @@
+import json
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from jobs.checks import workers_without_shared_cache
+from jobs.metrics import queue_stats
+from jobs.queue import prune_finished, requeue_expired, work, worker_name
+
+logger = logging.getLogger('jobs.workers')
+
+
+def _process_main(index, stop, poll_interval, burst):
+    # Forked children must not share the parent's database connections
+    for connection in connections.all(initialized_only=True):
+        connection.close()
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    work(worker_name(f'/p{index}'), stop, poll_interval, burst)
+
+
+class Command(BaseCommand):
+    help = ('Run background jobs from the database queue with a pool of worker threads or '
+            'processes, requeueing jobs of dead workers and logging queue metrics.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=4, help='Number of workers.')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread',
+                            help='Threads suit I/O-bound tasks; processes sidestep the GIL.')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds an idle worker waits before polling again.')
+        parser.add_argument('--stats-interval', type=float, default=60.0,
+                            help='Seconds between metrics log lines and lease checks.')
+        parser.add_argument('--burst', action='store_true', help='Exit once the queue is empty.')
+
+    def handle(self, *args, **options):
+        if workers_without_shared_cache():
+            raise CommandError(
+                'Workers need a cache shared with the web processes; set CACHE_BACKEND/CACHE_LOCATION '
+                '(see jobs.W001).'
+            )
+        concurrency = max(1, options['concurrency'])
+        if options['pool'] == 'process':
+            stop = multiprocessing.get_context('fork').Event()
+            for connection in connections.all(initialized_only=True):
+                connection.close()
+            workers = [
+                multiprocessing.get_context('fork').Process(
+                    target=_process_main, args=(i, stop, options['poll_interval'], options['burst']), daemon=True,
+                )
+                for i in range(concurrency)
+            ]
+        else:
+            stop = threading.Event()
+            workers = [
+                threading.Thread(
+                    target=work, args=(worker_name(f'/t{i}'), stop, options['poll_interval'], options['burst']),
+                    daemon=True,
+                )
+                for i in range(concurrency)
+            ]
+
+        def shutdown(signum, frame):
+            self.stderr.write('Stopping after the current jobs...')
+            stop.set()
+        previous = {signum: signal.signal(signum, shutdown) for signum in (signal.SIGINT, signal.SIGTERM)}
+
+        requeue_expired()
+        for worker in workers:
+            worker.start()
+        self.stdout.write(f'Started {concurrency} {options["pool"]} workers')
+
+        next_stats = time.monotonic() + options['stats_interval']
+        try:
+            while any(worker.is_alive() for worker in workers):
+                for worker in workers:
+                    worker.join(timeout=min(1.0, options['poll_interval']))
+                if time.monotonic() >= next_stats and not stop.is_set():
+                    self.housekeeping()
+                    next_stats = time.monotonic() + options['stats_interval']
+        finally:
+            for signum, handler in previous.items():
+                signal.signal(signum, handler)
+        self.stdout.write('Workers stopped')
+
+    def housekeeping(self):
+        try:
+            requeue_expired()
+            prune_finished()
+            logger.info('Job queue: %s', json.dumps(queue_stats(), default=str))
+        except Exception:
+            logger.exception('Job queue housekeeping failed')
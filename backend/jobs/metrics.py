@@ -0,0 +1,66 @@
+"""Queue depth and latency figures for run_workers logs and the job_stats command."""
+from datetime import timedelta
+
+from django.db.models import Count, Min, Q
+from django.utils import timezone
+
+from .models import Job
+
+# Finished jobs sampled for latency percentiles
+LATENCY_SAMPLE = 10000
+
+
+def _percentiles(values):
+    if not values:
+        return None
+    values = sorted(values)
+
+    def at(fraction):
+        return round(values[min(len(values) - 1, int(len(values) * fraction))], 1)
+    return {'p50': at(0.50), 'p95': at(0.95), 'p99': at(0.99), 'max': round(values[-1], 1)}
+
+
+def queue_stats(window_seconds=900):
+    """
+    Jobs per status, queued depth per task, and over the last
+    `window_seconds`: wait (ready to started) and run (started to
+    finished) times in milliseconds, per task.
+    """
+    now = timezone.now()
+    by_status = dict(Job.objects.values_list('status').annotate(Count('id')))
+    queued = {
+        row['name']: {
+            'queued': row['queued'],
+            'ready': row['ready'],
+            'oldest_ready_age_s': round((now - row['oldest']).total_seconds(), 1) if row['oldest'] else None,
+        }
+        for row in Job.objects.filter(status=Job.QUEUED).values('name').annotate(
+            queued=Count('id'),
+            ready=Count('id', filter=Q(run_at__lte=now)),
+            oldest=Min('run_at', filter=Q(run_at__lte=now)),
+        )
+    }
+
+    recent = Job.objects.filter(
+        status__in=[Job.DONE, Job.FAILED], finished_at__gte=now - timedelta(seconds=window_seconds),
+        started_at__isnull=False,
+    ).order_by('-finished_at').values_list('name', 'status', 'run_at', 'started_at', 'finished_at')[:LATENCY_SAMPLE]
+    samples = {}
+    for name, status, run_at, started_at, finished_at in recent:
+        entry = samples.setdefault(name, {'done': 0, 'failed': 0, 'wait': [], 'run': []})
+        entry[status] += 1
+        entry['wait'].append(max((started_at - run_at).total_seconds(), 0) * 1000)
+        entry['run'].append((finished_at - started_at).total_seconds() * 1000)
+
+    return {
+        'status': {status: by_status.get(status, 0) for status, _ in Job.STATUS_CHOICES},
+        'queues': queued,
+        'window_seconds': window_seconds,
+        'recent': {
+            name: {
+                'done': entry['done'], 'failed': entry['failed'],
+                'wait_ms': _percentiles(entry['wait']), 'run_ms': _percentiles(entry['run']),
+            }
+            for name, entry in sorted(samples.items())
+        },
+    }
@@ -0,0 +1,239 @@
+"""
+Durable background jobs stored in the database.
+
+Producers call `enqueue`, normally inside the transaction of the write that
+needs the side effect, so the job exists exactly when that write commits.
+Workers (`manage.py run_workers`) claim ready jobs in priority order with
+SELECT ... FOR UPDATE SKIP LOCKED. SQLite has no row locks; there a job is
+claimed with a conditional UPDATE and the worker that changes the row wins,
+and the queue's own statements are serialized within a process since
+SQLite runs one writer at a time anyway.
+
+A job that raises is retried with exponential backoff until max_attempts,
+then marked failed and its task's `on_failure` hook (if any) is called. A
+claimed job holds a lease; if its worker dies the lease expires and the job
+is queued again, so tasks must tolerate running more than once.
+
+With JOBS_EAGER = True, `enqueue` runs the task synchronously instead
+(tests, or development without a worker).
+"""
+import logging
+import os
+import random
+import socket
+import threading
+import traceback
+from contextlib import nullcontext
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+_sqlite_lock = threading.Lock()
+
+
+class Retry(Exception):
+    """Raise from a task to have it retried (after `delay` seconds, else the usual backoff)."""
+
+    def __init__(self, message='', delay=None):
+        super().__init__(message)
+        self.delay = delay
+
+
+def task(name, on_failure=None):
+    """
+    Register the decorated function as task `name`. It is called with the
+    job's kwargs; `on_failure(**kwargs)` runs once the job gives up.
+    """
+    def register(func):
+        func.task_name = name
+        func.on_failure = on_failure
+        _registry[name] = func
+        return func
+    return register
+
+
+def registered(name):
+    return _registry.get(name)
+
+
+def worker_name(suffix=''):
+    return f'{socket.gethostname()}:{os.getpid()}{suffix}'
+
+
+def enqueue(name, kwargs=None, *, priority=0, delay=0, key=None, max_attempts=None):
+    """
+    Queue task `name` with JSON-serializable `kwargs`. With `key`, nothing is
+    added while a job with the same key is still queued; that job is
+    returned instead. Returns None in eager mode.
+    """
+    kwargs = kwargs or {}
+    if settings.JOBS_EAGER:
+        func = _registry[name]
+        func(**kwargs)
+        return None
+
+    job = Job(
+        name=name, kwargs=kwargs, priority=priority, idempotency_key=key,
+        run_at=timezone.now() + timedelta(seconds=delay),
+        max_attempts=max_attempts or settings.JOBS_MAX_ATTEMPTS,
+    )
+    if key is None:
+        job.save()
+        return job
+    try:
+        with transaction.atomic():
+            job.save()
+    except IntegrityError:
+        return Job.objects.filter(idempotency_key=key, status=Job.QUEUED).first()
+    return job
+
+
+def _serialized():
+    return nullcontext() if connection.features.has_select_for_update_skip_locked else _sqlite_lock
+
+
+def claim(worker, limit=1):
+    """Mark up to `limit` ready jobs as running for `worker` and return them."""
+    now = timezone.now()
+    ready = Job.objects.filter(status=Job.QUEUED, run_at__lte=now).order_by('-priority', 'run_at', 'id')
+    changes = {
+        'status': Job.RUNNING, 'attempts': F('attempts') + 1, 'started_at': now, 'worker': worker,
+        'lease_expires_at': now + timedelta(seconds=settings.JOBS_LEASE_SECONDS),
+    }
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic():
+            ids = list(ready.select_for_update(skip_locked=True).values_list('id', flat=True)[:limit])
+            Job.objects.filter(pk__in=ids).update(**changes)
+    else:
+        # Workers in other processes race for the same head of the queue;
+        # look a bit further than `limit` and keep the rows this worker flipped.
+        ids = []
+        with _sqlite_lock:
+            for pk in ready.values_list('id', flat=True)[:limit * 4]:
+                if Job.objects.filter(pk=pk, status=Job.QUEUED).update(**changes):
+                    ids.append(pk)
+                    if len(ids) == limit:
+                        break
+            return list(Job.objects.filter(pk__in=ids).order_by('-priority', 'run_at', 'id'))
+    return list(Job.objects.filter(pk__in=ids).order_by('-priority', 'run_at', 'id'))
+
+
+def backoff(attempts):
+    """Seconds before attempt `attempts + 1`: exponential, capped, with jitter."""
+    base = settings.JOBS_RETRY_BASE_SECONDS
+    delay = min(base * 2 ** (attempts - 1), settings.JOBS_RETRY_MAX_SECONDS)
+    return delay * random.uniform(0.8, 1.2)
+
+
+def execute(job):
+    """Run a claimed job and record the outcome. Returns the final status."""
+    func = _registry.get(job.name)
+    try:
+        if func is None:
+            raise LookupError(f'No task registered as "{job.name}"')
+        func(**job.kwargs)
+    except Exception as exc:
+        with _serialized():
+            status = _record_failure(job, exc)
+        if status == Job.FAILED and func is not None and func.on_failure is not None:
+            try:
+                func.on_failure(**job.kwargs)
+            except Exception:
+                logger.exception('on_failure hook of job %s failed', job)
+        return status
+    with _serialized():
+        Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker).update(
+            status=Job.DONE, finished_at=timezone.now(), lease_expires_at=None,
+        )
+    return Job.DONE
+
+
+def _record_failure(job, exc):
+    mine = Job.objects.filter(pk=job.pk, status=Job.RUNNING, worker=job.worker)
+    now = timezone.now()
+    if job.attempts < job.max_attempts:
+        delay = exc.delay if isinstance(exc, Retry) and exc.delay is not None else backoff(job.attempts)
+        if isinstance(exc, Retry):
+            logger.info('Job %s retrying in %.0fs: %s', job, delay, exc)
+        else:
+            logger.warning('Job %s failed (attempt %d/%d), retrying in %.0fs',
+                           job, job.attempts, job.max_attempts, delay, exc_info=exc)
+        return _requeue(mine, job, now + timedelta(seconds=delay), _describe(exc))
+    logger.error('Job %s failed after %d attempts', job, job.attempts, exc_info=exc)
+    mine.update(status=Job.FAILED, finished_at=now, lease_expires_at=None, last_error=_describe(exc))
+    return Job.FAILED
+
+
+def _describe(exc):
+    return ''.join(traceback.format_exception(exc))[-4000:]
+
+
+def _requeue(rows, job, run_at, error):
+    """Queue a job again; if an identical keyed job is already queued, that one covers it."""
+    try:
+        with transaction.atomic():
+            rows.update(status=Job.QUEUED, run_at=run_at, lease_expires_at=None, last_error=error)
+        return Job.QUEUED
+    except IntegrityError:
+        twin = Job.objects.filter(idempotency_key=job.idempotency_key, status=Job.QUEUED).values_list('pk', flat=True).first()
+        rows.update(status=Job.DONE, finished_at=timezone.now(), lease_expires_at=None,
+                    last_error=f'Superseded by queued job #{twin}\n{error}')
+        return Job.DONE
+
+
+def requeue_expired():
+    """Queue again the running jobs whose lease expired (their worker died). Returns how many."""
+    now = timezone.now()
+    expired = list(Job.objects.filter(status=Job.RUNNING, lease_expires_at__lt=now))
+    for job in expired:
+        logger.warning('Job %s lost its worker %s; queueing it again', job, job.worker)
+        rows = Job.objects.filter(pk=job.pk, status=Job.RUNNING, lease_expires_at__lt=now)
+        if job.attempts >= job.max_attempts:
+            rows.update(status=Job.FAILED, finished_at=now, lease_expires_at=None, last_error='Lease expired')
+        else:
+            _requeue(rows, job, now, 'Lease expired')
+    return len(expired)
+
+
+def prune_finished(older_than=None, batch_size=1000):
+    """Delete done jobs finished more than `older_than` seconds ago (JOBS_RETENTION_SECONDS)."""
+    if older_than is None:
+        older_than = settings.JOBS_RETENTION_SECONDS
+    cutoff = timezone.now() - timedelta(seconds=older_than)
+    finished = Job.objects.filter(status=Job.DONE, finished_at__lt=cutoff)
+    deleted = 0
+    while True:
+        ids = list(finished.values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        deleted += Job.objects.filter(pk__in=ids).delete()[0]
+
+
+def work(worker, stop, poll_interval=1.0, burst=False):
+    """Claim and run jobs one at a time until `stop` is set (or, with `burst`, the queue is empty)."""
+    try:
+        while not stop.is_set():
+            try:
+                jobs = claim(worker)
+                if not jobs:
+                    if burst:
+                        return
+                    stop.wait(poll_interval)
+                    continue
+                for job in jobs:
+                    execute(job)
+            except Exception:
+                # Database trouble; an unfinished job comes back when its lease expires
+                logger.exception('Worker %s failed to claim or record a job', worker)
+                connection.close()
+                stop.wait(poll_interval)
+    finally:
+        connection.close()
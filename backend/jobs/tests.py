@@ -0,0 +1,118 @@
+from datetime import timedelta
+
+from django.core.management import CommandError, call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from .checks import check_shared_cache
+from .metrics import queue_stats
+from .models import Job
+from .queue import Retry, claim, enqueue, execute, requeue_expired, task
+
+calls = []
+failures = []
+
+
+@task('tests.record')
+def record(value):
+    calls.append(value)
+
+
+@task('tests.flaky', on_failure=lambda value: failures.append(value))
+def flaky(value):
+    raise RuntimeError(value)
+
+
+@task('tests.busy')
+def busy():
+    raise Retry('busy', delay=30)
+
+
+class QueueTests(TestCase):
+    def setUp(self):
+        calls.clear()
+        failures.clear()
+
+    def test_idempotency_key_dedups_only_while_queued(self):
+        first = enqueue('tests.record', {'value': 1}, key='k')
+        self.assertEqual(enqueue('tests.record', {'value': 2}, key='k'), first)
+        self.assertEqual(Job.objects.count(), 1)
+
+        [job] = claim('w')
+        execute(job)
+        self.assertEqual(calls, [1])
+        self.assertNotEqual(enqueue('tests.record', {'value': 3}, key='k'), first)
+
+    def test_claims_ready_jobs_by_priority(self):
+        enqueue('tests.record', {'value': 'low'}, priority=-1)
+        enqueue('tests.record', {'value': 'later'}, priority=9, delay=60)
+        enqueue('tests.record', {'value': 'high'}, priority=5)
+        enqueue('tests.record', {'value': 'normal'})
+        for job in claim('w', limit=10):
+            execute(job)
+        self.assertEqual(calls, ['high', 'normal', 'low'])
+        self.assertEqual(Job.objects.get(status=Job.QUEUED).kwargs, {'value': 'later'})
+
+    @override_settings(JOBS_RETRY_BASE_SECONDS=0)
+    def test_retries_with_backoff_then_fails(self):
+        enqueue('tests.flaky', {'value': 'x'}, max_attempts=3)
+        statuses = [execute(job) for _ in range(3) for job in claim('w')]
+        self.assertEqual(statuses, [Job.QUEUED, Job.QUEUED, Job.FAILED])
+        job = Job.objects.get()
+        self.assertEqual(job.attempts, 3)
+        self.assertIn('RuntimeError: x', job.last_error)
+        self.assertEqual(failures, ['x'])
+
+    def test_explicit_retry_delay_and_superseded_retries(self):
+        enqueue('tests.busy', key='busy')
+        [job] = claim('w')
+        enqueue('tests.busy', key='busy')
+        # An identical job is already queued, so this one is not requeued
+        self.assertEqual(execute(job), Job.DONE)
+
+        Job.objects.filter(status=Job.QUEUED).update(run_at=timezone.now())
+        [job] = claim('w')
+        started = timezone.now()
+        self.assertEqual(execute(job), Job.QUEUED)
+        self.assertGreater(Job.objects.get(pk=job.pk).run_at, started + timedelta(seconds=29))
+
+    def test_expired_leases_are_requeued(self):
+        enqueue('tests.record', {'value': 1})
+        claim('dead-worker')
+        Job.objects.update(lease_expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(requeue_expired(), 1)
+        [job] = claim('w')
+        self.assertEqual((job.attempts, job.worker), (2, 'w'))
+
+    def test_eager_mode_runs_immediately(self):
+        with self.settings(JOBS_EAGER=True):
+            self.assertIsNone(enqueue('tests.record', {'value': 'now'}))
+        self.assertEqual((calls, Job.objects.count()), (['now'], 0))
+
+    def test_queue_stats(self):
+        enqueue('tests.record', {'value': 1})
+        enqueue('tests.record', {'value': 2}, delay=60)
+        for job in claim('w'):
+            execute(job)
+        stats = queue_stats()
+        self.assertEqual(stats['status'], {'queued': 1, 'running': 0, 'done': 1, 'failed': 0})
+        self.assertEqual(stats['queues']['tests.record']['ready'], 0)
+        self.assertEqual(stats['recent']['tests.record']['done'], 1)
+
+
+class WorkerTests(TransactionTestCase):
+    @override_settings(DEBUG=True)
+    def test_concurrent_workers_run_each_job_once(self):
+        calls.clear()
+        for value in range(40):
+            enqueue('tests.record', {'value': value})
+        call_command('run_workers', concurrency=4, burst=True, poll_interval=0.01, stdout=open('/dev/null', 'w'))
+        self.assertEqual(sorted(calls), list(range(40)))
+        self.assertEqual(Job.objects.filter(status=Job.DONE).count(), 40)
+
+    @override_settings(JOBS_EAGER=False,
+                       CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_workers_refuse_a_per_process_cache(self):
+        self.assertEqual([message.id for message in check_shared_cache(None)], ['jobs.W001'])
+        with self.assertRaises(CommandError):
+            call_command('run_workers', burst=True, stdout=open('/dev/null', 'w'))
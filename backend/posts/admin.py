@@ -1,5 +1,6 @@
 from django.contrib import admin
 from .models import Post, Like, Comment
+from .search import filter_posts
 
 @admin.register(Comment)
 class CommentAdmin(admin.ModelAdmin):
@@ -11,9 +12,16 @@ class CommentAdmin(admin.ModelAdmin):
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
 	list_display = ('id', 'title', 'author', 'published_at')
-	search_fields = ('title', 'content', 'author__username')
+	# Title and content are matched through the full-text index (posts.search)
+	search_fields = ('author__username',)
 	list_filter = ('published_at',)
 
+	def get_search_results(self, request, queryset, search_term):
+		by_author, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+		if not search_term.strip():
+			return by_author, may_have_duplicates
+		return by_author | filter_posts(queryset, search_term), may_have_duplicates
+
 
 @admin.register(Like)
 class LikeAdmin(admin.ModelAdmin):
@@ -0,0 +1,10 @@
+from django.urls import path
+from . import async_views
+
+urlpatterns = [
+    path('', async_views.post_list),
+    path('timeline/', async_views.timeline),
+    path('<int:pk>/', async_views.post_detail),
+    path('user/<str:username>/', async_views.posts_by_user),
+    path('<int:post_id>/comments/', async_views.comments),
+]
@@ -0,0 +1,74 @@
+"""Async versions of the post read endpoints (see backend.asyncapi)."""
+from django.contrib.auth.models import User
+from django.http import Http404, StreamingHttpResponse
+
+from accounts.authentication import VERSION_CLAIM
+from backend.asyncapi import conditional, list_page, read_view
+from backend.conditional import weak_etag
+from .hydration import ahydrate_posts, post_fingerprint, with_authors
+from .live import event_stream
+from .models import Comment, Post
+from .pagination import CommentCursorPagination, PostCursorPagination, TimelineCursorPagination
+from .serializers import CommentSerializer, PostSerializer
+from .timeline import timeline_sources
+
+
+async def _posts_page(request, paginator, source):
+    async def prepare(rows):
+        await ahydrate_posts(rows, request)
+
+    return await list_page(
+        request, paginator, source,
+        serialize=lambda rows: PostSerializer(rows, many=True, context={'request': request}).data,
+        fingerprint=post_fingerprint, prepare=prepare,
+    )
+
+
+@read_view()
+async def post_list(request):
+    return await _posts_page(request, PostCursorPagination(), with_authors(Post.objects.all()))
+
+
+@read_view(auth_required=True)
+async def timeline(request):
+    sources = timeline_sources(request.user)
+    return await _posts_page(request, TimelineCursorPagination(), sources)
+
+
+@read_view()
+async def posts_by_user(request, username):
+    author_id = await User.objects.filter(username=username).values_list('pk', flat=True).afirst()
+    if author_id is None:
+        raise Http404
+    return await _posts_page(request, PostCursorPagination(), with_authors(Post.objects.filter(author_id=author_id)))
+
+
+@read_view()
+async def post_detail(request, pk):
+    post = await with_authors(Post.objects.filter(pk=pk)).afirst()
+    if post is None:
+        raise Http404
+    await ahydrate_posts([post], request)
+    etag = weak_etag(request.user.pk, post_fingerprint(post))
+    return conditional(request, PostSerializer(post, context={'request': request}).data, etag)
+
+
+@read_view()
+async def comments(request, post_id):
+    return await list_page(
+        request, CommentCursorPagination(), Comment.objects.filter(post_id=post_id).select_related('author'),
+        serialize=lambda rows: CommentSerializer(rows, many=True).data,
+        fingerprint=lambda comment: (comment.pk, comment.author.username),
+        last_modified=lambda rows: max((comment.created_at for comment in rows), default=None),
+    )
+
+
+@read_view(auth_required=True, token_param='access_token', long_lived=True)
+async def stream(request):
+    """Live events for the signed-in user (see posts.live); EventSource passes the token in the URL."""
+    events = event_stream(request.user, expires_at=request.auth['exp'], version=request.auth.get(VERSION_CLAIM, 0))
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
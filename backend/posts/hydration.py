@@ -0,0 +1,108 @@
+"""
+Batched hydration of the per-viewer fields rendered by PostSerializer.
+
+A page of posts is resolved with a fixed number of queries: authors and
+profiles come from the page query itself (select_related), like counts
+from the denormalized Post.like_count column (plus any buffered delta, see
+posts.likes) and the viewer's likes from one IN lookup.
+
+With ?comments=K a page also embeds the latest K comments of each post,
+fetched for the whole page with one ROW_NUMBER() window query.
+"""
+from django.db.models import F, Window
+from django.db.models.functions import RowNumber
+
+from .likes import apending_like_deltas, pending_like_deltas
+from .models import Comment, Like
+
+HYDRATED_ATTR = '_hydrated'
+# Most comments ?comments= may embed per post
+MAX_COMMENT_PREVIEWS = 5
+
+
+def with_authors(queryset):
+    """Join author and author profile so avatars need no extra queries."""
+    return queryset.select_related('author__profile')
+
+
+def _viewer_likes(posts, request):
+    user = getattr(request, 'user', None)
+    if user is None or not user.is_authenticated:
+        return None
+    return Like.objects.filter(user=user, post_id__in=[post.pk for post in posts]).values_list('post_id', flat=True)
+
+
+def comment_preview_size(request):
+    """K from ?comments=K, clamped to MAX_COMMENT_PREVIEWS; 0 when absent or invalid."""
+    params = getattr(request, 'query_params', None)
+    try:
+        size = int(params.get('comments', 0)) if params is not None else 0
+    except ValueError:
+        return 0
+    return max(0, min(size, MAX_COMMENT_PREVIEWS))
+
+
+def _comment_previews(posts, size):
+    """
+    The latest `size` comments of each of `posts`, with their authors, in
+    one query; None when nothing is to be embedded.
+    """
+    post_ids = [post.pk for post in posts if post.comment_count]
+    if not size or not post_ids:
+        return None
+    return Comment.objects.filter(post_id__in=post_ids).select_related('author').only(
+        'id', 'post_id', 'author_id', 'content', 'created_at', 'author__username',
+    ).annotate(
+        recency=Window(RowNumber(), partition_by=F('post_id'), order_by=(F('created_at').desc(), F('id').desc())),
+    ).filter(recency__lte=size).order_by('post_id', 'created_at', 'id')
+
+
+def hydrate_posts(posts, request=None):
+    """Precompute like_count / is_liked (and comment previews) on `posts` in place."""
+    posts = [post for post in posts if not getattr(post, HYDRATED_ATTR, False)]
+    if not posts:
+        return
+    likes = _viewer_likes(posts, request)
+    liked_ids = set(likes) if likes is not None else set()
+    size = comment_preview_size(request)
+    previews = _comment_previews(posts, size)
+    comments = list(previews) if previews is not None else []
+    _apply(posts, liked_ids, pending_like_deltas([post.pk for post in posts]), size, comments)
+
+
+async def ahydrate_posts(posts, request=None):
+    """hydrate_posts for async views."""
+    posts = [post for post in posts if not getattr(post, HYDRATED_ATTR, False)]
+    if not posts:
+        return
+    likes = _viewer_likes(posts, request)
+    liked_ids = {post_id async for post_id in likes} if likes is not None else set()
+    size = comment_preview_size(request)
+    previews = _comment_previews(posts, size)
+    comments = [comment async for comment in previews] if previews is not None else []
+    _apply(posts, liked_ids, await apending_like_deltas([post.pk for post in posts]), size, comments)
+
+
+def _apply(posts, liked_ids, pending, preview_size=0, comments=()):
+    by_post = {}
+    for comment in comments:
+        by_post.setdefault(comment.post_id, []).append(comment)
+    for post in posts:
+        post.hydrated_like_count = max(post.like_count + pending.get(post.pk, 0), 0)
+        post.hydrated_is_liked = post.pk in liked_ids
+        if preview_size:
+            post.hydrated_comments = by_post.get(post.pk, [])
+        setattr(post, HYDRATED_ATTR, True)
+
+
+def post_fingerprint(post):
+    """Everything PostSerializer output depends on, for ETags."""
+    try:
+        avatar = post.author.profile.profile_picture.name
+    except Exception:
+        avatar = None
+    previews = tuple((comment.pk, comment.author.username) for comment in getattr(post, 'hydrated_comments', ()))
+    return (
+        post.pk, post.updated_at, post.hydrated_like_count, post.comment_count,
+        post.hydrated_is_liked, post.author.username, avatar, previews,
+    )
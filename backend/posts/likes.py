@@ -0,0 +1,219 @@
+"""
+Like ingestion and like-counter buffering.
+
+A like is a single INSERT ... SELECT ... ON CONFLICT DO NOTHING: the
+SELECT from posts_post makes a missing post insert nothing, and the
+unique (user, post) constraint makes repeats no-ops, so the common path
+needs no separate existence read. Only when nothing was inserted do we
+look at the post to tell "already liked" from "no such post".
+
+Post.like_count, and the post's trending score (posts/trending.py), are
+then changed according to LIKE_COUNTER_MODE:
+
+'direct'   one F() UPDATE per like/unlike, in the same transaction. An
+           unlike retracts the like's trending weight as of its
+           created_at, which the DELETE returns.
+'buffered' the delta is added to a per-post counter in the shared cache
+           and flushed to the database in batches by `flush_pending_likes`,
+           run by a posts.flush_like_counters job queued LIKE_FLUSH_DELAY
+           seconds after the first buffered like (or by the
+           flush_like_counters command). Reads add the pending delta
+           to the persisted count (`pending_like_deltas`). The flush
+           applies the net delta to trending scores as if it happened at
+           flush time. Needs a cache
+           shared by every process (see CACHES) and running job workers.
+
+Bookkeeping for the flusher, all in the cache:
+- likes:pending:<post>  pending delta for one post (no expiry)
+- likes:epoch           bumped at the start of each flush
+- likes:mark:<epoch>:<post>  set once per post and epoch; the first like
+                        of an epoch appends the post to the dirty log
+- likes:seq / likes:slot:<n>  the dirty log (append-only sequence)
+- likes:flushed         last log slot already flushed
+- likes:recheck         posts flushed last time, re-read once more to
+                        pick up increments that raced with that flush
+- likes:flush-scheduled set while a flush job was queued recently, so
+                        likes do not each try to queue one
+"""
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from backend.counters import adjust_counters
+from jobs.queue import enqueue
+from .live import like_changed
+from .models import Post
+from .trending import bump
+
+PENDING_KEY = 'likes:pending:{}'
+EPOCH_KEY = 'likes:epoch'
+MARK_KEY = 'likes:mark:{}:{}'
+SEQ_KEY = 'likes:seq'
+SLOT_KEY = 'likes:slot:{}'
+FLUSHED_KEY = 'likes:flushed'
+RECHECK_KEY = 'likes:recheck'
+LOCK_KEY = 'likes:flush-lock'
+FLUSH_SCHEDULED_KEY = 'likes:flush-scheduled'
+FLUSH_JOB_KEY = 'likes:flush'
+# A dirty mark only needs to outlive the epoch it belongs to
+MARK_TIMEOUT = 3600
+LOCK_TIMEOUT = 60
+
+INSERT_LIKE = (
+    'INSERT INTO posts_like (user_id, post_id, created_at) '
+    'SELECT %s, id, %s FROM posts_post WHERE id = %s '
+    'ON CONFLICT (user_id, post_id) DO NOTHING'
+)
+DELETE_LIKE = 'DELETE FROM posts_like WHERE user_id = %s AND post_id = %s RETURNING created_at'
+
+
+class PostNotFound(Exception):
+    pass
+
+
+def counter_mode():
+    return settings.LIKE_COUNTER_MODE
+
+
+def add_like(user, post_id):
+    """Like `post_id`; True if a new like was recorded. Raises PostNotFound."""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(INSERT_LIKE, [user.pk, timezone.now(), post_id])
+            created = cursor.rowcount == 1
+        if created:
+            _count(post_id, 1)
+            if counter_mode() != 'buffered':
+                bump(post_id, 'like')
+            like_changed(post_id, user.pk, 1)
+    if not created and not Post.objects.filter(pk=post_id).exists():
+        raise PostNotFound(post_id)
+    return created
+
+
+def remove_like(user, post_id):
+    """Unlike `post_id`; True if a like was removed. Raises PostNotFound."""
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            # Likes have no dependent rows, so a plain DELETE is all
+            # QuerySet.delete() would do
+            cursor.execute(DELETE_LIKE, [user.pk, post_id])
+            row = cursor.fetchone()
+        deleted = row is not None
+        if deleted:
+            _count(post_id, -1)
+            if counter_mode() != 'buffered':
+                bump(post_id, 'like', -1, at=_as_datetime(row[0]))
+            like_changed(post_id, user.pk, -1)
+    if not deleted and not Post.objects.filter(pk=post_id).exists():
+        raise PostNotFound(post_id)
+    return bool(deleted)
+
+
+def _as_datetime(value):
+    # SQLite returns raw DATETIME columns as naive UTC strings
+    if isinstance(value, str):
+        value = parse_datetime(value)
+    if timezone.is_naive(value):
+        value = value.replace(tzinfo=dt_timezone.utc)
+    return value
+
+
+def _count(post_id, delta):
+    if counter_mode() != 'buffered':
+        adjust_counters(Post.objects.filter(pk=post_id), like_count=delta)
+        return
+    # Buffer only once the like row is committed, so a rollback never
+    # leaves a delta behind.
+    transaction.on_commit(lambda: buffer_like_delta(post_id, delta))
+
+
+def buffer_like_delta(post_id, delta):
+    key = PENDING_KEY.format(post_id)
+    cache.add(key, 0, timeout=None)
+    cache.incr(key, delta)
+    cache.add(EPOCH_KEY, 0, timeout=None)
+    if cache.add(MARK_KEY.format(cache.get(EPOCH_KEY, 0), post_id), 1, timeout=MARK_TIMEOUT):
+        cache.add(SEQ_KEY, 0, timeout=None)
+        cache.set(SLOT_KEY.format(cache.incr(SEQ_KEY)), post_id, timeout=None)
+    schedule_flush()
+
+
+def schedule_flush(force=False):
+    """
+    Queue a flush LIKE_FLUSH_DELAY seconds from now unless one was queued
+    within that window (`force` skips the check). The job key keeps at
+    most one flush queued at a time.
+    """
+    delay = settings.LIKE_FLUSH_DELAY
+    if force or cache.add(FLUSH_SCHEDULED_KEY, 1, timeout=delay):
+        enqueue('posts.flush_like_counters', priority=5, delay=delay, key=FLUSH_JOB_KEY)
+
+
+def pending_like_deltas(post_ids):
+    """{post_id: pending delta} for posts with buffered, unflushed likes."""
+    if counter_mode() != 'buffered':
+        return {}
+    return _read_pending(post_ids)
+
+
+async def apending_like_deltas(post_ids):
+    """pending_like_deltas for async views."""
+    if counter_mode() != 'buffered':
+        return {}
+    keys = {PENDING_KEY.format(pk): pk for pk in post_ids}
+    if not keys:
+        return {}
+    return {keys[key]: delta for key, delta in (await cache.aget_many(list(keys))).items() if delta}
+
+
+def _read_pending(post_ids):
+    keys = {PENDING_KEY.format(pk): pk for pk in post_ids}
+    if not keys:
+        return {}
+    return {keys[key]: delta for key, delta in cache.get_many(list(keys)).items() if delta}
+
+
+def flush_pending_likes():
+    """
+    Move buffered deltas into Post.like_count. Returns the number of posts
+    updated, or None if another flusher holds the lock.
+    """
+    if not cache.add(LOCK_KEY, 1, timeout=LOCK_TIMEOUT):
+        return None
+    try:
+        cache.add(EPOCH_KEY, 0, timeout=None)
+        cache.incr(EPOCH_KEY)
+
+        flushed = cache.get(FLUSHED_KEY, 0)
+        last = cache.get(SEQ_KEY, 0)
+        slot_keys = [SLOT_KEY.format(n) for n in range(flushed + 1, last + 1)]
+        post_ids = set(cache.get_many(slot_keys).values())
+        post_ids.update(cache.get(RECHECK_KEY, ()))
+
+        deltas = _read_pending(post_ids)
+        with transaction.atomic():
+            # Posts deleted with likes still buffered have nothing to apply
+            # to; locking the rest keeps them from going away before commit.
+            existing = set(Post.objects.select_for_update().filter(pk__in=deltas).values_list('pk', flat=True))
+            cache.delete_many([PENDING_KEY.format(pk) for pk in deltas.keys() - existing])
+            deltas = {pk: delta for pk, delta in deltas.items() if pk in existing}
+            for post_id, delta in sorted(deltas.items()):
+                adjust_counters(Post.objects.filter(pk=post_id), like_count=delta)
+                bump(post_id, 'like', delta)
+        # Subtract what was applied; likes buffered meanwhile stay pending.
+        # A crash between the commit and here over-counts until the next
+        # reconcile_counters run.
+        for post_id, delta in deltas.items():
+            cache.decr(PENDING_KEY.format(post_id), delta)
+
+        cache.set(FLUSHED_KEY, last, timeout=None)
+        cache.set(RECHECK_KEY, sorted(deltas), timeout=None)
+        cache.delete_many(slot_keys)
+        return len(deltas)
+    finally:
+        cache.delete(LOCK_KEY)
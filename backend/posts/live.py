@@ -0,0 +1,177 @@
+"""
+Live updates pushed to signed-in browsers over server-sent events.
+
+A stream (GET /api/posts/stream/) subscribes to:
+- author:<id>  for every account the user follows: "post" events, so the
+               client can offer to refresh its timeline
+- post:<id>    for the posts the client has on screen (set with
+               POST /api/posts/stream/watch/): like deltas, summed over
+               EVENTS_LIKE_INTERVAL seconds into one "likes" event, and
+               "comment" events carrying the new comment
+- user:<id>    control events; "follows" makes the stream reload its
+               author channels after a follow or unfollow, "revoked" ends
+               it when its token is revoked or the account deactivated
+- stream:<id>  control events for this connection only (watch lists)
+
+Streams send a comment line every EVENTS_HEARTBEAT_SECONDS so proxies
+keep idle connections open, and "resync" when they fell too far behind
+(see backend.events). A stream outlives neither its access token: it ends
+with an "expired" event when the token does, or a "revoked" one, after
+which the client reconnects with a fresh token.
+"""
+import asyncio
+import json
+import time
+
+from django.conf import settings
+
+from accounts.models import Follow
+from backend.asyncapi import detached
+from backend.events import broker, publish, publish_on_commit
+
+# Posts a stream may watch at once
+MAX_WATCHED = 200
+
+
+def author_channel(user_id):
+    return f'author:{user_id}'
+
+
+def post_channel(post_id):
+    return f'post:{post_id}'
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def stream_channel(stream_id):
+    return f'stream:{stream_id}'
+
+
+def post_created(post):
+    publish_on_commit(author_channel(post.author_id), {
+        'type': 'post', 'post': post.pk, 'author': post.author.username, 'actor': post.author_id,
+    })
+
+
+def like_changed(post_id, user_id, delta):
+    publish_on_commit(post_channel(post_id), {
+        'type': 'like', 'coalesce': post_id, 'delta': delta, 'actor': user_id,
+    })
+
+
+def comment_added(post_id, user_id, comment):
+    """`comment` is the CommentSerializer representation."""
+    publish_on_commit(post_channel(post_id), {
+        'type': 'comment', 'post': post_id, 'comment': comment, 'actor': user_id,
+    })
+
+
+def follows_changed(user_id):
+    publish_on_commit(user_channel(user_id), {'type': 'follows'})
+
+
+def access_revoked(user_id, version=None):
+    """
+    End `user_id`'s streams: those opened with a token version below
+    `version`, or all of them without one.
+    """
+    publish_on_commit(user_channel(user_id), {'type': 'revoked', 'version': version})
+
+
+def watch(user_id, stream_id, post_ids):
+    """Make stream `stream_id` of `user_id` watch exactly `post_ids`."""
+    publish(stream_channel(stream_id), {'type': 'watch', 'owner': user_id, 'posts': post_ids[:MAX_WATCHED]})
+
+
+def _frame(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, separators=(",", ":"))}\n\n'
+
+
+def _author_channels(user_id):
+    return {
+        author_channel(followed_id)
+        for followed_id in Follow.objects.filter(follower_id=user_id).values_list('followed_id', flat=True)
+    }
+
+
+async def event_stream(user, expires_at=None, version=0):
+    """
+    Server-sent event frames for `user` until the client disconnects, the
+    unix time `expires_at` passes, or tokens of `version` are revoked.
+    Queries go through `detached`, so an idle stream holds no thread or
+    database connection.
+    """
+    deadline = time.monotonic() + (expires_at - time.time()) if expires_at is not None else None
+    hub = broker()
+    authors = await detached(_author_channels, user.pk)
+    subscription = hub.subscribe(authors | {user_channel(user.pk)}, owner=user.pk)
+    hub.update(subscription, add=[stream_channel(subscription.id)])
+    watched = set()
+    heartbeat = settings.EVENTS_HEARTBEAT_SECONDS
+    like_interval = settings.EVENTS_LIKE_INTERVAL
+    try:
+        yield f'retry: {settings.EVENTS_RETRY_MS}\n' + _frame('ready', {'stream': subscription.id})
+        last_sent = time.monotonic()
+        # Like deltas go out at most once per like_interval; the first
+        # after a quiet spell goes out right away
+        next_likes = 0
+        likes = {}
+        while True:
+            now = time.monotonic()
+            timeout = heartbeat - (now - last_sent)
+            if likes:
+                timeout = min(timeout, next_likes - now)
+            if deadline is not None:
+                timeout = min(timeout, deadline - now)
+            try:
+                await asyncio.wait_for(subscription.wake.wait(), max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+            events, coalesced, overflowed = subscription.drain()
+            frames = []
+            ended = None
+            if overflowed:
+                likes.clear()
+                frames.append(_frame('resync', {}))
+            for event in events:
+                if event['type'] == 'watch':
+                    if event['owner'] == user.pk:
+                        posts = {post_channel(post_id) for post_id in event['posts']}
+                        hub.update(subscription, add=posts, remove=watched - posts)
+                        watched = posts
+                elif event['type'] == 'follows':
+                    fresh = await detached(_author_channels, user.pk)
+                    hub.update(subscription, add=fresh, remove=authors - fresh)
+                    authors = fresh
+                elif event['type'] == 'revoked':
+                    if event['version'] is None or event['version'] > version:
+                        ended = 'revoked'
+                        break
+                else:
+                    frames.append(_frame(event['type'], {k: v for k, v in event.items() if k not in ('type', 'actor')}))
+            for post_id, delta in coalesced.items():
+                likes[post_id] = likes.get(post_id, 0) + delta
+
+            now = time.monotonic()
+            if ended is None and deadline is not None and now >= deadline:
+                ended = 'expired'
+            if ended is not None:
+                yield ''.join(frames) + _frame(ended, {})
+                return
+            if likes and now >= next_likes:
+                deltas = {str(post_id): delta for post_id, delta in likes.items() if delta}
+                if deltas:
+                    frames.append(_frame('likes', deltas))
+                likes = {}
+                next_likes = now + like_interval
+            if frames:
+                yield ''.join(frames)
+                last_sent = now
+            elif now - last_sent >= heartbeat:
+                yield ': ping\n\n'
+                last_sent = now
+    finally:
+        hub.unsubscribe(subscription)
@@ -0,0 +1,214 @@
+import json
+import random
+import statistics
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from accounts.cpf_validator import cpf_check_digits
+from accounts.models import Follow
+from accounts.search import hot_usernames
+from posts.models import Post
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, max(0, int(round(len(ordered) * fraction)) - 1))]
+
+
+class Fixtures:
+    """Sample ids and names the scenarios draw their arguments from."""
+
+    def __init__(self, viewer, rng, sample_size=200):
+        self.viewer = viewer
+        self.rng = rng
+        self.post_ids = list(Post.objects.order_by('-id').values_list('id', flat=True)[:sample_size])
+        last_id = User.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        candidates = rng.sample(range(1, last_id + 1), min(last_id, sample_size * 2))
+        self.usernames = list(
+            User.objects.filter(pk__in=candidates).exclude(pk=viewer.pk).values_list('username', flat=True)
+        )
+        self.own_post_ids = list(Post.objects.filter(author=viewer).values_list('id', flat=True)[:sample_size])
+        words = Post.objects.filter(pk__in=self.post_ids[:20]).values_list('content', flat=True)
+        self.words = [word for content in words for word in content.split()[:3]] or ['post']
+        self.counter = 0
+
+    def post_id(self):
+        return self.rng.choice(self.post_ids)
+
+    def username(self):
+        return self.rng.choice(self.usernames)
+
+    def own_post_id(self):
+        return self.rng.choice(self.own_post_ids or self.post_ids)
+
+    def fresh_name(self):
+        self.counter += 1
+        return f'bench{self.counter}'
+
+    def registration(self):
+        name = self.fresh_name()
+        base = '0' * 9
+        while len(set(base)) == 1:
+            # Repeated-digit CPFs (000..., 111...) pass the check digits but are invalid
+            base = f'{self.rng.randrange(10 ** 9):09d}'
+        digits = base + cpf_check_digits(base)
+        return {
+            'username': name, 'email': f'{name}@example.com',
+            'cpf': f'{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}',
+            'password': 'Bench12345', 'password_confirm': 'Bench12345',
+        }
+
+
+# name -> (method, path, payload builder, authenticated)
+SCENARIOS = {
+    'posts.list': ('get', lambda f: '/api/posts/', None, False),
+    'posts.create': ('post', lambda f: '/api/posts/', lambda f: {'content': 'bench post'}, True),
+    'posts.timeline': ('get', lambda f: '/api/posts/timeline/', None, True),
+    'posts.search': ('get', lambda f: '/api/posts/search/', lambda f: {'q': f.rng.choice(f.words)}, False),
+    'posts.detail': ('get', lambda f: f'/api/posts/{f.post_id()}/', None, False),
+    'posts.update': ('patch', lambda f: f'/api/posts/{f.own_post_id()}/', lambda f: {'content': 'edited'}, True),
+    'posts.by_user': ('get', lambda f: f'/api/posts/user/{f.username()}/', None, False),
+    'posts.like': ('post', lambda f: f'/api/posts/{f.post_id()}/like/', None, True),
+    'posts.unlike': ('post', lambda f: f'/api/posts/{f.post_id()}/unlike/', None, True),
+    'posts.liked': ('get', lambda f: '/api/posts/liked/', None, True),
+    'posts.trending': ('get', lambda f: '/api/posts/trending/', None, False),
+    # A screenful of posts; nobody listens on the stream id, so this measures the publish
+    'posts.stream_watch': ('post', lambda f: '/api/posts/stream/watch/',
+                           lambda f: {'stream': f.rng.randrange(1, 10 ** 6), 'posts': f.post_ids[:20]}, True),
+    'posts.comments': ('get', lambda f: f'/api/posts/{f.post_id()}/comments/', None, False),
+    'posts.comment_create': ('post', lambda f: f'/api/posts/{f.post_id()}/comments/',
+                             lambda f: {'content': 'bench comment'}, True),
+    'accounts.register': ('post', lambda f: '/api/accounts/auth/register/', lambda f: f.registration(), False),
+    'accounts.me': ('get', lambda f: '/api/accounts/auth/me/', None, True),
+    'accounts.profile': ('get', lambda f: '/api/accounts/auth/profile/', lambda f: {'username': f.username()}, False),
+    'accounts.search': ('get', lambda f: '/api/accounts/auth/search/',
+                        lambda f: {'prefix': f.username()[:f.rng.randint(1, 4)]}, False),
+    'accounts.follow': ('post', lambda f: '/api/accounts/auth/follow/', lambda f: {'username': f.username()}, True),
+    'accounts.unfollow': ('post', lambda f: '/api/accounts/auth/unfollow/', lambda f: {'username': f.username()}, True),
+    'accounts.relationships': ('post', lambda f: '/api/accounts/auth/relationships/',
+                               lambda f: {'usernames': f.rng.sample(f.usernames, min(50, len(f.usernames)))}, True),
+    'accounts.bulk_follow': ('post', lambda f: '/api/accounts/auth/bulk-follow/',
+                             lambda f: {'usernames': f.rng.sample(f.usernames, min(10, len(f.usernames)))}, True),
+    'accounts.bulk_unfollow': ('post', lambda f: '/api/accounts/auth/bulk-unfollow/',
+                               lambda f: {'usernames': f.rng.sample(f.usernames, min(10, len(f.usernames)))}, True),
+    'accounts.following': ('get', lambda f: '/api/accounts/auth/following/', None, True),
+    'accounts.user_followers': ('get', lambda f: '/api/accounts/auth/user-followers/',
+                                lambda f: {'username': f.username()}, False),
+    'accounts.user_following': ('get', lambda f: '/api/accounts/auth/user-following/',
+                                lambda f: {'username': f.username()}, False),
+    'accounts.suggestions': ('get', lambda f: '/api/accounts/auth/suggestions/', None, True),
+    'accounts.update_username': ('post', lambda f: '/api/accounts/auth/update-username/',
+                                 lambda f: {'username': f.fresh_name()}, True),
+}
+
+# Routes not driven: password hashing or file uploads dominate them, they
+# are admin-only diagnostics, or they stream (bench_stream covers those).
+SKIPPED = ['posts.delete', 'posts.stream', 'accounts.login', 'accounts.update_profile_picture',
+           'accounts.update_email_password', 'accounts.cache_stats']
+
+
+class Command(BaseCommand):
+    help = ('Drive every posts/ and accounts/ endpoint through the test client and report '
+            'p50/p95/p99 latency, query count and response size as JSON. Writes are rolled back.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=50, help='Measured requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per endpoint.')
+        parser.add_argument('--viewer', help='Username to authenticate as (default: the user following most).')
+        parser.add_argument('--only', nargs='*', help='Only these scenarios (e.g. posts.list accounts.me).')
+        parser.add_argument('--cold-cache', action='store_true', help='Clear the cache before every request.')
+        parser.add_argument('--seed', type=int, default=7)
+        parser.add_argument('--output', help='Also write the JSON report to this file.')
+
+    def handle(self, *args, **options):
+        viewer = self.viewer(options['viewer'])
+        rng = random.Random(options['seed'])
+        names = options['only'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+
+        fixtures = Fixtures(viewer, rng)
+        report = {
+            'vendor': connection.vendor,
+            'users': User.objects.count(),
+            'posts': Post.objects.count(),
+            'follows': Follow.objects.count(),
+            'viewer': viewer.username,
+            'endpoints': {},
+            'skipped': SKIPPED,
+        }
+        # Registration must not reach the external CPF service
+        with override_settings(CPF_EXTERNAL_CHECK='off'):
+            for name in names:
+                report['endpoints'][name] = self.run(name, viewer, fixtures, options)
+                self.stderr.write(f'{name}: p50 {report["endpoints"][name]["p50_ms"]} ms')
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as handle:
+                handle.write(output + '\n')
+        self.stdout.write(output)
+
+    def viewer(self, username):
+        if username:
+            try:
+                return User.objects.get(username=username)
+            except User.DoesNotExist:
+                raise CommandError(f'User "{username}" does not exist')
+        viewer = (User.objects.filter(profile__isnull=False).annotate(following_total=Count('following'))
+                  .order_by('-following_total', 'id').first())
+        if viewer is None:
+            raise CommandError('No users with profiles; run seed_scale first.')
+        return viewer
+
+    def run(self, name, viewer, fixtures, options):
+        method, path, payload, authenticated = SCENARIOS[name]
+        timings, queries, sizes, statuses = [], [], [], Counter()
+        # Each scenario runs in one transaction that is rolled back, so
+        # write endpoints leave the dataset unchanged. What they left in the
+        # caches (buffered like deltas, profiles, hot usernames) goes too.
+        try:
+            with transaction.atomic():
+                client = APIClient(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+                if authenticated:
+                    client.force_authenticate(viewer)
+                for i in range(options['warmup'] + options['requests']):
+                    url = path(fixtures)
+                    data = payload(fixtures) if payload else None
+                    if options['cold_cache']:
+                        cache.clear()
+                    with CaptureQueriesContext(connection) as ctx:
+                        started = time.perf_counter()
+                        response = getattr(client, method)(url, data, format=None if method == 'get' else 'json')
+                        elapsed = (time.perf_counter() - started) * 1000
+                    if i < options['warmup']:
+                        continue
+                    timings.append(elapsed)
+                    queries.append(len(ctx.captured_queries))
+                    sizes.append(len(response.content))
+                    statuses[response.status_code] += 1
+                transaction.set_rollback(True)
+        finally:
+            cache.clear()
+            hot_usernames.reset()
+
+        timings.sort()
+        return {
+            'requests': len(timings),
+            'p50_ms': round(_percentile(timings, 0.50), 3),
+            'p95_ms': round(_percentile(timings, 0.95), 3),
+            'p99_ms': round(_percentile(timings, 0.99), 3),
+            'queries_median': statistics.median(queries),
+            'queries_max': max(queries),
+            'bytes_median': statistics.median(sizes),
+            'status': {str(code): count for code, count in sorted(statuses.items())},
+        }
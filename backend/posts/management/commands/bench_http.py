@@ -0,0 +1,146 @@
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from urllib.parse import urlencode, urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.authentication import tokens_for
+from posts.management.commands.bench_endpoints import Fixtures, _percentile
+from posts.management.commands.bench_endpoints import Command as EndpointsCommand
+
+# name -> (path, query builder, authenticated); the hot read endpoints that
+# exist both under /api/ and /api/async/
+SCENARIOS = {
+    'posts.list': (lambda f: 'posts/', None, False),
+    'posts.timeline': (lambda f: 'posts/timeline/', None, True),
+    'posts.detail': (lambda f: f'posts/{f.post_id()}/', None, False),
+    'posts.by_user': (lambda f: f'posts/user/{f.username()}/', None, False),
+    'posts.comments': (lambda f: f'posts/{f.post_id()}/comments/', None, False),
+    'accounts.profile': (lambda f: 'accounts/auth/profile/', lambda f: {'username': f.username()}, False),
+    'accounts.user_followers': (lambda f: 'accounts/auth/user-followers/', lambda f: {'username': f.username()}, False),
+    'accounts.following': (lambda f: 'accounts/auth/following/', None, True),
+}
+
+
+async def _read_response(reader):
+    """Status code and body length of one HTTP/1.1 response."""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if ':' in line:
+            name, value = line.split(':', 1)
+            headers[name.strip().lower()] = value.strip()
+    if 'content-length' in headers:
+        body = await reader.readexactly(int(headers['content-length']))
+        return status, len(body), headers
+    size = 0
+    while headers.get('transfer-encoding') == 'chunked':
+        chunk = int((await reader.readuntil(b'\r\n')).strip(), 16)
+        await reader.readexactly(chunk + 2)
+        size += chunk
+        if chunk == 0:
+            break
+    return status, size, headers
+
+
+class Command(BaseCommand):
+    help = ('Load-test the read endpoints of a running server over many concurrent keep-alive '
+            'connections and report throughput and latency as JSON. Run it once against the WSGI '
+            'deployment (gunicorn backend.wsgi) and once against the ASGI one (gunicorn backend.asgi '
+            '-k uvicorn.workers.UvicornWorker), with --async-views for the /api/async/ routes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server base URL.')
+        parser.add_argument('--async-views', action='store_true', help='Hit /api/async/ instead of /api/.')
+        parser.add_argument('--connections', type=int, default=64, help='Concurrent keep-alive connections.')
+        parser.add_argument('--duration', type=float, default=20.0, help='Measured seconds.')
+        parser.add_argument('--warmup', type=float, default=3.0, help='Unmeasured seconds before that.')
+        parser.add_argument('--only', nargs='*', help='Only these scenarios; default is a mix of all.')
+        parser.add_argument('--viewer', help='Username to authenticate as (default: the user following most).')
+        parser.add_argument('--seed', type=int, default=7)
+
+    def handle(self, *args, **options):
+        names = options['only'] or list(SCENARIOS)
+        unknown = set(names) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f'Unknown scenarios: {", ".join(sorted(unknown))}')
+        viewer = EndpointsCommand().viewer(options['viewer'])
+        self.fixtures = Fixtures(viewer, random.Random(options['seed']))
+        self.token = tokens_for(viewer)['access']
+        self.prefix = '/api/async/' if options['async_views'] else '/api/'
+        self.names = names
+
+        result = asyncio.run(self.load(options))
+        self.stdout.write(json.dumps(result, indent=2))
+
+    def request(self, host):
+        name = self.fixtures.rng.choice(self.names)
+        path, query, authenticated = SCENARIOS[name]
+        target = self.prefix + path(self.fixtures)
+        if query is not None:
+            target += '?' + urlencode(query(self.fixtures))
+        lines = [f'GET {target} HTTP/1.1', f'Host: {host}', 'Accept: application/json']
+        if authenticated:
+            lines.append(f'Authorization: Bearer {self.token}')
+        return name, ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def load(self, options):
+        url = urlsplit(options['url'])
+        host, port = url.hostname, url.port or 80
+        started = time.perf_counter()
+        measure_from = started + options['warmup']
+        stop_at = measure_from + options['duration']
+        timings, statuses, errors = {name: [] for name in self.names}, Counter(), Counter()
+
+        async def client():
+            reader = writer = None
+            while time.perf_counter() < stop_at:
+                try:
+                    if writer is None:
+                        reader, writer = await asyncio.open_connection(host, port)
+                    name, raw = self.request(url.netloc)
+                    sent = time.perf_counter()
+                    writer.write(raw)
+                    status, _, headers = await _read_response(reader)
+                    done = time.perf_counter()
+                    if headers.get('connection', '').lower() == 'close':
+                        writer.close()
+                        writer = None
+                except (OSError, asyncio.IncompleteReadError, ValueError) as exc:
+                    errors[type(exc).__name__] += 1
+                    if writer is not None:
+                        writer.close()
+                    writer = None
+                    await asyncio.sleep(0.01)
+                    continue
+                if sent >= measure_from:
+                    timings[name].append((done - sent) * 1000)
+                    statuses[status] += 1
+            if writer is not None:
+                writer.close()
+
+        await asyncio.gather(*(client() for _ in range(options['connections'])))
+        every = sorted(t for values in timings.values() for t in values)
+        if not every:
+            raise CommandError(f'No successful requests; errors: {dict(errors)}')
+        return {
+            'url': options['url'] + self.prefix,
+            'connections': options['connections'],
+            'seconds': options['duration'],
+            'requests': len(every),
+            'requests_per_second': round(len(every) / options['duration'], 1),
+            'p50_ms': round(_percentile(every, 0.50), 2),
+            'p95_ms': round(_percentile(every, 0.95), 2),
+            'p99_ms': round(_percentile(every, 0.99), 2),
+            'status': {str(code): count for code, count in sorted(statuses.items())},
+            'errors': dict(errors),
+            'endpoints': {
+                name: {'requests': len(values), 'p50_ms': round(_percentile(sorted(values), 0.50), 2)}
+                for name, values in timings.items() if values
+            },
+        }
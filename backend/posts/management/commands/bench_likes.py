@@ -0,0 +1,116 @@
+import json
+import statistics
+import threading
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.shortcuts import get_object_or_404
+from django.test.utils import override_settings
+
+from backend.counters import adjust_counters
+from posts.likes import add_like, flush_pending_likes
+from posts.models import Like, Post
+
+BENCH_PREFIX = 'bench_like_'
+
+
+def legacy_like(user, post_id):
+    """The like path before insert-or-ignore: existence read, get_or_create, UPDATE."""
+    post = get_object_or_404(Post, pk=post_id)
+    with transaction.atomic():
+        _, created = Like.objects.get_or_create(user=user, post=post)
+        if created:
+            adjust_counters(Post.objects.filter(pk=post.pk), like_count=1)
+    return created
+
+
+MODES = {
+    'legacy': ('direct', legacy_like),
+    'direct': ('direct', add_like),
+    'buffered': ('buffered', add_like),
+}
+
+
+def _percentile(ordered, fraction):
+    return ordered[min(len(ordered) - 1, max(0, int(round(len(ordered) * fraction)) - 1))]
+
+
+class Command(BaseCommand):
+    help = ('Fire many simultaneous likes at one post from worker threads and compare the '
+            'legacy, direct and buffered like paths (throughput, latency, errors, final count).')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--likes', type=int, default=2000, help='Distinct users liking the post.')
+        parser.add_argument('--concurrency', type=int, default=32, help='Worker threads.')
+        parser.add_argument('--modes', nargs='*', default=list(MODES), choices=list(MODES))
+
+    def handle(self, *args, **options):
+        users = self.bench_users(options['likes'])
+        author = users[0]
+        results = {}
+        for mode in options['modes']:
+            post = Post.objects.create(author=author, content='bench_likes')
+            try:
+                results[mode] = self.run(mode, post, users, options['concurrency'])
+            finally:
+                post.delete()
+        self.stdout.write(json.dumps({'likes': len(users), 'concurrency': options['concurrency'],
+                                      'vendor': connection.vendor, 'modes': results}, indent=2))
+
+    def bench_users(self, count):
+        existing = User.objects.filter(username__startswith=BENCH_PREFIX).count()
+        if existing < count:
+            User.objects.bulk_create([
+                User(username=f'{BENCH_PREFIX}{i}', password='!') for i in range(existing, count)
+            ], batch_size=1000)
+        return list(User.objects.filter(username__startswith=BENCH_PREFIX).order_by('id')[:count])
+
+    def run(self, mode, post, users, concurrency):
+        counter_mode, like = MODES[mode]
+        timings, errors = [], []
+        lock = threading.Lock()
+        barrier = threading.Barrier(concurrency)
+
+        def worker(chunk):
+            local_timings, local_errors = [], []
+            barrier.wait()
+            for user in chunk:
+                started = time.perf_counter()
+                try:
+                    like(user, post.pk)
+                except Exception as exc:
+                    local_errors.append(type(exc).__name__)
+                local_timings.append((time.perf_counter() - started) * 1000)
+            connection.close()
+            with lock:
+                timings.extend(local_timings)
+                errors.extend(local_errors)
+
+        with override_settings(LIKE_COUNTER_MODE=counter_mode):
+            threads = [threading.Thread(target=worker, args=(users[i::concurrency],)) for i in range(concurrency)]
+            started = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            elapsed = time.perf_counter() - started
+            flush_started = time.perf_counter()
+            flush_pending_likes()
+            flush_ms = (time.perf_counter() - flush_started) * 1000
+
+        timings.sort()
+        post.refresh_from_db()
+        return {
+            'seconds': round(elapsed, 3),
+            'likes_per_second': round(len(users) / elapsed, 1),
+            'p50_ms': round(_percentile(timings, 0.50), 3),
+            'p95_ms': round(_percentile(timings, 0.95), 3),
+            'p99_ms': round(_percentile(timings, 0.99), 3),
+            'errors': {name: errors.count(name) for name in sorted(set(errors))},
+            'like_rows': Like.objects.filter(post=post).count(),
+            'like_count': post.like_count,
+            'flush_ms': round(flush_ms, 3),
+            'mean_ms': round(statistics.mean(timings), 3),
+        }
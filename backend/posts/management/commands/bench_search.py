@@ -0,0 +1,103 @@
+import json
+import random
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory
+
+from accounts.models import UserProfile
+from backend.counters import adjust_counters
+from posts.management.corpus import text, vocabulary, zipf_cum_weights
+from posts.models import Post
+from posts.views import PostSearchView
+
+BENCH_USERNAME = 'bench_search'
+
+
+class Command(BaseCommand):
+    help = ('Generate a synthetic post corpus and measure /api/posts/search/ '
+            'latency for frequent, rare and multi-word queries.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--posts', type=int, default=0,
+                            help='Grow the corpus to at least this many posts before measuring.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--vocabulary', type=int, default=20000)
+        parser.add_argument('--repeat', type=int, default=20, help='Reads per query class.')
+        parser.add_argument('--seed', type=int, default=1)
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        words = vocabulary(options['vocabulary'], rng)
+        # Zipf weights so a few words are very common and most are rare
+        weights = zipf_cum_weights(len(words))
+
+        if options['posts']:
+            self.generate(options['posts'], options['batch_size'], words, weights, rng)
+
+        total = Post.objects.count()
+        if not total:
+            self.stderr.write('No posts to search; pass --posts N to generate a corpus.')
+            return
+
+        queries = {
+            'frequent': lambda: words[rng.randrange(10)],
+            'rare': lambda: words[rng.randrange(len(words) // 2, len(words))],
+            'two_words': lambda: f'{words[rng.randrange(50)]} {words[rng.randrange(500)]}',
+        }
+        view = PostSearchView.as_view()
+        # Requests must carry a host the settings accept; pagination builds absolute links
+        factory = APIRequestFactory(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        results = {'posts': total, 'vendor': connection.vendor}
+        for name, make_query in queries.items():
+            timings, queries_run, hits = [], [], []
+            for _ in range(options['repeat']):
+                request = factory.get('/api/posts/search/', {'q': make_query()})
+                with CaptureQueriesContext(connection) as ctx:
+                    started = time.perf_counter()
+                    response = view(request)
+                    response.render()
+                    timings.append((time.perf_counter() - started) * 1000)
+                queries_run.append(len(ctx.captured_queries))
+                hits.append(len(response.data['results']))
+            timings.sort()
+            results[name] = {
+                'samples': len(timings),
+                'p50_ms': round(statistics.median(timings), 3),
+                'p95_ms': round(timings[max(int(len(timings) * 0.95) - 1, 0)], 3),
+                'max_ms': round(timings[-1], 3),
+                'queries': max(queries_run),
+                'mean_results': round(statistics.mean(hits), 1),
+            }
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+    def generate(self, target, batch_size, words, weights, rng):
+        author, created = User.objects.get_or_create(username=BENCH_USERNAME)
+        if created:
+            author.set_unusable_password()
+            author.save(update_fields=['password'])
+            UserProfile.objects.create(user=author, cpf='000.000.000-00')
+
+        missing = target - Post.objects.count()
+        started = time.perf_counter()
+        while missing > 0:
+            size = min(batch_size, missing)
+            posts = [
+                Post(
+                    author=author,
+                    title=text(rng, words, weights, 0, 4),
+                    content=text(rng, words, weights, 8, 40),
+                )
+                for _ in range(size)
+            ]
+            with transaction.atomic():
+                Post.objects.bulk_create(posts, batch_size=1000)
+                adjust_counters(UserProfile.objects.filter(user=author), posts_count=size)
+            missing -= size
+            self.stdout.write(f'{target - missing} posts ({time.perf_counter() - started:.1f}s)')
@@ -0,0 +1,165 @@
+import asyncio
+import json
+import resource
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count
+
+from accounts.authentication import tokens_for
+from posts.management.commands.bench_endpoints import _percentile
+
+
+def _rss_kb(pid):
+    """Resident set size of process `pid` in KiB, or None if unknown."""
+    if not pid:
+        return None
+    try:
+        with open(f'/proc/{pid}/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1])
+    except OSError:
+        return None
+    return None
+
+
+class Command(BaseCommand):
+    help = ('Open many idle server-sent event streams (/api/posts/stream/) against a running ASGI '
+            'server (uvicorn backend.asgi:application), hold them, then publish a post from an '
+            'account all of them follow and report connect time, fan-out latency and the server '
+            'memory (--pid) as JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Server base URL.')
+        parser.add_argument('--connections', type=int, default=2000, help='Concurrent streams.')
+        parser.add_argument('--hold', type=float, default=20.0, help='Seconds to keep them idle.')
+        parser.add_argument('--pid', type=int, help='Server process id, to report its memory.')
+        parser.add_argument('--batch', type=int, default=200, help='Streams opened at a time.')
+
+    def handle(self, *args, **options):
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        wanted = options['connections'] + 100
+        if soft < wanted:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (min(wanted, hard), hard))
+            if min(wanted, hard) < wanted:
+                raise CommandError(f'Open file limit {hard} is too low for {options["connections"]} streams.')
+
+        author = User.objects.annotate(follower_total=Count('followers')).order_by('-follower_total', 'id').first()
+        if author is None:
+            raise CommandError('No users; run seed_scale first.')
+        followers = list(User.objects.filter(following__followed=author).order_by('id')[:500])
+        if not followers:
+            raise CommandError(f'Nobody follows {author.username}; run seed_scale first.')
+        self.author_token = tokens_for(author)['access']
+        self.tokens = [tokens_for(user)['access'] for user in followers]
+
+        result = asyncio.run(self.load(options))
+        result.update(author=author.username, distinct_users=len(self.tokens))
+        self.stdout.write(json.dumps(result, indent=2))
+
+    async def open_stream(self, host, port, netloc, token):
+        reader, writer = await asyncio.open_connection(host, port)
+        writer.write((f'GET /api/posts/stream/?access_token={token} HTTP/1.1\r\n'
+                      f'Host: {netloc}\r\nAccept: text/event-stream\r\n\r\n').encode('latin-1'))
+        head = await reader.readuntil(b'\r\n\r\n')
+        status = int(head.split()[1])
+        if status != 200:
+            writer.close()
+            raise ValueError(f'HTTP {status}')
+        buffer = b''
+        while b'event: ready' not in buffer:
+            buffer += await reader.read(4096)
+        return reader, writer
+
+    async def load(self, options):
+        url = urlsplit(options['url'])
+        host, port = url.hostname, url.port or 80
+        pid = options['pid']
+        rss_before = _rss_kb(pid)
+
+        streams, errors = [], Counter()
+        started = time.perf_counter()
+        for offset in range(0, options['connections'], options['batch']):
+            batch = range(offset, min(offset + options['batch'], options['connections']))
+            opened = await asyncio.gather(
+                *(self.open_stream(host, port, url.netloc, self.tokens[i % len(self.tokens)]) for i in batch),
+                return_exceptions=True,
+            )
+            for result in opened:
+                if isinstance(result, Exception):
+                    errors[type(result).__name__] += 1
+                else:
+                    streams.append(result)
+        connect_seconds = time.perf_counter() - started
+        if not streams:
+            raise CommandError(f'No stream could be opened; errors: {dict(errors)}')
+        rss_connected = _rss_kb(pid)
+
+        pings = Counter()
+        delivered = []
+        published = asyncio.get_running_loop().create_future()
+
+        async def listen(index, reader):
+            buffer = b''
+            try:
+                while True:
+                    data = await reader.read(4096)
+                    if not data:
+                        errors['closed'] += 1
+                        return
+                    buffer += data
+                    pings[index] += data.count(b': ping')
+                    if b'event: post' in buffer and published.done():
+                        delivered.append(time.perf_counter() - published.result())
+                        return
+                    buffer = buffer[-64:]
+            except (OSError, asyncio.CancelledError):
+                return
+
+        listeners = [asyncio.ensure_future(listen(i, reader)) for i, (reader, _) in enumerate(streams)]
+        await asyncio.sleep(options['hold'])
+        rss_idle = _rss_kb(pid)
+
+        # One post from the account everyone follows, fanned out to every stream
+        reader, writer = await asyncio.open_connection(host, port)
+        body = json.dumps({'content': 'bench_stream fan-out'}).encode()
+        published.set_result(time.perf_counter())
+        writer.write((f'POST /api/posts/ HTTP/1.1\r\nHost: {url.netloc}\r\n'
+                      f'Authorization: Bearer {self.author_token}\r\nContent-Type: application/json\r\n'
+                      f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n').encode('latin-1') + body)
+        await reader.read()
+        writer.close()
+        deadline = time.perf_counter() + 10
+        while len(delivered) < len(streams) and time.perf_counter() < deadline:
+            await asyncio.sleep(0.05)
+
+        for task in listeners:
+            task.cancel()
+        for _, stream_writer in streams:
+            stream_writer.close()
+        delivered.sort()
+        kib = lambda value: None if value is None else round(value / 1024, 1)
+        return {
+            'url': options['url'],
+            'streams': len(streams),
+            'connect_seconds': round(connect_seconds, 2),
+            'hold_seconds': options['hold'],
+            'streams_with_heartbeat': sum(1 for count in pings.values() if count),
+            'server_rss_mib': {
+                'before': kib(rss_before), 'connected': kib(rss_connected), 'idle': kib(rss_idle),
+            },
+            'server_kib_per_stream': (
+                round((rss_idle - rss_before) / len(streams), 1) if rss_before and rss_idle else None
+            ),
+            'fanout': {
+                'delivered': len(delivered),
+                'p50_ms': round(_percentile(delivered, 0.50) * 1000, 1) if delivered else None,
+                'p99_ms': round(_percentile(delivered, 0.99) * 1000, 1) if delivered else None,
+                'max_ms': round(delivered[-1] * 1000, 1) if delivered else None,
+            },
+            'errors': dict(errors),
+        }
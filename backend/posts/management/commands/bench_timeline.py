@@ -0,0 +1,69 @@
+import json
+import statistics
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIRequestFactory, force_authenticate
+
+from posts.timeline import timeline_sources
+from posts.views import Timeline
+
+
+class Command(BaseCommand):
+    help = ('Compare first-page home timeline latency between the materialized '
+            '(fan-out-on-write) and join (fan-out-on-read) strategies.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=50,
+                            help='Number of most-following users to sample.')
+        parser.add_argument('--repeat', type=int, default=5, help='Reads per user and strategy.')
+        parser.add_argument('--page-size', type=int, default=20)
+
+    def handle(self, *args, **options):
+        users = list(
+            User.objects.annotate(following_total=Count('following'))
+            .filter(following_total__gt=0)
+            .order_by('-following_total')[:options['users']]
+        )
+        if not users:
+            self.stderr.write('No users follow anyone; seed some data first.')
+            return
+
+        # Requests must carry a host the settings accept; pagination builds absolute links
+        factory = APIRequestFactory(SERVER_NAME=settings.ALLOWED_HOSTS[0])
+        results = {}
+        for strategy in ('materialized', 'join'):
+            view = _timeline_view(strategy)
+            timings, queries = [], []
+            for user in users:
+                for _ in range(options['repeat']):
+                    request = factory.get('/api/posts/timeline/', {'page_size': options['page_size']})
+                    force_authenticate(request, user=user)
+                    with CaptureQueriesContext(connection) as ctx:
+                        started = time.perf_counter()
+                        view(request).render()
+                        timings.append((time.perf_counter() - started) * 1000)
+                    queries.append(len(ctx.captured_queries))
+            timings.sort()
+            results[strategy] = {
+                'samples': len(timings),
+                'p50_ms': round(statistics.median(timings), 3),
+                'p95_ms': round(timings[int(len(timings) * 0.95) - 1], 3),
+                'max_ms': round(timings[-1], 3),
+                'queries': max(queries),
+            }
+
+        self.stdout.write(json.dumps(results, indent=2))
+
+
+def _timeline_view(strategy):
+    class StrategyTimeline(Timeline):
+        def get_queryset(self):
+            return timeline_sources(self.request.user, strategy)
+
+    return StrategyTimeline.as_view()
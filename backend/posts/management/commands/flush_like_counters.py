@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.likes import flush_pending_likes
+
+
+class Command(BaseCommand):
+    help = ('Apply like counter deltas buffered in the cache (LIKE_COUNTER_MODE = "buffered") '
+            'to Post.like_count, once or every --interval seconds. The job workers normally do '
+            'this on their own.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=1.0, help='Seconds between flushes.')
+        parser.add_argument('--once', action='store_true', help='Flush once and exit.')
+
+    def handle(self, *args, **options):
+        while True:
+            updated = flush_pending_likes()
+            if updated is None:
+                self.stderr.write('Another flusher holds the lock; skipped.')
+            elif updated or options['once']:
+                self.stdout.write(f'Flushed like counters for {updated} posts')
+            if options['once']:
+                return
+            time.sleep(options['interval'])
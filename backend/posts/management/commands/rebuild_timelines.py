@@ -0,0 +1,39 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.timeline import flag_fanout_posts, rebuild_timeline
+
+
+class Command(BaseCommand):
+    help = 'Rebuild materialized home timelines for all users or the given usernames.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*', help='Only rebuild these users (default: everyone).')
+        parser.add_argument('--chunk-size', type=int, default=500,
+                            help='Users rebuilt per transaction.')
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+        else:
+            # Posts bulk-loaded without fan-out join every follower's rows below
+            flagged = flag_fanout_posts()
+            self.stdout.write(f'Flagged {flagged} posts as fanned out')
+
+        chunk_size = max(1, options['chunk_size'])
+        total = 0
+        last_id = 0
+        while True:
+            chunk = list(users.filter(id__gt=last_id)[:chunk_size])
+            if not chunk:
+                break
+            with transaction.atomic():
+                for user in chunk:
+                    rebuild_timeline(user)
+            total += len(chunk)
+            last_id = chunk[-1].id
+            self.stdout.write(f'Rebuilt {total} timelines')
+
+        self.stdout.write(self.style.SUCCESS(f'Done: {total} timelines rebuilt'))
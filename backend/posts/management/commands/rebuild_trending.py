@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import trending
+
+
+class Command(BaseCommand):
+    help = ('Recompute every trending score (PostScore) from the posts, likes and comments of the '
+            'last hours, for a new install or after changing the TRENDING_* settings. Engagement '
+            'recorded while it runs may be lost; run it off-peak.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows read and written per query.')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        scored = trending.rebuild_scores(batch_size=options['batch_size'])
+        self.stdout.write(f'Scored {scored} posts in {time.perf_counter() - started:.2f} s')
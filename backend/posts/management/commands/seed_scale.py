@@ -0,0 +1,206 @@
+import datetime
+import random
+import time
+from collections import Counter
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from accounts.cpf_validator import cpf_check_digits
+from accounts.models import Follow, UserProfile
+from posts.management.corpus import explicit_timestamps, text, vocabulary, zipf_cum_weights
+from posts.models import Comment, Like, Post
+
+# Mean of a Pareto(alpha) draw, used to scale draws to a requested mean
+PARETO_ALPHA = 1.5
+PARETO_MEAN = PARETO_ALPHA / (PARETO_ALPHA - 1)
+
+
+def _pareto(rng, mean, cap):
+    return min(int(rng.paretovariate(PARETO_ALPHA) * mean / PARETO_MEAN), cap)
+
+
+def _cpfs(rng, count, taken):
+    """`count` distinct valid CPFs not in `taken`."""
+    cpfs = []
+    while len(cpfs) < count:
+        for number in rng.sample(range(10 ** 9), count - len(cpfs)):
+            base = f'{number:09d}'
+            if len(set(base)) == 1:
+                continue
+            digits = base + cpf_check_digits(base)
+            cpf = f'{digits[:3]}.{digits[3:6]}.{digits[6:9]}-{digits[9:]}'
+            if cpf not in taken:
+                taken.add(cpf)
+                cpfs.append(cpf)
+    return cpfs
+
+
+class Command(BaseCommand):
+    help = ('Bulk-generate users with profiles and valid CPFs, a power-law follow graph, '
+            'and posts with likes and comments, deterministically from --seed.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--avg-follows', type=float, default=30,
+                            help='Mean out-degree of the follow graph.')
+        parser.add_argument('--avg-likes', type=float, default=8, help='Mean likes per post.')
+        parser.add_argument('--avg-comments', type=float, default=2, help='Mean comments per post.')
+        parser.add_argument('--days', type=int, default=90, help='Spread timestamps over this many days.')
+        parser.add_argument('--prefix', default='seed_', help='Username prefix for generated users.')
+        parser.add_argument('--password', default='Seed12345', help='Password of every generated user.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--skip-timelines', action='store_true',
+                            help='Do not rebuild materialized timelines afterwards.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=prefix).exists():
+            raise CommandError(f'Users starting with "{prefix}" already exist; pass another --prefix.')
+        n_users, n_posts = options['users'], options['posts']
+        if n_users < 2:
+            raise CommandError('--users must be at least 2.')
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = max(1, options['batch_size'])
+        self.now = timezone.now()
+        self.span = datetime.timedelta(days=options['days']).total_seconds()
+        self.started = time.perf_counter()
+
+        user_ids = self.create_users(n_users, prefix, options['password'])
+
+        # Popularity is a Zipf law over a random permutation of the users
+        by_popularity = user_ids[:]
+        self.rng.shuffle(by_popularity)
+        popularity = zipf_cum_weights(n_users)
+
+        follows = self.follow_graph(user_ids, by_popularity, popularity, options['avg_follows'])
+        # Popular users also post more, with a flatter curve
+        authors = self.rng.choices(by_popularity, cum_weights=zipf_cum_weights(n_users, 0.6), k=n_posts)
+
+        followers = Counter(followed for _, followed in follows)
+        following = Counter(follower for follower, _ in follows)
+        posts_count = Counter(authors)
+        self.create_profiles(user_ids, followers, following, posts_count)
+        self.create_follows(follows)
+        self.create_posts(authors, user_ids, options['avg_likes'], options['avg_comments'])
+
+        if not options['skip_timelines']:
+            call_command('rebuild_timelines', stdout=self.stdout)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded {n_users} users, {len(follows)} follows and {n_posts} posts '
+            f'in {time.perf_counter() - self.started:.1f}s'
+        ))
+
+    def progress(self, message):
+        self.stdout.write(f'[{time.perf_counter() - self.started:7.1f}s] {message}')
+
+    def past(self, after=None):
+        """A random timestamp in the seeded window (after `after` if given)."""
+        start = after or self.now - datetime.timedelta(seconds=self.span)
+        window = (self.now - start).total_seconds()
+        return start + datetime.timedelta(seconds=self.rng.random() * window)
+
+    def create_users(self, count, prefix, password):
+        password_hash = make_password(password)
+        ids = []
+        for start in range(0, count, self.batch_size):
+            users = [
+                User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com',
+                     password=password_hash, date_joined=self.past())
+                for i in range(start, min(start + self.batch_size, count))
+            ]
+            with transaction.atomic():
+                ids += [user.pk for user in User.objects.bulk_create(users)]
+            self.progress(f'{len(ids)} users')
+        return ids
+
+    def follow_graph(self, user_ids, by_popularity, popularity, avg_follows):
+        """(follower_id, followed_id) pairs; out-degree Pareto, targets Zipf."""
+        edges = []
+        cap = len(user_ids) - 1
+        for follower in user_ids:
+            degree = _pareto(self.rng, avg_follows, cap)
+            targets = set()
+            for _ in range(3):
+                missing = degree - len(targets)
+                if missing <= 0:
+                    break
+                targets.update(self.rng.choices(by_popularity, cum_weights=popularity, k=missing))
+                targets.discard(follower)
+            edges += [(follower, followed) for followed in list(targets)[:degree]]
+        self.progress(f'{len(edges)} follows planned')
+        return edges
+
+    def create_profiles(self, user_ids, followers, following, posts_count):
+        taken = set(UserProfile.objects.values_list('cpf', flat=True))
+        cpfs = _cpfs(self.rng, len(user_ids), taken)
+        profiles = [
+            UserProfile(
+                user_id=user_id, cpf=cpf,
+                followers_count=followers[user_id],
+                following_count=following[user_id],
+                posts_count=posts_count[user_id],
+            )
+            for user_id, cpf in zip(user_ids, cpfs)
+        ]
+        self.bulk(UserProfile, profiles, 'profiles')
+
+    def create_follows(self, edges):
+        with explicit_timestamps(Follow):
+            self.bulk(Follow, [
+                Follow(follower_id=follower, followed_id=followed, created_at=self.past())
+                for follower, followed in edges
+            ], 'follows')
+
+    def create_posts(self, authors, user_ids, avg_likes, avg_comments):
+        words = vocabulary(5000, self.rng)
+        weights = zipf_cum_weights(len(words))
+        # Sorted so ids grow with publication time, as they do in production
+        published = sorted(self.past() for _ in authors)
+        cap = len(user_ids)
+
+        created = 0
+        with explicit_timestamps(Post, Like, Comment):
+            for start in range(0, len(authors), self.batch_size):
+                posts, likes, comments = [], [], []
+                for author, published_at in zip(authors[start:start + self.batch_size],
+                                                published[start:start + self.batch_size]):
+                    post = Post(
+                        author_id=author, title=text(self.rng, words, weights, 0, 5),
+                        content=text(self.rng, words, weights, 5, 40),
+                        published_at=published_at, created_at=published_at,
+                    )
+                    likers = self.rng.sample(user_ids, _pareto(self.rng, avg_likes, cap))
+                    commenters = self.rng.choices(user_ids, k=_pareto(self.rng, avg_comments, cap))
+                    post.like_count, post.comment_count = len(likers), len(commenters)
+                    posts.append(post)
+                    likes.append(likers)
+                    comments.append(commenters)
+
+                with transaction.atomic():
+                    Post.objects.bulk_create(posts, batch_size=1000)
+                    Like.objects.bulk_create([
+                        Like(user_id=user_id, post_id=post.pk, created_at=self.past(post.published_at))
+                        for post, likers in zip(posts, likes) for user_id in likers
+                    ], batch_size=1000)
+                    Comment.objects.bulk_create([
+                        Comment(author_id=user_id, post_id=post.pk, content=text(self.rng, words, weights, 2, 20),
+                                created_at=self.past(post.published_at))
+                        for post, commenters in zip(posts, comments) for user_id in commenters
+                    ], batch_size=1000)
+                created += len(posts)
+                self.progress(f'{created} posts')
+
+    def bulk(self, model, objects, label):
+        for start in range(0, len(objects), self.batch_size):
+            with transaction.atomic():
+                model.objects.bulk_create(objects[start:start + self.batch_size], batch_size=1000)
+        self.progress(f'{len(objects)} {label}')
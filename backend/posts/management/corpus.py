@@ -0,0 +1,40 @@
+"""
+Synthetic-data helpers shared by the seeding and benchmark commands.
+"""
+import itertools
+from contextlib import contextmanager
+
+SYLLABLES = ('ca', 'fe', 'ma', 'ra', 'to', 'li', 'ne', 'so', 'pa', 'ri', 'de', 'vo', 'lu', 'ta', 'ço', 'ão')
+
+
+def vocabulary(size, rng):
+    """`size` distinct pseudo-Portuguese words, sorted."""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))))
+    return sorted(words)
+
+
+def zipf_cum_weights(n, exponent=1.0):
+    """Cumulative weights for rng.choices: item i has weight 1 / (i + 1) ** exponent."""
+    return list(itertools.accumulate(1.0 / (rank + 1) ** exponent for rank in range(n)))
+
+
+def text(rng, words, cum_weights, low, high):
+    return ' '.join(rng.choices(words, cum_weights=cum_weights, k=rng.randint(low, high)))
+
+
+@contextmanager
+def explicit_timestamps(*models):
+    """Let bulk_create keep the timestamps we set instead of auto_now_add."""
+    fields = [
+        field for model in models for field in model._meta.concrete_fields
+        if getattr(field, 'auto_now_add', False)
+    ]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
@@ -0,0 +1,58 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_timelines(apps, schema_editor):
+    """Fan out existing posts of non-celebrity authors to their followers."""
+    Follow = apps.get_model('accounts', 'Follow')
+    Post = apps.get_model('posts', 'Post')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    threshold = getattr(settings, 'TIMELINE_FANOUT_MAX_FOLLOWERS', 10000)
+
+    fanout_authors = (
+        Follow.objects.values('followed_id')
+        .annotate(total=Count('id'))
+        .filter(total__lt=threshold)
+        .values_list('followed_id', flat=True)
+    )
+    for author_id in fanout_authors.iterator():
+        follower_ids = list(Follow.objects.filter(followed_id=author_id).values_list('follower_id', flat=True))
+        posts = Post.objects.filter(author_id=author_id).values_list('id', 'published_at')
+        batch = []
+        for post_id, published_at in posts.iterator():
+            batch += [TimelineEntry(owner_id=owner_id, post_id=post_id, published_at=published_at)
+                      for owner_id in follower_ids]
+            if len(batch) >= 1000:
+                TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0005_alter_post_options_alter_post_author_and_more'),
+        ('accounts', '0005_remove_follow_accounts_fo_followe_6d6ab4_idx_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('published_at', models.DateTimeField()),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.post')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['owner', '-published_at'], name='posts_timel_owner_i_663128_idx')],
+                'unique_together': {('owner', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
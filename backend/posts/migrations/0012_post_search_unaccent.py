@@ -0,0 +1,66 @@
+from django.db import migrations
+
+# Make PostgreSQL search accent-insensitive like the SQLite FTS5 tokenizer
+# (remove_diacritics): a text search configuration that runs unaccent before
+# the Portuguese stemmer. A regconfig constant keeps to_tsvector immutable,
+# so the generated column can use it directly.
+
+SEARCH_VECTOR = """
+    ALTER TABLE posts_post ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('{config}', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('{config}', coalesce(content, '')), 'B')
+    ) STORED
+"""
+
+DROP_SEARCH_VECTOR = [
+    "DROP INDEX IF EXISTS posts_post_search_idx",
+    "ALTER TABLE posts_post DROP COLUMN IF EXISTS search_vector",
+]
+
+CREATE_INDEX = "CREATE INDEX posts_post_search_idx ON posts_post USING GIN (search_vector)"
+
+FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS unaccent",
+    "CREATE TEXT SEARCH CONFIGURATION portuguese_unaccent (COPY = portuguese)",
+    """
+    ALTER TEXT SEARCH CONFIGURATION portuguese_unaccent
+    ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem
+    """,
+    *DROP_SEARCH_VECTOR,
+    SEARCH_VECTOR.format(config='portuguese_unaccent'),
+    CREATE_INDEX,
+]
+
+BACKWARD = [
+    *DROP_SEARCH_VECTOR,
+    SEARCH_VECTOR.format(config='portuguese'),
+    CREATE_INDEX,
+    "DROP TEXT SEARCH CONFIGURATION IF EXISTS portuguese_unaccent",
+]
+
+
+def _run(schema_editor, statements):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def unaccent_search(apps, schema_editor):
+    _run(schema_editor, FORWARD)
+
+
+def accented_search(apps, schema_editor):
+    _run(schema_editor, BACKWARD)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0011_post_score'),
+    ]
+
+    operations = [
+        migrations.RunPython(unaccent_search, accented_search),
+    ]
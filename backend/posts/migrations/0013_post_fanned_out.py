@@ -0,0 +1,42 @@
+# Generated by Django 5.2.9 on 2026-10-18 05:39
+
+from importlib import import_module
+
+from django.conf import settings
+from django.db import migrations, models
+
+search_index = import_module('posts.migrations.0009_post_search_index')
+
+
+def flag_fanned_out_posts(apps, schema_editor):
+    """Existing posts of non-celebrity authors have their TimelineEntry rows (see 0006)."""
+    Post = apps.get_model('posts', 'Post')
+    UserProfile = apps.get_model('accounts', 'UserProfile')
+    threshold = getattr(settings, 'TIMELINE_FANOUT_MAX_FOLLOWERS', 10000)
+    celebrities = UserProfile.objects.filter(followers_count__gte=threshold).values('user_id')
+    Post.objects.exclude(author_id__in=celebrities).update(fanned_out=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0012_post_search_unaccent'),
+        ('accounts', '0006_userprofile_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        # Undoing AddField rebuilds the table again
+        migrations.RunPython(migrations.RunPython.noop, search_index.restore_search_triggers),
+        migrations.AddField(
+            model_name='post',
+            name='fanned_out',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RunPython(search_index.restore_search_triggers, migrations.RunPython.noop),
+        migrations.RunPython(flag_fanned_out_posts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('fanned_out', False)), fields=['author', '-published_at'], name='post_pending_fanout_idx'),
+        ),
+    ]
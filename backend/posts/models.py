@@ -9,12 +9,23 @@ class Post(models.Model):
     content = models.TextField()
     published_at = models.DateTimeField(auto_now_add=True)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Denormalized counters, maintained with F() updates by the write views
+    like_count = models.PositiveIntegerField(default=0)
+    comment_count = models.PositiveIntegerField(default=0)
+    # Set once the post has TimelineEntry rows for its author's followers;
+    # until then (or for good, for celebrity authors) it is merged at read time
+    fanned_out = models.BooleanField(default=False)
 
     class Meta:
         ordering = ['-published_at']
         indexes = [
             models.Index(fields=['author', '-published_at']),
             models.Index(fields=['-published_at']),
+            models.Index(
+                fields=['author', '-published_at'], name='post_pending_fanout_idx',
+                condition=models.Q(fanned_out=False),
+            ),
         ]
 
     def __str__(self):
@@ -30,7 +41,7 @@ class Like(models.Model):
     class Meta:
         unique_together = ('user', 'post')
         indexes = [
-            models.Index(fields=['user', '-created_at']),
+            models.Index(fields=['user', '-created_at', '-id']),
             models.Index(fields=['post']),
         ]
 
@@ -53,3 +64,44 @@ class Comment(models.Model):
 
     def __str__(self):
         return f"{self.author.username}: {self.content[:40]}"
+
+
+class TimelineEntry(models.Model):
+    """
+    Materialized home-timeline row: `post` delivered to `owner`.
+
+    Written when a post is created (fan-out on write) and backfilled on
+    follow. Posts by authors above TIMELINE_FANOUT_MAX_FOLLOWERS are not
+    fanned out; they are merged in at read time instead.
+    """
+    owner = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    published_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('owner', 'post')
+        indexes = [
+            models.Index(fields=['owner', '-published_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.owner.username} ← {self.post_id}"
+
+
+class PostScore(models.Model):
+    """
+    Trending score of a post, stored relative to a decay epoch (see
+    posts/trending.py). Rows are kept by engagement and pruned once they
+    decay below TRENDING_MIN_SCORE.
+    """
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='trending_score')
+    epoch = models.IntegerField()
+    score = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-epoch', '-score', '-post']),
+        ]
+
+    def __str__(self):
+        return f"{self.post_id}: {self.score:.3f} @ {self.epoch}"
@@ -0,0 +1,37 @@
+from backend.pagination import KeysetPagination, MergedKeysetPagination
+
+
+class PostCursorPagination(KeysetPagination):
+    """Newest posts first, keyed on (published_at, id)."""
+    ordering = ('-published_at', '-id')
+
+
+class LikedPostCursorPagination(KeysetPagination):
+    """Most recently liked first, keyed on (Like.created_at, Like.id)."""
+    ordering = ('-liked_at', '-like_id')
+
+
+class CommentCursorPagination(KeysetPagination):
+    """Oldest comments first, keyed on (created_at, id)."""
+    ordering = ('created_at', 'id')
+    page_size = 50
+
+
+class TimelineCursorPagination(MergedKeysetPagination):
+    """Home timeline, newest first, keyed on (feed_at, id)."""
+    ordering = ('-feed_at', '-id')
+
+
+class TrendingCursorPagination(KeysetPagination):
+    """Highest trending score first, keyed on PostScore's (epoch, score, post)."""
+    ordering = ('-trend_epoch', '-trend_score', '-trend_post')
+
+
+class SearchCursorPagination(KeysetPagination):
+    """Best match first, keyed on (rank, id); pages come from the search index."""
+    ordering = ('-rank', '-id')
+
+    def fetch(self, search, cursor, limit):
+        if cursor is None:
+            return search.page(limit=limit)
+        return search.page(after=cursor[0], reverse=cursor[1], limit=limit)
@@ -0,0 +1,149 @@
+"""
+Full-text search over posts.
+
+PostgreSQL: `posts_post.search_vector`, a generated tsvector column (title
+weighted above content) behind a GIN index, ranked with ts_rank_cd. Its
+text search configuration unaccents before stemming (migration 0012), so
+matching is accent-insensitive as on SQLite.
+SQLite: `posts_post_fts`, an FTS5 external-content table kept in sync by
+triggers, ranked with bm25. Both are created by migration 0009 and are
+maintained by the database on insert/update/delete, so the write views
+never reindex by hand. Other backends fall back to icontains with a flat
+rank.
+
+Results are paged by keyset on (rank, id): the index returns one page of
+ids and the posts themselves are loaded with a single IN query.
+"""
+import re
+
+from django.db import connection
+from django.db.models import BooleanField, Q
+from django.db.models.expressions import RawSQL
+
+from .hydration import with_authors
+from .models import Post
+
+SEARCH_CONFIG = 'portuguese_unaccent'
+MAX_QUERY_LENGTH = 200
+MAX_TERMS = 8
+TERM_PATTERN = re.compile(r'\w+')
+
+# bm25 column weights (title, content), mirroring setweight A/B on PostgreSQL
+FTS5_WEIGHTS = (2.5, 1.0)
+
+
+def search_terms(query):
+    """Words of `query`; punctuation and search operators are dropped."""
+    return TERM_PATTERN.findall((query or '')[:MAX_QUERY_LENGTH].lower())[:MAX_TERMS]
+
+
+def _fts5_match(terms):
+    """Quoted terms, implicitly ANDed; quoting keeps FTS5 syntax out of user input."""
+    return ' '.join(f'"{term}"' for term in terms)
+
+
+def _seek_clause(score, key, after, reverse):
+    if after is None:
+        return '', []
+    op = '>' if reverse else '<'
+    rank, pk = after
+    return f' AND ({score} {op} %s OR ({score} = %s AND {key} {op} %s))', [rank, rank, pk]
+
+
+def _sqlite_matches(terms, after, reverse, limit):
+    score = '-bm25(posts_post_fts, {}, {})'.format(*FTS5_WEIGHTS)
+    seek, params = _seek_clause(score, 'rowid', after, reverse)
+    direction = 'ASC' if reverse else 'DESC'
+    sql = (
+        f'SELECT rowid, {score} AS score FROM posts_post_fts '
+        f'WHERE posts_post_fts MATCH %s{seek} '
+        f'ORDER BY score {direction}, rowid {direction} LIMIT %s'
+    )
+    return sql, [_fts5_match(terms), *params, limit]
+
+
+def _postgres_matches(terms, after, reverse, limit):
+    # ts_rank_cd returns real; the cursor's rank comes back as a double, and
+    # real = double never matches, so ties at a page boundary would be skipped
+    score = 'ts_rank_cd(search_vector, query)::float8'
+    seek, params = _seek_clause(score, 'id', after, reverse)
+    direction = 'ASC' if reverse else 'DESC'
+    sql = (
+        f'SELECT id, {score} AS score FROM posts_post, plainto_tsquery(%s::regconfig, %s) query '
+        f'WHERE search_vector @@ query{seek} '
+        f'ORDER BY score {direction}, id {direction} LIMIT %s'
+    )
+    return sql, [SEARCH_CONFIG, ' '.join(terms), *params, limit]
+
+
+INDEX_QUERIES = {
+    'sqlite': _sqlite_matches,
+    'postgresql': _postgres_matches,
+}
+
+
+def _fallback_filter(terms):
+    predicate = Q()
+    for term in terms:
+        predicate &= Q(title__icontains=term) | Q(content__icontains=term)
+    return predicate
+
+
+def ranked_matches(terms, after=None, reverse=False, limit=20):
+    """
+    Up to `limit` (post_id, rank) pairs, best match first (worst first when
+    `reverse`), strictly after the (rank, id) key `after`.
+    """
+    if not terms:
+        return []
+    build = INDEX_QUERIES.get(connection.vendor)
+    if build is None:
+        queryset = Post.objects.filter(_fallback_filter(terms))
+        if after is not None:
+            queryset = queryset.filter(**{'id__gt' if reverse else 'id__lt': after[1]})
+        ids = queryset.order_by('id' if reverse else '-id').values_list('id', flat=True)[:limit]
+        return [(pk, 0.0) for pk in ids]
+
+    sql, params = build(terms, after, reverse, limit)
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [(pk, float(rank)) for pk, rank in cursor.fetchall()]
+
+
+def filter_posts(queryset, query):
+    """Restrict `queryset` to posts matching `query`, without ranking."""
+    terms = search_terms(query)
+    if not terms:
+        return queryset.none()
+    vendor = connection.vendor
+    if vendor == 'sqlite':
+        sql = 'posts_post.id IN (SELECT rowid FROM posts_post_fts WHERE posts_post_fts MATCH %s)'
+        params = [_fts5_match(terms)]
+    elif vendor == 'postgresql':
+        sql = 'posts_post.search_vector @@ plainto_tsquery(%s::regconfig, %s)'
+        params = [SEARCH_CONFIG, ' '.join(terms)]
+    else:
+        return queryset.filter(_fallback_filter(terms))
+    return queryset.filter(RawSQL(sql, params, output_field=BooleanField()))
+
+
+class PostSearch:
+    """A ranked search over posts, fetched one keyset page at a time."""
+
+    def __init__(self, query, queryset=None):
+        self.terms = search_terms(query)
+        self.queryset = queryset if queryset is not None else with_authors(Post.objects.all())
+
+    def page(self, after=None, reverse=False, limit=20):
+        """Posts with a `rank` attribute, in ranked order."""
+        matches = ranked_matches(self.terms, after, reverse, limit)
+        if not matches:
+            return []
+        posts = self.queryset.in_bulk([pk for pk, _ in matches])
+        page = []
+        for pk, rank in matches:
+            post = posts.get(pk)
+            if post is not None:
+                post.rank = rank
+                page.append(post)
+        return page
@@ -1,5 +1,7 @@
 from rest_framework import serializers
+from accounts.avatars import avatar_url
 from .models import Post, Comment
+from .hydration import HYDRATED_ATTR, comment_preview_size, hydrate_posts
 class CommentSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     post = serializers.PrimaryKeyRelatedField(read_only=True)
@@ -10,37 +12,60 @@ class CommentSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'author', 'author_username', 'created_at', 'post']
 
 
+class PostListSerializer(serializers.ListSerializer):
+    """Hydrates the whole page in bulk before rendering each post."""
+
+    def to_representation(self, data):
+        posts = list(data.all() if hasattr(data, 'all') else data)
+        hydrate_posts(posts, self.context.get('request'))
+        return super().to_representation(posts)
+
+
 class PostSerializer(serializers.ModelSerializer):
     author_username = serializers.CharField(source='author.username', read_only=True)
     author_profile_picture = serializers.SerializerMethodField(read_only=True)
     like_count = serializers.SerializerMethodField(read_only=True)
     is_liked = serializers.SerializerMethodField(read_only=True)
+    # Only with ?comments=K: the latest K comments, oldest first
+    latest_comments = serializers.SerializerMethodField(read_only=True)
 
     class Meta:
         model = Post
-        fields = ['id', 'title', 'author', 'author_username', 'author_profile_picture', 'content', 'created_at', 'published_at', 'like_count', 'is_liked']
-        read_only_fields = ['author', 'created_at', 'published_at']
+        fields = ['id', 'title', 'author', 'author_username', 'author_profile_picture', 'content', 'created_at', 'published_at', 'like_count', 'comment_count', 'is_liked', 'latest_comments']
+        read_only_fields = ['author', 'created_at', 'published_at', 'comment_count']
+        list_serializer_class = PostListSerializer
+
+    def get_fields(self):
+        fields = super().get_fields()
+        if not comment_preview_size(self.context.get('request')):
+            fields.pop('latest_comments')
+        return fields
+
+    def to_representation(self, instance):
+        if not getattr(instance, HYDRATED_ATTR, False):
+            hydrate_posts([instance], self.context.get('request'))
+        return super().to_representation(instance)
 
     def get_author_profile_picture(self, obj):
         """Get the profile picture URL of the author."""
         try:
-            profile_picture = obj.author.profile.profile_picture
-            if profile_picture:
+            url = avatar_url(obj.author.profile)
+            if url:
                 request = self.context.get('request')
                 if request is not None:
-                    return request.build_absolute_uri(profile_picture.url)
-                return profile_picture.url
+                    return request.build_absolute_uri(url)
+                return url
         except:
             pass
         return None
 
     def get_like_count(self, obj):
         """Get the total number of likes for this post."""
-        return obj.likes.count()
+        return obj.hydrated_like_count
 
     def get_is_liked(self, obj):
         """Check if the current user has liked this post."""
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.likes.filter(user=request.user).exists()
-        return False
+        return obj.hydrated_is_liked
+
+    def get_latest_comments(self, obj):
+        return CommentSerializer(getattr(obj, 'hydrated_comments', []), many=True).data
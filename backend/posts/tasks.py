@@ -0,0 +1,37 @@
+"""Background tasks of the posts app, run by the job workers (see jobs.queue)."""
+from jobs.queue import Retry, task
+
+from .likes import flush_pending_likes, schedule_flush
+from .models import Post, PostScore
+from .timeline import backfill_timeline, fan_out_post
+from .trending import rebase_scores, schedule_rebase
+
+
+@task('posts.fan_out')
+def fan_out(post_id):
+    post = Post.objects.filter(pk=post_id).first()
+    if post is not None:
+        fan_out_post(post)
+
+
+@task('posts.backfill_timeline')
+def backfill(owner_id, author_ids):
+    backfill_timeline(owner_id, author_ids)
+
+
+@task('posts.flush_like_counters')
+def flush_like_counters():
+    updated = flush_pending_likes()
+    if updated is None:
+        raise Retry('Another flush holds the lock', delay=1)
+    if updated:
+        # One more pass picks up likes buffered while this one ran
+        schedule_flush(force=True)
+
+
+@task('posts.rebase_trending')
+def rebase_trending():
+    rebase_scores()
+    if PostScore.objects.exists():
+        # Keep decaying scores with no new engagement
+        schedule_rebase()
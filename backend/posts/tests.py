@@ -1,3 +1,951 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, connections
+from django.db.models import F
+from django.http import HttpResponse
+from django.test import AsyncClient, RequestFactory, TestCase, TransactionTestCase, modify_settings, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.serializers import ListSerializer
+from rest_framework.test import APIClient
+
+from accounts.authentication import VersionedRefreshToken, cached_user, revoke_tokens, tokens_for
+from accounts.cache import get_profile
+from accounts.cpf_validator import validate_cpf_check_digits
+from accounts.models import Follow, UserProfile
+from backend.events import LocalBroker, publish
+from backend.replicas import ReplicaMiddleware, ReplicaRouter, pool
+from jobs.models import Job
+from jobs.queue import registered
+from .models import Post, Like, Comment, PostScore, TimelineEntry
+from .likes import flush_pending_likes
+from .live import watch
+from .search import filter_posts
+from .serializers import PostListSerializer, PostSerializer
+from .trending import bump, epoch_seconds, rebase_scores, rebuild_scores
+from .views import LikePost, PostListCreate
+from .async_views import post_list
+
+
+def like(user, post):
+    Like.objects.create(user=user, post=post)
+    Post.objects.filter(pk=post.pk).update(like_count=F('like_count') + 1)
+
+
+class CursorPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='alice', password='pass12345')
+        self.posts = [Post.objects.create(author=self.user, content=f'post {i}') for i in range(7)]
+
+    def collect(self, url):
+        ids, pages = [], 0
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            ids += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+            pages += 1
+        return ids, pages
+
+    def test_post_list_walks_every_post_once_newest_first(self):
+        ids, pages = self.collect('/api/posts/?page_size=3')
+        self.assertEqual(ids, [p.id for p in reversed(self.posts)])
+        self.assertEqual(pages, 3)
+
+    def test_previous_link_returns_to_prior_page(self):
+        first = self.client.get('/api/posts/?page_size=3').data
+        self.assertIsNone(first['previous'])
+        second = self.client.get(first['next']).data
+        back = self.client.get(second['previous']).data
+        self.assertEqual([p['id'] for p in back['results']], [p['id'] for p in first['results']])
+        self.assertIsNone(back['previous'])
+
+    def test_ties_on_published_at_are_broken_by_id(self):
+        Post.objects.update(published_at=self.posts[0].published_at)
+        ids, _ = self.collect('/api/posts/user/alice/?page_size=2')
+        self.assertEqual(ids, sorted((p.id for p in self.posts), reverse=True))
+
+    def test_page_size_is_bounded(self):
+        response = self.client.get('/api/posts/?page_size=100000')
+        self.assertEqual(len(response.data['results']), 7)
+        self.assertIsNone(response.data['next'])
+
+    def test_invalid_cursor_is_404(self):
+        response = self.client.get('/api/posts/?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, 404)
+
+    def test_liked_posts_are_ordered_by_like_time(self):
+        self.client.force_authenticate(self.user)
+        for post in (self.posts[2], self.posts[5], self.posts[0]):
+            Like.objects.create(user=self.user, post=post)
+        ids, _ = self.collect('/api/posts/liked/?page_size=2')
+        self.assertEqual(ids, [self.posts[0].id, self.posts[5].id, self.posts[2].id])
+
+    def test_liked_posts_sql_does_not_grow_with_like_history(self):
+        self.client.force_authenticate(self.user)
+        sizes = []
+        for posts in (self.posts[:2], self.posts):
+            Like.objects.filter(user=self.user).delete()
+            for post in posts:
+                Like.objects.create(user=self.user, post=post)
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get('/api/posts/liked/?page_size=2')
+            sizes.append([len(query['sql']) for query in ctx.captured_queries])
+        self.assertEqual(sizes[0], sizes[1])
+
+    def test_liked_posts_ties_on_like_time_are_broken_by_like_id(self):
+        self.client.force_authenticate(self.user)
+        likes = [Like.objects.create(user=self.user, post=post) for post in reversed(self.posts)]
+        Like.objects.update(created_at=likes[0].created_at)
+        ids, _ = self.collect('/api/posts/liked/?page_size=2')
+        self.assertEqual(ids, [p.id for p in self.posts])
+
+    def test_comments_are_oldest_first(self):
+        post = self.posts[0]
+        comments = [Comment.objects.create(post=post, author=self.user, content=str(i)) for i in range(5)]
+        ids, _ = self.collect(f'/api/posts/{post.id}/comments/?page_size=2')
+        self.assertEqual(ids, [c.id for c in comments])
+
+
+class PostHydrationTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.viewer = User.objects.create_user(username='viewer', password='pass12345')
+        self.authors = [User.objects.create_user(username=f'author{i}', password='pass12345') for i in range(5)]
+
+    def make_posts(self, count):
+        posts = [Post.objects.create(author=self.authors[i % 5], content=f'post {i}') for i in range(count)]
+        for post in posts[::2]:
+            like(self.viewer, post)
+        return posts
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        self.make_posts(30)
+        self.client.force_authenticate(self.viewer)
+        for page_size in (5, 30):
+            # page (with authors, profiles and counters), viewer likes
+            with self.assertNumQueries(2):
+                response = self.client.get(f'/api/posts/?page_size={page_size}')
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_like_fields_match_per_object_values(self):
+        posts = self.make_posts(6)
+        like(self.authors[0], posts[0])
+        self.client.force_authenticate(self.viewer)
+        results = {p['id']: p for p in self.client.get('/api/posts/').data['results']}
+        for post in posts:
+            self.assertEqual(results[post.id]['like_count'], post.likes.count())
+            self.assertEqual(results[post.id]['is_liked'], post.likes.filter(user=self.viewer).exists())
+
+    def test_comment_previews_are_embedded_in_one_query(self):
+        posts = self.make_posts(30)
+        for i, post in enumerate(posts[20:], start=1):
+            for n in range(i % 4):
+                self.client.force_authenticate(self.authors[n])
+                self.client.post(f'/api/posts/{post.id}/comments/', {'content': f'c{n}'})
+        self.client.force_authenticate(self.viewer)
+        for page_size in (5, 30):
+            # page, viewer likes, comment previews with their authors
+            with self.assertNumQueries(3):
+                response = self.client.get(f'/api/posts/?page_size={page_size}&comments=2')
+        results = {p['id']: p for p in response.data['results']}
+        for post in posts[20:]:
+            latest = list(post.comments.order_by('-created_at', '-id')[:2])[::-1]
+            self.assertEqual(
+                [(c['id'], c['author_username']) for c in results[post.id]['latest_comments']],
+                [(c.id, c.author.username) for c in latest],
+            )
+        self.assertEqual(results[posts[5].id]['latest_comments'], [])
+        self.assertNotIn('latest_comments', self.client.get('/api/posts/?page_size=5').data['results'][0])
+        self.client.logout()
+        sync_page = self.client.get('/api/posts/?page_size=30&comments=2').json()
+        async_page = async_to_sync(AsyncClient().get)('/api/async/posts/?page_size=30&comments=2').json()
+        self.assertEqual(async_page['results'], sync_page['results'])
+
+    def test_comments_endpoint_query_count_is_constant(self):
+        post = self.make_posts(1)[0]
+        for i in range(12):
+            Comment.objects.create(post=post, author=self.authors[i % 5], content=str(i))
+        for page_size in (2, 12):
+            with self.assertNumQueries(1):
+                response = self.client.get(f'/api/posts/{post.id}/comments/?page_size={page_size}')
+            self.assertEqual(len(response.data['results']), page_size)
+
+    def test_detail_view_is_hydrated(self):
+        post = self.make_posts(1)[0]
+        response = self.client.get(f'/api/posts/{post.id}/')
+        self.assertEqual(response.data['like_count'], 1)
+        self.assertFalse(response.data['is_liked'])
+
+
+@override_settings(TIMELINE_STRATEGY='join')
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.me = User.objects.create_user(username='me_user', password='pass12345')
+        self.friend = User.objects.create_user(username='friend', password='pass12345')
+        self.stranger = User.objects.create_user(username='stranger', password='pass12345')
+        Follow.objects.create(follower=self.me, followed=self.friend)
+
+    def test_only_followed_authors_are_returned(self):
+        mine = Post.objects.create(author=self.friend, content='hello')
+        Post.objects.create(author=self.stranger, content='spam')
+        Post.objects.create(author=self.me, content='own post')
+        self.client.force_authenticate(self.me)
+        response = self.client.get('/api/posts/timeline/')
+        self.assertEqual([p['id'] for p in response.data['results']], [mine.id])
+
+    def test_requires_authentication(self):
+        self.assertEqual(self.client.get('/api/posts/timeline/').status_code, 401)
+
+
+@override_settings(TIMELINE_STRATEGY='materialized', TIMELINE_FANOUT_MAX_FOLLOWERS=2, JOBS_EAGER=True)
+class MaterializedTimelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.me = User.objects.create_user(username='reader', password='pass12345')
+        self.other = User.objects.create_user(username='other', password='pass12345')
+        self.author = User.objects.create_user(username='writer', password='pass12345')
+        self.celebrity = User.objects.create_user(username='celebrity', password='pass12345')
+        UserProfile.objects.create(user=self.celebrity, cpf='111.444.777-35', followers_count=2)
+        for follower in (self.me, self.other):
+            Follow.objects.create(follower=follower, followed=self.celebrity)
+
+    def post_as(self, user, content):
+        self.client.force_authenticate(user)
+        return self.client.post('/api/posts/', {'content': content}).data['id']
+
+    def timeline(self):
+        self.client.force_authenticate(self.me)
+        return [p['id'] for p in self.client.get('/api/posts/timeline/').data['results']]
+
+    def test_follow_backfills_and_unfollow_removes(self):
+        old = self.post_as(self.author, 'before follow')
+        self.client.force_authenticate(self.me)
+        self.client.post('/api/accounts/auth/follow/', {'username': 'writer'})
+        self.assertEqual(self.timeline(), [old])
+        self.client.post('/api/accounts/auth/unfollow/', {'username': 'writer'})
+        self.assertEqual(self.timeline(), [])
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.me).exists())
+
+    @override_settings(JOBS_EAGER=False, TIMELINE_BACKFILL_POSTS=2)
+    def test_follow_queues_a_capped_backfill_and_merges_until_it_runs(self):
+        with self.settings(JOBS_EAGER=True):
+            posts = [self.post_as(self.author, str(i)) for i in range(3)]
+        self.client.force_authenticate(self.me)
+        self.client.post('/api/accounts/auth/follow/', {'username': 'writer'})
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.me).exists())
+        self.assertEqual(self.timeline(), posts[::-1])
+
+        job = Job.objects.get(name='posts.backfill_timeline')
+        registered(job.name)(**job.kwargs)
+        entries = TimelineEntry.objects.filter(owner=self.me).values_list('post_id', flat=True)
+        self.assertEqual(sorted(entries), posts[1:])
+        self.assertTrue(Follow.objects.get(follower=self.me, followed=self.author).timeline_backfilled)
+        self.assertEqual(self.timeline(), posts[:0:-1])
+
+    @override_settings(JOBS_EAGER=False)
+    def test_bulk_follow_queues_one_backfill_for_the_batch(self):
+        with self.settings(JOBS_EAGER=True):
+            post_id = self.post_as(self.author, 'x')
+        self.client.force_authenticate(self.me)
+        self.client.post('/api/accounts/auth/bulk-follow/', {'usernames': ['writer', 'other']}, format='json')
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.me).exists())
+        job = Job.objects.get(name='posts.backfill_timeline')
+        self.assertEqual(sorted(job.kwargs['author_ids']), sorted([self.author.pk, self.other.pk]))
+        self.assertEqual(self.timeline(), [post_id])
+
+    def test_new_posts_fan_out_and_deletes_cascade(self):
+        Follow.objects.create(follower=self.me, followed=self.author)
+        post_id = self.post_as(self.author, 'fresh')
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.me, post_id=post_id).exists())
+        self.client.delete(f'/api/posts/{post_id}/')
+        self.assertFalse(TimelineEntry.objects.filter(post_id=post_id).exists())
+
+    def test_celebrity_posts_are_merged_at_read_time(self):
+        Follow.objects.create(follower=self.me, followed=self.author)
+        first = self.post_as(self.author, 'one')
+        star = self.post_as(self.celebrity, 'star')
+        last = self.post_as(self.author, 'two')
+        self.assertFalse(TimelineEntry.objects.filter(post_id=star).exists())
+        self.assertEqual(self.timeline(), [last, star, first])
+
+    def test_posts_stay_visible_when_the_author_leaves_the_celebrity_set(self):
+        star = self.post_as(self.celebrity, 'while famous')
+        UserProfile.objects.filter(user=self.celebrity).update(followers_count=1)
+        cache.clear()
+        later = self.post_as(self.celebrity, 'after')
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.me, post_id=later).exists())
+        self.assertEqual(self.timeline(), [later, star])
+        self.client.post('/api/accounts/auth/unfollow/', {'username': 'celebrity'})
+        self.client.post('/api/accounts/auth/follow/', {'username': 'celebrity'})
+        self.assertEqual(self.timeline(), [later, star])
+
+    def test_materialized_and_join_paths_agree(self):
+        Follow.objects.create(follower=self.me, followed=self.author)
+        for i in range(5):
+            self.post_as(self.author if i % 2 else self.celebrity, str(i))
+        materialized = self.timeline()
+        with self.settings(TIMELINE_STRATEGY='join'):
+            self.assertEqual(self.timeline(), materialized)
+
+    def test_rebuild_command_restores_entries(self):
+        Follow.objects.create(follower=self.me, followed=self.author)
+        post_id = self.post_as(self.author, 'x')
+        TimelineEntry.objects.all().delete()
+        call_command('rebuild_timelines', 'reader', stdout=StringIO())
+        self.assertEqual(self.timeline(), [post_id])
+
+
+class CounterTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='counter', password='pass12345')
+        self.profile = UserProfile.objects.create(user=self.user, cpf='111.444.777-35')
+        self.client.force_authenticate(self.user)
+
+    def test_like_comment_and_post_counters_follow_writes(self):
+        post_id = self.client.post('/api/posts/', {'content': 'hi'}).data['id']
+        self.client.post(f'/api/posts/{post_id}/like/')
+        self.client.post(f'/api/posts/{post_id}/like/')
+        self.client.post(f'/api/posts/{post_id}/comments/', {'content': 'first'})
+        post = Post.objects.get(pk=post_id)
+        self.assertEqual((post.like_count, post.comment_count), (1, 1))
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.posts_count, 1)
+
+        self.client.post(f'/api/posts/{post_id}/unlike/')
+        self.client.post(f'/api/posts/{post_id}/unlike/')
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, 0)
+
+        self.client.delete(f'/api/posts/{post_id}/')
+        self.profile.refresh_from_db()
+        self.assertEqual(self.profile.posts_count, 0)
+
+    def test_reconcile_counters_repairs_drift(self):
+        post = Post.objects.create(author=self.user, content='x')
+        Like.objects.create(user=self.user, post=post)
+        Post.objects.filter(pk=post.pk).update(like_count=42, comment_count=3)
+        get_profile(self.user)
+        call_command('reconcile_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.profile.refresh_from_db()
+        self.assertEqual((post.like_count, post.comment_count), (1, 0))
+        self.assertEqual(self.profile.posts_count, 1)
+        self.assertEqual(get_profile(self.user)[0]['posts_count'], 1)
+
+    @override_settings(LIKE_COUNTER_MODE='buffered')
+    def test_reconcile_counters_leaves_buffered_likes_to_the_flush(self):
+        post = Post.objects.create(author=self.user, content='x')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'/api/posts/{post.pk}/like/')
+        with mock.patch('posts.management.commands.reconcile_counters.flush_pending_likes', return_value=0):
+            call_command('reconcile_counters', stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, 0)
+        flush_pending_likes()
+        post.refresh_from_db()
+        self.assertEqual(post.like_count, 1)
+
+    def test_reconcile_counters_refuses_while_a_flush_runs(self):
+        with mock.patch('posts.management.commands.reconcile_counters.flush_pending_likes', return_value=None):
+            with self.assertRaises(CommandError):
+                call_command('reconcile_counters', stdout=StringIO())
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='etag_user', password='pass12345')
+        self.post = Post.objects.create(author=self.user, content='cached')
+
+    def revalidate(self, url, etag):
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_unchanged_list_returns_304_without_serializing(self):
+        first = self.client.get('/api/posts/')
+        self.assertTrue(first['ETag'].startswith('W/'))
+        with mock.patch.object(PostSerializer, 'to_representation') as serialize:
+            second = self.revalidate('/api/posts/', first['ETag'])
+        self.assertEqual(second.status_code, 304)
+        serialize.assert_not_called()
+
+    def test_like_and_edit_change_the_etag(self):
+        etag = self.client.get('/api/posts/').headers['ETag']
+        self.client.force_authenticate(self.user)
+        self.client.post(f'/api/posts/{self.post.id}/like/')
+        liked = self.revalidate('/api/posts/', etag)
+        self.assertEqual(liked.status_code, 200)
+        self.client.patch(f'/api/posts/{self.post.id}/', {'content': 'edited'})
+        self.assertEqual(self.revalidate('/api/posts/', liked['ETag']).status_code, 200)
+
+    def test_etag_depends_on_viewer(self):
+        etag = self.client.get(f'/api/posts/{self.post.id}/')['ETag']
+        self.assertEqual(self.revalidate(f'/api/posts/{self.post.id}/', etag).status_code, 304)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.revalidate(f'/api/posts/{self.post.id}/', etag).status_code, 200)
+
+    def test_comments_change_on_new_comment(self):
+        url = f'/api/posts/{self.post.id}/comments/'
+        Comment.objects.create(post=self.post, author=self.user, content='old')
+        first = self.client.get(url)
+        self.assertIn('Last-Modified', first)
+        self.assertEqual(self.revalidate(url, first['ETag']).status_code, 304)
+        self.client.force_authenticate(self.user)
+        self.client.post(url, {'content': 'new'})
+        self.assertEqual(self.revalidate(url, first['ETag']).status_code, 200)
+
+    def test_full_last_page_changes_when_a_next_page_appears(self):
+        url = f'/api/posts/{self.post.id}/comments/?page_size=1'
+        Comment.objects.create(post=self.post, author=self.user, content='only')
+        first = self.client.get(url)
+        self.assertIsNone(first.data['next'])
+        Comment.objects.create(post=self.post, author=self.user, content='later')
+        second = self.revalidate(url, first['ETag'])
+        self.assertEqual(second.status_code, 200)
+        self.assertIsNotNone(second.data['next'])
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='searcher', password='pass12345')
+        self.title_hit = Post.objects.create(author=self.user, title='Café com leite', content='manhã')
+        self.body_hit = Post.objects.create(author=self.user, content='um cafe por favor')
+        self.miss = Post.objects.create(author=self.user, content='chá verde')
+
+    def search(self, query, **params):
+        return self.client.get('/api/posts/search/', {'q': query, **params})
+
+    def test_matches_are_ranked_and_accent_insensitive(self):
+        response = self.search('cafe')
+        self.assertEqual(response.status_code, 200)
+        ids = [item['id'] for item in response.data['results']]
+        self.assertEqual(ids, [self.title_hit.id, self.body_hit.id])
+
+    def test_index_follows_updates_and_deletes(self):
+        self.miss.content = 'cafe gelado'
+        self.miss.save()
+        self.title_hit.delete()
+        ids = {item['id'] for item in self.search('cafe').data['results']}
+        self.assertEqual(ids, {self.body_hit.id, self.miss.id})
+        self.assertEqual(self.search('chá').data['results'], [])
+
+    def test_cursor_walks_all_matches_once(self):
+        extra = [Post.objects.create(author=self.user, content=f'cafe {i}') for i in range(5)]
+        seen, url = [], None
+        response = self.search('cafe', page_size=2)
+        while True:
+            seen += [item['id'] for item in response.data['results']]
+            url = response.data['next']
+            if not url:
+                break
+            response = self.client.get(url)
+        self.assertEqual(sorted(seen), sorted([self.title_hit.id, self.body_hit.id] + [p.id for p in extra]))
+        self.assertEqual(len(seen), len(set(seen)))
+
+        second = self.client.get(self.search('cafe', page_size=2).data['next'])
+        back = self.client.get(second.data['previous'])
+        self.assertEqual([item['id'] for item in back.data['results']], seen[:2])
+
+    def test_operators_are_treated_as_words_and_empty_query_is_rejected(self):
+        self.assertEqual(self.search('cafe" OR NOT*').status_code, 200)
+        self.assertEqual(self.search('!!!').status_code, 400)
+
+    @skipUnless(connection.vendor == 'sqlite', 'SQLite FTS5 triggers')
+    def test_sync_triggers_survive_later_migrations(self):
+        # A table rebuild in a migration after 0009 silently drops them
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = 'posts_post'")
+            triggers = {name for name, in cursor.fetchall()}
+        self.assertEqual(triggers, {'posts_post_fts_ai', 'posts_post_fts_ad', 'posts_post_fts_au'})
+
+    def test_admin_filter_uses_the_index(self):
+        matched = filter_posts(Post.objects.all(), 'leite')
+        self.assertEqual(list(matched), [self.title_hit])
+
+    @skipUnless(connection.vendor == 'postgresql', 'PostgreSQL ranking')
+    def test_cursor_walks_tied_ranks_on_postgres(self):
+        tied = [Post.objects.create(author=self.user, content='café tied') for _ in range(5)]
+        seen = []
+        response = self.search('cafe tied', page_size=2)
+        while True:
+            seen += [item['id'] for item in response.data['results']]
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, sorted((p.id for p in tied), reverse=True))
+
+
+class SeedScaleTests(TestCase):
+    def test_generated_data_is_consistent(self):
+        call_command('seed_scale', users=30, posts=60, avg_follows=5, batch_size=25, stdout=StringIO())
+        self.assertEqual(User.objects.filter(username__startswith='seed_').count(), 30)
+        self.assertEqual(Post.objects.count(), 60)
+        self.assertTrue(all(validate_cpf_check_digits(cpf) for cpf in UserProfile.objects.values_list('cpf', flat=True)))
+        self.assertFalse(Follow.objects.filter(follower=F('followed')).exists())
+
+        out = StringIO()
+        call_command('reconcile_counters', dry_run=True, stdout=out)
+        self.assertIn('Post: 0 rows drifted', out.getvalue())
+        self.assertIn('UserProfile: 0 rows drifted', out.getvalue())
+
+
+@modify_settings(MIDDLEWARE={'prepend': 'backend.middleware.QueryInstrumentationMiddleware'})
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='timed_user', password='pass12345')
+        for i in range(6):
+            Post.objects.create(author=self.user, content=f'post {i}')
+        self.client.force_authenticate(self.user)
+
+    def timings(self, response):
+        return dict(part.split(';', 1) for part in response['Server-Timing'].split(', '))
+
+    def test_server_timing_header(self):
+        response = self.client.get('/api/posts/')
+        timings = self.timings(response)
+        self.assertEqual(set(timings), {'db', 'serialize', 'total'})
+        self.assertIn('desc="2 queries"', timings['db'])
+
+    def test_serializer_n_plus_one_is_reported(self):
+        # Undo page-level hydration so every post hydrates itself
+        with mock.patch('posts.views.hydrate_posts'), \
+                mock.patch('posts.views.post_fingerprint', lambda post: post.pk), \
+                mock.patch.object(PostListSerializer, 'to_representation', ListSerializer.to_representation), \
+                self.assertLogs('backend.middleware', 'WARNING') as logs:
+            self.client.get('/api/posts/')
+        self.assertTrue(any('Duplicate query x6' in line and 'IN (...)' in line for line in logs.output))
+
+    @override_settings(SLOW_REQUEST_MS=0)
+    def test_slow_requests_are_logged(self):
+        with self.assertLogs('backend.middleware', 'WARNING') as logs:
+            self.client.get('/api/posts/')
+        self.assertTrue(any(line.startswith('WARNING:backend.middleware:Slow request GET /api/posts/') for line in logs.output))
+
+    def test_async_views_are_timed(self):
+        response = async_to_sync(AsyncClient().get)('/api/async/posts/')
+        self.assertIn('desc="1 queries"', self.timings(response)['db'])
+
+
+@override_settings(JOBS_EAGER=True)
+class AsyncReadTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader', password='pass12345')
+        self.writer = User.objects.create_user(username='writer', password='pass12345')
+        Follow.objects.create(follower=self.reader, followed=self.writer)
+        self.posts = [Post.objects.create(author=self.writer, content=f'post {i}') for i in range(3)]
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(owner=self.reader, post=post, published_at=post.published_at) for post in self.posts
+        ])
+        like(self.reader, self.posts[0])
+        Comment.objects.create(post=self.posts[0], author=self.reader, content='first')
+        self.access = tokens_for(self.reader)['access']
+
+    def test_responses_match_the_sync_views(self):
+        client = APIClient()
+        client.force_authenticate(self.reader)
+        post_id = self.posts[0].pk
+        for path in ['', 'timeline/', f'{post_id}/', 'user/writer/', f'{post_id}/comments/', 'user/nobody/']:
+            expected = client.get(f'/api/posts/{path}')
+            response = async_to_sync(AsyncClient().get)(
+                f'/api/async/posts/{path}', headers={'Authorization': f'Bearer {self.access}'},
+            )
+            self.assertEqual(response.status_code, expected.status_code, path)
+            self.assertEqual(json.loads(response.content), json.loads(expected.content), path)
+
+    def test_authentication(self):
+        get = async_to_sync(AsyncClient().get)
+        self.assertEqual(get('/api/async/posts/timeline/').status_code, 401)
+        self.assertEqual(get('/api/async/posts/timeline/', headers={'Authorization': 'Bearer junk'}).status_code, 401)
+        response = get('/api/async/posts/', headers={'Authorization': f'Bearer {self.access}'})
+        self.assertTrue(response.json()['results'][-1]['is_liked'])
+
+
+class LikeIngestionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='liked_author', password='pass12345')
+        self.post = Post.objects.create(author=self.author, content='viral')
+        self.fans = [User.objects.create_user(username=f'fan{i}', password='pass12345') for i in range(3)]
+
+    def like_as(self, user, action='like', post_id=None):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(f'/api/posts/{post_id or self.post.id}/{action}/')
+
+    def api_count(self):
+        return self.client.get(f'/api/posts/{self.post.id}/').data['like_count']
+
+    def test_insert_or_ignore(self):
+        self.assertEqual(self.like_as(self.fans[0]).status_code, 201)
+        self.assertEqual(self.like_as(self.fans[0]).status_code, 200)
+        self.assertEqual(self.like_as(self.fans[0], post_id=999999).status_code, 404)
+        self.assertEqual(self.like_as(self.fans[0], 'unlike', post_id=999999).status_code, 404)
+        self.assertEqual(Like.objects.filter(post=self.post).count(), 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 1)
+
+    @override_settings(LIKE_COUNTER_MODE='buffered')
+    def test_buffered_counts_are_read_through_and_flushed(self):
+        for fan in self.fans:
+            self.like_as(fan)
+        self.like_as(self.fans[0])  # repeat, no delta
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 0)
+        self.assertEqual(self.api_count(), 3)
+
+        self.assertEqual(flush_pending_likes(), 1)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 3)
+        self.assertEqual(self.api_count(), 3)
+
+        self.like_as(self.fans[1], 'unlike')
+        self.assertEqual(self.api_count(), 2)
+        flush_pending_likes()
+        flush_pending_likes()  # recheck pass must not apply anything twice
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 2)
+        self.assertEqual(self.api_count(), 2)
+
+    @override_settings(LIKE_COUNTER_MODE='buffered')
+    def test_post_deleted_with_likes_still_buffered(self):
+        doomed = Post.objects.create(author=self.author, content='gone soon')
+        self.like_as(self.fans[0])
+        self.like_as(self.fans[0], post_id=doomed.id)
+        doomed.delete()
+
+        self.assertEqual(flush_pending_likes(), 1)
+        connection.check_constraints()  # no score row left pointing at the deleted post
+        self.assertFalse(PostScore.objects.filter(post_id=doomed.id).exists())
+        self.assertEqual(Post.objects.get(pk=self.post.pk).like_count, 1)
+        self.assertEqual(cache.get(f'likes:pending:{doomed.id}'), None)
+
+
+@override_settings(TRENDING_HALF_LIFE_HOURS=6, TRENDING_EPOCH_HOURS=6, TRENDING_MIN_SCORE=0.05,
+                   TRENDING_WEIGHTS={'post': 1.0, 'like': 1.0, 'comment': 2.0})
+class TrendingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.author = User.objects.create_user(username='trend_author', password='pass12345')
+        self.fans = [User.objects.create_user(username=f'trend_fan{i}', password='pass12345') for i in range(3)]
+
+    def trending_ids(self, **params):
+        response = self.client.get('/api/posts/trending/', params)
+        self.assertEqual(response.status_code, 200)
+        return [post['id'] for post in response.data['results']], response.data['next']
+
+    def decayed(self, post, now):
+        row = PostScore.objects.get(post=post)
+        return row.score * 2 ** ((row.epoch * epoch_seconds() - now) / (6 * 3600))
+
+    def test_recent_engagement_ranks_first(self):
+        fresh = Post.objects.create(author=self.author, content='fresh')
+        stale = Post.objects.create(author=self.author, content='stale')
+        now = timezone.now()
+        bump(fresh.pk, 'like', at=now)
+        # Three likes twelve hours (two half-lives) ago are worth 0.75
+        bump(stale.pk, 'like', 3, at=now - timedelta(hours=12))
+        self.assertEqual(self.trending_ids()[0], [fresh.pk, stale.pk])
+        self.assertAlmostEqual(self.decayed(stale, now.timestamp()), 0.75, places=3)
+
+        bump(stale.pk, 'comment', at=now)
+        self.assertEqual(self.trending_ids()[0], [stale.pk, fresh.pk])
+
+    def test_pages_follow_the_score_index(self):
+        posts = [Post.objects.create(author=self.author, content=f'p{i}') for i in range(5)]
+        for i, post in enumerate(posts):
+            bump(post.pk, 'like', 1 + i % 2)
+        first, next_link = self.trending_ids(page_size=3)
+        response = self.client.get(next_link)
+        second = [post['id'] for post in response.data['results']]
+        expected = [p.pk for p in sorted(posts, key=lambda p: (-(1 + posts.index(p) % 2), -p.pk))]
+        self.assertEqual(first + second, expected)
+
+        if connection.vendor == 'sqlite':
+            from .views import TrendingPosts
+            query = str(TrendingPosts().get_queryset()[:21].query)
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN QUERY PLAN ' + query)
+                plan = ' '.join(row[-1] for row in cursor.fetchall())
+            self.assertIn('posts_postscore USING COVERING INDEX', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+
+    def test_unlike_retracts_the_like(self):
+        self.client.force_authenticate(self.author)
+        post_id = self.client.post('/api/posts/', {'content': 'hello'}, format='json').data['id']
+        # Stored weights are relative to the epoch start; the post's own is 1 now
+        unit = PostScore.objects.get(post_id=post_id).score
+        self.client.force_authenticate(self.fans[0])
+        self.client.post(f'/api/posts/{post_id}/like/')
+        self.client.post(f'/api/posts/{post_id}/comments/', {'content': 'nice'}, format='json')
+        self.assertAlmostEqual(PostScore.objects.get(post_id=post_id).score / unit, 4, places=3)
+        self.client.post(f'/api/posts/{post_id}/unlike/')
+        self.assertAlmostEqual(PostScore.objects.get(post_id=post_id).score / unit, 3, places=3)
+
+    def test_rebase_moves_epochs_and_prunes(self):
+        posts = [Post.objects.create(author=self.author, content=f'p{i}') for i in range(3)]
+        bump(posts[0].pk, 'like', 4)
+        bump(posts[1].pk, 'like', 2)
+        bump(posts[2].pk, 'like', 1)
+        later = timezone.now().timestamp() + 30 * 3600
+        before = {post.pk: self.decayed(post, later) for post in posts}
+
+        with mock.patch('posts.trending.time.time', return_value=later):
+            moved, deleted = rebase_scores()
+            self.assertEqual((moved, deleted), (3, 1))  # 1 like after five half-lives is 0.03
+            self.assertEqual(self.trending_ids()[0], [posts[0].pk, posts[1].pk])
+        for post in posts[:2]:
+            self.assertAlmostEqual(self.decayed(post, later), before[post.pk], places=6)
+
+    def test_rebuild_matches_incremental_scores(self):
+        self.client.force_authenticate(self.author)
+        ids = [self.client.post('/api/posts/', {'content': f'p{i}'}, format='json').data['id'] for i in range(3)]
+        for fan in self.fans:
+            self.client.force_authenticate(fan)
+            self.client.post(f'/api/posts/{ids[0]}/like/')
+            self.client.post(f'/api/posts/{ids[1]}/comments/', {'content': 'hi'}, format='json')
+        self.client.post(f'/api/posts/{ids[0]}/unlike/')
+        incremental = dict(PostScore.objects.values_list('post_id', 'score'))
+
+        call_command('rebuild_trending', stdout=StringIO())
+        rebuilt = dict(PostScore.objects.values_list('post_id', 'score'))
+        self.assertEqual(set(rebuilt), set(ids))
+        for post_id in ids:
+            self.assertAlmostEqual(rebuilt[post_id], incremental[post_id], places=3)
+        self.assertEqual(rebuild_scores(), 3)
+
+
+@override_settings(JOBS_EAGER=True)
+class LiveEventTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader', password='pass12345')
+        self.writer = User.objects.create_user(username='writer', password='pass12345')
+        UserProfile.objects.create(user=self.writer, cpf='111.444.777-35')
+        Follow.objects.create(follower=self.reader, followed=self.writer)
+        self.post = Post.objects.create(author=self.writer, content='watched')
+
+    def test_writes_publish_events(self):
+        client = APIClient()
+        client.force_authenticate(self.writer)
+        with mock.patch('backend.events.publish') as publish, self.captureOnCommitCallbacks(execute=True):
+            client.post(f'/api/posts/{self.post.pk}/like/')
+            client.post(f'/api/posts/{self.post.pk}/comments/', {'content': 'hi'})
+            new_id = client.post('/api/posts/', {'content': 'fresh'}).data['id']
+        events = {(channel, event['type']) for (channel, event), _ in publish.call_args_list}
+        self.assertEqual(events, {
+            (f'post:{self.post.pk}', 'like'), (f'post:{self.post.pk}', 'comment'), (f'author:{self.writer.pk}', 'post'),
+        })
+        post_event = next(event for (channel, event), _ in publish.call_args_list if event['type'] == 'post')
+        self.assertEqual(post_event['post'], new_id)
+
+    @override_settings(EVENTS_QUEUE_SIZE=2)
+    def test_subscription_coalesces_likes_and_overflows(self):
+        async def scenario():
+            hub = LocalBroker()
+            subscription = hub.subscribe(['post:1'], owner=self.reader.pk)
+            for actor in (self.writer.pk, self.writer.pk, self.reader.pk):
+                hub.publish('post:1', {'type': 'like', 'coalesce': 1, 'delta': 1, 'actor': actor})
+            for i in range(3):
+                hub.publish('post:1', {'type': 'comment', 'post': 1, 'comment': {'id': i}})
+            await asyncio.sleep(0)
+            events, coalesced, overflowed = subscription.drain()
+            hub.unsubscribe(subscription)
+            return events, coalesced, overflowed, hub.subscriber_count()
+        events, coalesced, overflowed, remaining = async_to_sync(scenario)()
+        # Own likes are not echoed; the third comment overflowed the queue
+        self.assertEqual((events, coalesced, overflowed, remaining), ([], {1: 2}, True, 0))
+
+
+class LiveStreamTests(TransactionTestCase):
+    # Streams query from pool threads (backend.asyncapi.detached), which
+    # only see committed rows
+
+    def setUp(self):
+        cache.clear()
+        self.reader = User.objects.create_user(username='reader', password='pass12345')
+        self.writer = User.objects.create_user(username='writer', password='pass12345')
+        Follow.objects.create(follower=self.reader, followed=self.writer)
+        self.post = Post.objects.create(author=self.writer, content='watched')
+
+    @override_settings(EVENTS_HEARTBEAT_SECONDS=0.05, EVENTS_LIKE_INTERVAL=0)
+    def test_stream(self):
+        access = tokens_for(self.reader)['access']
+
+        async def scenario():
+            self.assertEqual((await AsyncClient().get('/api/posts/stream/')).status_code, 401)
+            response = await AsyncClient().get(f'/api/posts/stream/?access_token={access}')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            chunks = aiter(response.streaming_content)
+            ready = (await anext(chunks)).decode()
+            stream_id = json.loads(ready.split('data: ')[1])['stream']
+            await sync_to_async(watch, thread_sensitive=False)(self.reader.pk, stream_id, [self.post.pk])
+            received = []
+            while not any('event: likes' in chunk for chunk in received):
+                # Published from another thread, like a sync view would
+                await sync_to_async(publish, thread_sensitive=False)(
+                    f'post:{self.post.pk}', {'type': 'like', 'coalesce': self.post.pk, 'delta': 1, 'actor': self.writer.pk},
+                )
+                received.append((await anext(chunks)).decode())
+            await sync_to_async(publish, thread_sensitive=False)(
+                f'author:{self.writer.pk}', {'type': 'post', 'post': 99, 'author': 'writer', 'actor': self.writer.pk},
+            )
+            while not any('event: post' in chunk for chunk in received):
+                received.append((await anext(chunks)).decode())
+            received.append((await anext(chunks)).decode())
+            await chunks.aclose()
+            return ready, received
+
+        ready, received = async_to_sync(scenario)()
+        self.assertIn('event: ready', ready)
+        self.assertIn(f'data: {{"{self.post.pk}":1}}', ''.join(received))
+        self.assertIn('data: {"post":99,"author":"writer"}', ''.join(received))
+        self.assertIn(': ping', received[-1])
+
+    @override_settings(EVENTS_HEARTBEAT_SECONDS=0.05)
+    def test_stream_ends_when_its_token_is_revoked_or_expires(self):
+        UserProfile.objects.create(user=self.reader, cpf='111.444.777-35')
+
+        async def last_frame(access, end=None):
+            response = await AsyncClient().get(f'/api/posts/stream/?access_token={access}')
+            chunks = [(await anext(aiter(response.streaming_content))).decode()]
+            if end is not None:
+                await sync_to_async(end, thread_sensitive=False)()
+            async for chunk in response.streaming_content:
+                chunks.append(chunk.decode())
+            return chunks[-1]
+
+        revoked = async_to_sync(last_frame)(tokens_for(self.reader)['access'], lambda: revoke_tokens(self.reader))
+        self.assertEqual(revoked, 'event: revoked\ndata: {}\n\n')
+        short_lived = VersionedRefreshToken.for_user(self.reader).access_token
+        short_lived.set_exp(lifetime=timedelta(seconds=1))
+        self.assertEqual(async_to_sync(last_frame)(str(short_lived)), 'event: expired\ndata: {}\n\n')
+
+
+@override_settings(REPLICA_HEALTH_INTERVAL=60)
+class ReplicaRoutingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        pool.reset()
+        self.user = User.objects.create_user(username='writer', password='pass12345')
+        self.token = tokens_for(self.user)['access']
+        self.factory = RequestFactory()
+        self.lag = 0.0
+        patches = [
+            mock.patch('backend.replicas.replica_aliases', return_value=['replica1', 'replica2']),
+            mock.patch('backend.replicas.replication_lag', side_effect=lambda alias: self.lag),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+        self.addCleanup(pool.reset)
+
+    def route(self, method, view, token=None, status=200):
+        """Database the router picks for a read in `view` and the response status."""
+        headers = {'HTTP_AUTHORIZATION': f'Bearer {token}'} if token else {}
+        request = getattr(self.factory, method)('/api/posts/', **headers)
+        picked = []
+
+        def get_response(request):
+            middleware.process_view(request, view, (), {})
+            picked.append(ReplicaRouter().db_for_read(Post))
+            return HttpResponse(status=status)
+
+        middleware = ReplicaMiddleware(get_response)
+        middleware(request)
+        return picked[0]
+
+    def test_reads_are_spread_over_replicas(self):
+        view = PostListCreate.as_view()
+        self.assertEqual({self.route('get', view) for _ in range(4)}, {'replica1', 'replica2'})
+        self.assertTrue(self.route('get', post_list).startswith('replica'))
+        self.assertIsNone(self.route('post', view))
+        self.assertIsNone(self.route('get', lambda request: None))
+
+    def test_writer_reads_from_primary_for_a_while(self):
+        view = PostListCreate.as_view()
+        self.route('post', LikePost.as_view(), self.token, status=201)
+        self.assertIsNone(self.route('get', view, self.token))
+        self.assertTrue(self.route('get', view).startswith('replica'))
+        cache.clear()
+        self.assertTrue(self.route('get', view, self.token).startswith('replica'))
+        # Failed writes change nothing
+        self.route('post', LikePost.as_view(), self.token, status=404)
+        self.assertTrue(self.route('get', view, self.token).startswith('replica'))
+
+    def test_cache_fills_read_the_primary(self):
+        # replica1 does not exist here, so any read routed to it would raise
+        UserProfile.objects.create(user=self.user, cpf='111.444.777-35')
+        request = self.factory.get('/api/posts/')
+        loaded = []
+
+        def get_response(request):
+            middleware.process_view(request, PostListCreate.as_view(), (), {})
+            loaded.append(cached_user(self.user.pk)[1])
+            loaded.append(get_profile(self.user)[0])
+            return HttpResponse()
+
+        middleware = ReplicaMiddleware(get_response)
+        with override_settings(DATABASE_ROUTERS=['backend.replicas.ReplicaRouter'], REPLICA_HEALTH_INTERVAL=0):
+            middleware(request)
+        self.assertEqual(loaded[0].profile.cpf, '111.444.777-35')
+        self.assertEqual(loaded[1]['username'], 'writer')
+
+    def test_lagging_replicas_are_ejected_until_they_catch_up(self):
+        view = PostListCreate.as_view()
+        self.lag = 30.0
+        with self.assertLogs('backend.replicas', 'WARNING') as logs:
+            self.assertEqual(self.route('get', view), 'default')
+        self.assertIn('replica1 ejected: 30.0 s behind', logs.output[0])
+        self.lag = 0.0
+        self.assertEqual(self.route('get', view), 'default')
+        with override_settings(REPLICA_HEALTH_INTERVAL=0):
+            self.assertTrue(self.route('get', view).startswith('replica'))
+
+
+@skipUnless('replica1' in settings.DATABASES, 'set DATABASE_REPLICA_URLS to run')
+class ReplicaDatabaseTests(TransactionTestCase):
+    # The replica alias is a second connection to the test database, so it
+    # only sees committed rows
+    databases = {'default', 'replica1'} if 'replica1' in settings.DATABASES else {'default'}
+
+    def setUp(self):
+        cache.clear()
+        pool.reset()
+        self.user = User.objects.create_user(username='writer', password='pass12345')
+        self.post = Post.objects.create(author=self.user, content='replicated')
+        self.client = APIClient()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {tokens_for(self.user)["access"]}')
+
+    def queries(self, method, path):
+        with CaptureQueriesContext(connections['default']) as primary, \
+                CaptureQueriesContext(connections['replica1']) as replica:
+            getattr(self.client, method)(path)
+        return len(primary.captured_queries), len(replica.captured_queries)
+
+    def test_reads_use_the_replica_until_the_user_writes(self):
+        primary, replica = self.queries('get', '/api/posts/')
+        self.assertEqual(primary, 0)
+        self.assertGreater(replica, 0)
+        self.queries('post', f'/api/posts/{self.post.pk}/like/')
+        primary, replica = self.queries('get', '/api/posts/')
+        self.assertGreater(primary, 0)
+        self.assertEqual(replica, 0)
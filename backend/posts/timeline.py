@@ -0,0 +1,155 @@
+"""
+Home timeline storage and read paths.
+
+Posts are fanned out on write into TimelineEntry rows for every follower,
+except for authors with TIMELINE_FANOUT_MAX_FOLLOWERS or more followers.
+A post that has its rows is flagged `fanned_out`; every other post of a
+followed author (a celebrity's, or one whose fan-out job has not run yet)
+is merged in at read time. Which posts take which path is thus fixed per
+post, so an author crossing the threshold in either direction loses
+nothing. A new follow queues a posts.backfill_timeline job that copies the
+author's latest TIMELINE_BACKFILL_POSTS posts; until it has run, that
+author's posts are merged in at read time as well. The 'join' strategy
+skips the materialized rows and filters Post by Follow directly.
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from accounts.models import Follow, UserProfile
+from jobs.queue import enqueue
+from .hydration import with_authors
+from .models import Post, TimelineEntry
+
+FANOUT_BATCH_SIZE = 1000
+CELEBRITY_CACHE_KEY = 'timeline:celebrity_ids'
+CELEBRITY_CACHE_TIMEOUT = 300
+
+
+def fanout_threshold():
+    return settings.TIMELINE_FANOUT_MAX_FOLLOWERS
+
+
+def celebrity_ids():
+    """Ids of authors whose posts are merged at read time (cached)."""
+    ids = cache.get(CELEBRITY_CACHE_KEY)
+    if ids is None:
+        ids = set(
+            UserProfile.objects.filter(followers_count__gte=fanout_threshold())
+            .values_list('user_id', flat=True)
+        )
+        cache.set(CELEBRITY_CACHE_KEY, ids, CELEBRITY_CACHE_TIMEOUT)
+    return ids
+
+
+def is_fanout_author(author_id):
+    return author_id not in celebrity_ids()
+
+
+def _bulk_insert(entries):
+    for start in range(0, len(entries), FANOUT_BATCH_SIZE):
+        TimelineEntry.objects.bulk_create(entries[start:start + FANOUT_BATCH_SIZE], ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Deliver a new post to its author's followers, unless the author is a celebrity."""
+    if not is_fanout_author(post.author_id):
+        return
+    follower_ids = Follow.objects.filter(followed_id=post.author_id).values_list('follower_id', flat=True)
+    with transaction.atomic():
+        _bulk_insert([
+            TimelineEntry(owner_id=owner_id, post_id=post.pk, published_at=post.published_at)
+            for owner_id in follower_ids.iterator()
+        ])
+        Post.objects.filter(pk=post.pk).update(fanned_out=True)
+
+
+def queue_backfill(owner, author_ids):
+    """Queue the timeline backfill of new follows; call inside the follow's transaction."""
+    enqueue('posts.backfill_timeline', {'owner_id': owner.pk, 'author_ids': list(author_ids)}, priority=5)
+
+
+def backfill_timeline(owner_id, author_ids):
+    """
+    Copy each newly followed author's latest fanned-out posts into
+    `owner_id`'s timeline and mark the follow backfilled. Follows removed
+    or already backfilled since the job was queued are skipped.
+    """
+    limit = settings.TIMELINE_BACKFILL_POSTS
+    for author_id in author_ids:
+        with transaction.atomic():
+            # The lock keeps a concurrent unfollow from leaving rows behind
+            follow = Follow.objects.select_for_update().filter(
+                follower_id=owner_id, followed_id=author_id, timeline_backfilled=False,
+            )
+            if not list(follow.values_list('pk', flat=True)):
+                continue
+            posts = (
+                Post.objects.filter(author_id=author_id, fanned_out=True)
+                .order_by('-published_at', '-id').values_list('id', 'published_at')[:limit]
+            )
+            _bulk_insert([
+                TimelineEntry(owner_id=owner_id, post_id=post_id, published_at=published_at)
+                for post_id, published_at in posts
+            ])
+            follow.update(timeline_backfilled=True)
+
+
+def remove_author_from_timeline(owner, author):
+    """Drop an unfollowed author's posts from `owner`'s timeline."""
+    remove_authors_from_timeline(owner, [author.pk])
+
+
+def remove_authors_from_timeline(owner, author_ids):
+    """Drop several unfollowed authors' posts from `owner`'s timeline."""
+    TimelineEntry.objects.filter(owner=owner, post__author_id__in=author_ids).delete()
+
+
+def rebuild_timeline(owner):
+    """Recreate `owner`'s materialized timeline from Follow and Post."""
+    TimelineEntry.objects.filter(owner=owner).delete()
+    followed_ids = list(Follow.objects.filter(follower=owner).values_list('followed_id', flat=True))
+    entries = []
+    for start in range(0, len(followed_ids), FANOUT_BATCH_SIZE):
+        posts = Post.objects.filter(author_id__in=followed_ids[start:start + FANOUT_BATCH_SIZE], fanned_out=True)
+        for post_id, published_at in posts.values_list('id', 'published_at').iterator():
+            entries.append(TimelineEntry(owner_id=owner.pk, post_id=post_id, published_at=published_at))
+            if len(entries) >= FANOUT_BATCH_SIZE:
+                _bulk_insert(entries)
+                entries = []
+    _bulk_insert(entries)
+    Follow.objects.filter(follower=owner, followed_id__in=followed_ids).update(timeline_backfilled=True)
+
+
+def flag_fanout_posts():
+    """
+    Mark every post of a non-celebrity author as fanned out. Only sound
+    right before rebuilding every timeline, which then copies them in.
+    """
+    return Post.objects.filter(fanned_out=False).exclude(author_id__in=celebrity_ids()).update(fanned_out=True)
+
+
+def timeline_sources(owner, strategy=None):
+    """
+    Querysets whose merge is `owner`'s home timeline, each annotated with
+    `feed_at` for TimelineCursorPagination. Nothing is queried here.
+    """
+    strategy = strategy or settings.TIMELINE_STRATEGY
+    followed = Follow.objects.filter(follower=owner)
+
+    if strategy == 'join':
+        posts = Post.objects.filter(author_id__in=followed.values('followed_id'))
+        return [with_authors(posts).annotate(feed_at=F('published_at'))]
+
+    return [
+        with_authors(Post.objects.filter(timeline_entries__owner=owner))
+        .annotate(feed_at=F('timeline_entries__published_at')),
+        # Served by the partial post_pending_fanout_idx index
+        with_authors(Post.objects.filter(author_id__in=followed.values('followed_id'), fanned_out=False))
+        .annotate(feed_at=F('published_at')),
+        # Authors followed since their backfill job last ran (follow_pending_backfill_idx)
+        with_authors(Post.objects.filter(
+            author_id__in=followed.filter(timeline_backfilled=False).values('followed_id'), fanned_out=True,
+        )).annotate(feed_at=F('published_at')),
+    ]
@@ -0,0 +1,175 @@
+"""
+Trending posts: engagement with exponential time decay, kept in PostScore.
+
+A post's trending score at time t is the sum of its engagement weights
+(TRENDING_WEIGHTS: the post itself, likes, comments), each multiplied by
+exp(-decay * age), with decay = ln 2 / TRENDING_HALF_LIFE_HOURS. It is
+stored with forward decay: relative to the start of an epoch (every
+TRENDING_EPOCH_HOURS), an event at time t adds weight * exp(decay * (t -
+epoch start)). Those stored values only change when engagement happens,
+yet within one epoch they rank exactly like the decayed scores, so
+trending is `ORDER BY epoch DESC, score DESC` on one index.
+
+`bump` applies one event with a single UPDATE, moving the row to the
+current epoch on the way. The `posts.rebase_trending` job, queued for
+each epoch boundary while scores remain, moves all other rows to the new
+epoch with one bulk UPDATE and deletes posts whose decayed score fell
+below TRENDING_MIN_SCORE; until it runs, posts not touched since the
+boundary rank below the ones that were. `rebuild_scores` (the rebuild_trending
+command) recomputes every score from the Post, Like and Comment rows.
+"""
+import math
+import time
+from datetime import datetime, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Exp, Greatest
+
+from jobs.queue import enqueue
+from .models import Comment, Like, Post, PostScore
+
+REBASE_SCHEDULED_KEY = 'trending:rebase-scheduled'
+REBASE_JOB_KEY = 'trending:rebase'
+# Selecting from posts_post makes a missing (deleted) post insert nothing
+INSERT_SCORE = (
+    'INSERT INTO posts_postscore (post_id, epoch, score) '
+    'SELECT id, %s, %s FROM posts_post WHERE id = %s '
+    'ON CONFLICT (post_id) DO NOTHING'
+)
+
+
+def weight(kind):
+    return settings.TRENDING_WEIGHTS[kind]
+
+
+def decay_rate():
+    """Per-second decay constant."""
+    return math.log(2) / (settings.TRENDING_HALF_LIFE_HOURS * 3600)
+
+
+def epoch_seconds():
+    return settings.TRENDING_EPOCH_HOURS * 3600
+
+
+def epoch_of(timestamp):
+    return int(timestamp // epoch_seconds())
+
+
+def forward_weight(amount, at, epoch):
+    """`amount` of engagement at unix time `at`, as stored in `epoch`."""
+    return amount * math.exp(decay_rate() * (at - epoch * epoch_seconds()))
+
+
+def _rescaled_score(epoch):
+    """Expression moving a row's score to `epoch`."""
+    return F('score') * Exp(Value(decay_rate() * epoch_seconds()) * (F('epoch') - epoch))
+
+
+def bump(post_id, kind, amount=1, at=None):
+    """
+    Add `amount` (negative to retract) `kind` events on `post_id` that
+    happened at datetime `at` (default now). Call inside the write's
+    transaction.
+    """
+    now = time.time()
+    epoch = epoch_of(now)
+    delta = forward_weight(amount * weight(kind), at.timestamp() if at is not None else now, epoch)
+    updated = PostScore.objects.filter(post_id=post_id).update(
+        score=Greatest(_rescaled_score(epoch) + delta, Value(0.0)), epoch=epoch,
+    )
+    if not updated and delta > 0:
+        with connection.cursor() as cursor:
+            cursor.execute(INSERT_SCORE, [epoch, delta, post_id])
+            inserted = cursor.rowcount == 1
+        if not inserted:
+            # Created concurrently, or the post is gone
+            PostScore.objects.filter(post_id=post_id).update(
+                score=Greatest(_rescaled_score(epoch) + delta, Value(0.0)), epoch=epoch,
+            )
+    schedule_rebase(now)
+
+
+def schedule_rebase(now=None):
+    """Queue the rebase for the next epoch boundary, once per epoch and process group."""
+    now = time.time() if now is None else now
+    until_boundary = (epoch_of(now) + 1) * epoch_seconds() - now
+    if cache.add(REBASE_SCHEDULED_KEY, 1, timeout=max(1, int(until_boundary))):
+        enqueue('posts.rebase_trending', priority=3, delay=until_boundary + 1, key=REBASE_JOB_KEY)
+
+
+def rebase_scores(now=None):
+    """
+    Move every score to the current epoch and drop decayed posts.
+    Returns (rows moved, rows deleted).
+    """
+    now = time.time() if now is None else now
+    epoch = epoch_of(now)
+    # A stored score s is worth s * exp(-decay * (now - epoch start)) now
+    floor = settings.TRENDING_MIN_SCORE * math.exp(decay_rate() * (now - epoch * epoch_seconds()))
+    with transaction.atomic():
+        moved = PostScore.objects.filter(epoch__lt=epoch).update(score=_rescaled_score(epoch), epoch=epoch)
+        deleted, _ = PostScore.objects.filter(epoch__lte=epoch, score__lt=floor).delete()
+    return moved, deleted
+
+
+def _event_times(queryset, field, since, batch_size):
+    """(post ids, unix times) of `queryset` rows newer than `since`, read in pk order batches."""
+    post_ids, times = [], []
+    last_pk = 0
+    while True:
+        rows = list(
+            queryset.filter(pk__gt=last_pk, **{f'{field}__gte': since})
+            .order_by('pk').values_list('pk', 'post_id', field)[:batch_size]
+        )
+        if not rows:
+            return post_ids, times
+        for pk, post_id, at in rows:
+            post_ids.append(post_id)
+            times.append(at.timestamp())
+        last_pk = rows[-1][0]
+
+
+def _decayed_sums(post_ids, times, amount, epoch):
+    """{post_id: sum of forward weights} for parallel lists of events."""
+    if not post_ids:
+        return {}
+    ids = np.asarray(post_ids, dtype=np.int64)
+    weights = amount * np.exp(decay_rate() * (np.asarray(times, dtype=np.float64) - epoch * epoch_seconds()))
+    unique, index = np.unique(ids, return_inverse=True)
+    sums = np.bincount(index, weights=weights, minlength=len(unique))
+    return dict(zip(unique.tolist(), sums.tolist()))
+
+
+def rebuild_scores(now=None, batch_size=5000):
+    """
+    Recompute every trending score from scratch: events older than the age
+    at which a single like decays below TRENDING_MIN_SCORE are skipped.
+    Returns the number of scored posts.
+    """
+    now = time.time() if now is None else now
+    epoch = epoch_of(now)
+    min_score = settings.TRENDING_MIN_SCORE
+    horizon = math.log(min(weight('like'), weight('post'), weight('comment')) / min_score) / decay_rate()
+    since = datetime.fromtimestamp(now - max(horizon, 0), tz=dt_timezone.utc)
+
+    totals = {}
+    sources = [
+        (Post.objects.annotate(post_id=F('id')), 'published_at', 'post'),
+        (Like.objects.all(), 'created_at', 'like'),
+        (Comment.objects.all(), 'created_at', 'comment'),
+    ]
+    for queryset, field, kind in sources:
+        post_ids, times = _event_times(queryset, field, since, batch_size)
+        for post_id, value in _decayed_sums(post_ids, times, weight(kind), epoch).items():
+            totals[post_id] = totals.get(post_id, 0.0) + value
+
+    floor = min_score * math.exp(decay_rate() * (now - epoch * epoch_seconds()))
+    rows = [PostScore(post_id=post_id, epoch=epoch, score=score) for post_id, score in totals.items() if score >= floor]
+    with transaction.atomic():
+        PostScore.objects.all().delete()
+        PostScore.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
@@ -1,8 +1,15 @@
 from django.urls import path
-from .views import PostListCreate, PostDetail, PostsByUser, LikePost, UnlikePost, LikedPosts, CommentListCreateView
+from .async_views import stream
+from .views import PostListCreate, PostDetail, PostsByUser, LikePost, UnlikePost, LikedPosts, CommentListCreateView, Timeline, PostSearchView, StreamWatch, TrendingPosts
 
 urlpatterns = [
     path('', PostListCreate.as_view()),
+    path('timeline/', Timeline.as_view()),
+    path('search/', PostSearchView.as_view()),
+    path('trending/', TrendingPosts.as_view()),
+    # Server-sent events; needs the ASGI server
+    path('stream/', stream),
+    path('stream/watch/', StreamWatch.as_view()),
     path('<int:pk>/', PostDetail.as_view()),
     path('user/<str:username>/', PostsByUser.as_view()),
     path('<int:pk>/like/', LikePost.as_view()),
@@ -1,29 +1,73 @@
 from rest_framework import generics, permissions, status
 from rest_framework.decorators import action
+from rest_framework.exceptions import ValidationError
 from rest_framework.response import Response
+from django.http import Http404
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.models import User
-from .models import Post, Like, Comment
+from django.db import transaction
+from django.db.models import F
+from accounts.cache import invalidate_profile
+from accounts.models import UserProfile
+from backend.conditional import ConditionalListMixin, ConditionalRetrieveMixin
+from backend.counters import adjust_counters
+from jobs.queue import enqueue
+from .models import Post, Comment
+from .pagination import PostCursorPagination, LikedPostCursorPagination, CommentCursorPagination, TimelineCursorPagination, SearchCursorPagination, TrendingCursorPagination
 from .serializers import PostSerializer, CommentSerializer
-class CommentListCreateView(generics.ListCreateAPIView):
+from .hydration import hydrate_posts, post_fingerprint, with_authors
+from .likes import PostNotFound, add_like, remove_like
+from .live import MAX_WATCHED, comment_added, post_created, watch
+from .search import PostSearch
+from .timeline import timeline_sources
+from .trending import bump
+class ConditionalPostsMixin:
+    """ETags for post responses, computed from hydrated rows."""
+
+    def prepare_page(self, page):
+        hydrate_posts(page, self.request)
+
+    def get_row_fingerprint(self, row):
+        return post_fingerprint(row)
+
+
+class CommentListCreateView(ConditionalListMixin, generics.ListCreateAPIView):
     serializer_class = CommentSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = CommentCursorPagination
 
     def get_queryset(self):
         post_id = self.kwargs['post_id']
-        return Comment.objects.filter(post_id=post_id).order_by('created_at')
+        return Comment.objects.filter(post_id=post_id).select_related('author').order_by('created_at', 'id')
+
+    def get_row_fingerprint(self, row):
+        return (row.pk, row.author.username)
+
+    def get_last_modified(self, page):
+        return max((comment.created_at for comment in page), default=None)
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user, post_id=self.kwargs['post_id'])
+        with transaction.atomic():
+            serializer.save(author=self.request.user, post_id=self.kwargs['post_id'])
+            adjust_counters(Post.objects.filter(pk=self.kwargs['post_id']), comment_count=1)
+            bump(self.kwargs['post_id'], 'comment')
+            comment_added(self.kwargs['post_id'], self.request.user.pk, serializer.data)
 
 
-class PostListCreate(generics.ListCreateAPIView):
-    queryset = Post.objects.all().order_by('-published_at')
+class PostListCreate(ConditionalPostsMixin, ConditionalListMixin, generics.ListCreateAPIView):
+    queryset = with_authors(Post.objects.all()).order_by('-published_at', '-id')
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
+    pagination_class = PostCursorPagination
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        with transaction.atomic():
+            post = serializer.save(author=self.request.user)
+            adjust_counters(UserProfile.objects.filter(user=self.request.user), posts_count=1)
+            enqueue('posts.fan_out', {'post_id': post.pk}, priority=5)
+            bump(post.pk, 'post')
+            post_created(post)
+        invalidate_profile(self.request.user.pk)
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -31,14 +75,75 @@ class PostListCreate(generics.ListCreateAPIView):
         return context
 
 
-class PostDetail(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Post.objects.all()
+class Timeline(ConditionalPostsMixin, ConditionalListMixin, generics.ListAPIView):
+    """Posts from the users the current user follows, newest first."""
+    serializer_class = PostSerializer
+    permission_classes = [permissions.IsAuthenticated]
+    pagination_class = TimelineCursorPagination
+
+    def get_queryset(self):
+        return timeline_sources(self.request.user)
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['request'] = self.request
+        return context
+
+
+class PostSearchView(ConditionalPostsMixin, ConditionalListMixin, generics.ListAPIView):
+    """Full-text search over post titles and content, best match first."""
+    serializer_class = PostSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = SearchCursorPagination
+
+    def get_queryset(self):
+        search = PostSearch(self.request.query_params.get('q', ''))
+        if not search.terms:
+            raise ValidationError({'q': 'Enter at least one word to search for.'})
+        return search
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['request'] = self.request
+        return context
+
+
+class TrendingPosts(ConditionalPostsMixin, ConditionalListMixin, generics.ListAPIView):
+    """Posts with the most recent engagement first, read off the PostScore index."""
+    serializer_class = PostSerializer
+    permission_classes = [permissions.AllowAny]
+    pagination_class = TrendingCursorPagination
+
+    def get_queryset(self):
+        # Ordering by PostScore's own columns (trend_post, not Post.id) makes
+        # a page a range scan of its (-epoch, -score, -post) index, with no sort
+        return with_authors(Post.objects.filter(trending_score__isnull=False)).annotate(
+            trend_epoch=F('trending_score__epoch'),
+            trend_score=F('trending_score__score'),
+            trend_post=F('trending_score__post_id'),
+        ).order_by('-trend_epoch', '-trend_score', '-trend_post')
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['request'] = self.request
+        return context
+
+
+class PostDetail(ConditionalPostsMixin, ConditionalRetrieveMixin, generics.RetrieveUpdateDestroyAPIView):
+    # Deleting a post cascades to its TimelineEntry rows.
+    queryset = with_authors(Post.objects.all())
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticatedOrReadOnly]
 
     def perform_update(self, serializer):
         # ensure author is preserved
         serializer.save(author=self.request.user)
+
+    def perform_destroy(self, instance):
+        with transaction.atomic():
+            adjust_counters(UserProfile.objects.filter(user_id=instance.author_id), posts_count=-1)
+            instance.delete()
+        invalidate_profile(instance.author_id)
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -46,15 +151,16 @@ class PostDetail(generics.RetrieveUpdateDestroyAPIView):
         return context
 
 
-class PostsByUser(generics.ListAPIView):
+class PostsByUser(ConditionalPostsMixin, ConditionalListMixin, generics.ListAPIView):
     """Fetch all posts by a specific user (by username)."""
     serializer_class = PostSerializer
     permission_classes = [permissions.AllowAny]
+    pagination_class = PostCursorPagination
 
     def get_queryset(self):
         username = self.kwargs['username']
         user = get_object_or_404(User, username=username)
-        return Post.objects.filter(author=user).order_by('-published_at')
+        return with_authors(Post.objects.filter(author=user)).order_by('-published_at', '-id')
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -67,9 +173,11 @@ class LikePost(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def create(self, request, pk=None):
-        post = get_object_or_404(Post, pk=pk)
-        like, created = Like.objects.get_or_create(user=request.user, post=post)
-        
+        try:
+            created = add_like(request.user, pk)
+        except PostNotFound:
+            raise Http404
+
         if created:
             return Response({'detail': f'You liked this post'}, status=status.HTTP_201_CREATED)
         else:
@@ -81,36 +189,52 @@ class UnlikePost(generics.CreateAPIView):
     permission_classes = [permissions.IsAuthenticated]
 
     def create(self, request, pk=None):
-        post = get_object_or_404(Post, pk=pk)
-        deleted_count, _ = Like.objects.filter(user=request.user, post=post).delete()
-        
-        if deleted_count > 0:
+        try:
+            removed = remove_like(request.user, pk)
+        except PostNotFound:
+            raise Http404
+
+        if removed:
             return Response({'detail': 'You unliked this post'}, status=status.HTTP_200_OK)
         else:
             return Response({'detail': 'You had not liked this post'}, status=status.HTTP_200_OK)
 
 
-class LikedPosts(generics.ListAPIView):
+class LikedPosts(ConditionalPostsMixin, ConditionalListMixin, generics.ListAPIView):
     """Fetch all posts liked by the current user, ordered by when they were liked."""
     serializer_class = PostSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = LikedPostCursorPagination
 
     def get_queryset(self):
-        # Order by when the user liked the post (Like.created_at), most recent first
-        liked_posts = Like.objects.filter(user=self.request.user).order_by('-created_at')
-        post_ids = list(liked_posts.values_list('post_id', flat=True))
-        
-        if not post_ids:
-            return Post.objects.none()
-        
-        # Return posts in the same order as they appear in the likes
-        posts = Post.objects.filter(id__in=post_ids)
-        # Preserve the order from likes queryset
-        from django.db.models import Case, When
-        preserved_order = Case(*[When(pk=pk, then=pos) for pos, pk in enumerate(post_ids)])
-        return posts.annotate(order=preserved_order).order_by('order')
+        # Order by when the user liked the post (Like.created_at), most recent first.
+        # The annotations reuse the filtered join, so each row carries its own like
+        # time and like id, and pages walk the Like (user, -created_at, -id) index.
+        return with_authors(Post.objects.filter(likes__user=self.request.user)).annotate(
+            liked_at=F('likes__created_at'),
+            like_id=F('likes__id'),
+        ).order_by('-liked_at', '-like_id')
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
         context['request'] = self.request
         return context
+
+
+class StreamWatch(generics.GenericAPIView):
+    """
+    Set the posts an event stream reports likes and comments for.
+    Expected fields: stream (id from the stream's "ready" event), posts (list of ids)
+    """
+    permission_classes = [permissions.IsAuthenticated]
+
+    def post(self, request):
+        stream_id = request.data.get('stream')
+        post_ids = request.data.get('posts', [])
+        if not isinstance(stream_id, int) or not isinstance(post_ids, list) \
+                or not all(isinstance(post_id, int) for post_id in post_ids):
+            raise ValidationError({'detail': 'stream must be an id and posts a list of ids'})
+        if len(post_ids) > MAX_WATCHED:
+            raise ValidationError({'posts': f'At most {MAX_WATCHED} posts can be watched'})
+        watch(request.user.pk, stream_id, post_ids)
+        return Response(status=status.HTTP_204_NO_CONTENT)
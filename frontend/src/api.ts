@@ -2,7 +2,7 @@ import axios from "axios"
 
 import { clearAuthStorage, getItem, setItem } from "./utils/storage"
 
-const API_URL = process.env.REACT_APP_API_URL || "http://localhost:8000/api/"
+export const API_URL = process.env.REACT_APP_API_URL || "http://localhost:8000/api/"
 const TOKEN_REFRESH_URL = `${API_URL.replace('/api/', '')}/api/token/refresh/`
 
 const api = axios.create({
@@ -1,10 +1,12 @@
-import { useEffect, useState } from "react"
+import { useEffect, useRef, useState } from "react"
 import { useNavigate } from "react-router-dom"
 import styled from "styled-components"
 import { X } from "react-bootstrap-icons"
 
 import api from "../api"
 import { colors } from "../style"
+import { FollowEntry, Paginated } from "../types"
+import { resolveProfilePicture } from "../utils/profile"
 
 const Overlay = styled.div`
     position: fixed;
@@ -72,6 +74,9 @@ const UserList = styled.div`
 `
 
 const UserItem = styled.div`
+    display: flex;
+    align-items: center;
+    gap: 12px;
     color: ${colors.white};
     font-size: 16px;
     padding: 8px 12px;
@@ -85,6 +90,22 @@ const UserItem = styled.div`
     }
 `
 
+const UserAvatar = styled.img`
+    width: 36px;
+    height: 36px;
+    border-radius: 50%;
+    object-fit: cover;
+`
+
+const UserName = styled.span`
+    flex: 1;
+`
+
+const FollowState = styled.span`
+    color: ${colors.grayPink};
+    font-size: 13px;
+`
+
 const LoadingText = styled.p`
     color: ${colors.grayPink};
     text-align: center;
@@ -103,23 +124,30 @@ type FollowModalProps = {
     onClose: () => void
 }
 
+// Distance from the bottom of the list, in pixels, at which the next page is requested
+const LOAD_MORE_THRESHOLD = 200
+
 const FollowModal = ({ username, type, onClose }: FollowModalProps) => {
     const navigate = useNavigate()
-    const [users, setUsers] = useState<string[]>([])
+    const [users, setUsers] = useState<FollowEntry[]>([])
     const [loading, setLoading] = useState(true)
+    const [nextPage, setNextPage] = useState<string | null>(null)
+    const loadingMore = useRef(false)
 
     useEffect(() => {
         const fetchUsers = async () => {
             setLoading(true)
             try {
                 const endpoint = type === 'followers' 
-                    ? `accounts/auth/user-followers/?username=${username}`
-                    : `accounts/auth/user-following/?username=${username}`
+                    ? `accounts/auth/user-followers/?username=${encodeURIComponent(username)}`
+                    : `accounts/auth/user-following/?username=${encodeURIComponent(username)}`
                 
-                const response = await api.get(endpoint)
-                setUsers(response.data[type] || [])
+                const response = await api.get<Paginated<FollowEntry>>(endpoint)
+                setUsers(response.data?.results || [])
+                setNextPage(response.data?.next ?? null)
             } catch (err) {
                 setUsers([])
+                setNextPage(null)
             } finally {
                 setLoading(false)
             }
@@ -128,6 +156,27 @@ const FollowModal = ({ username, type, onClose }: FollowModalProps) => {
         fetchUsers()
     }, [username, type])
 
+    const loadMore = async () => {
+        if (!nextPage || loadingMore.current) return
+        loadingMore.current = true
+        try {
+            const response = await api.get<Paginated<FollowEntry>>(nextPage)
+            setUsers(current => [...current, ...(response.data?.results || [])])
+            setNextPage(response.data?.next ?? null)
+        } catch (err) {
+            setNextPage(null)
+        } finally {
+            loadingMore.current = false
+        }
+    }
+
+    const handleScroll = (e: React.UIEvent<HTMLDivElement>) => {
+        const list = e.currentTarget
+        if (list.scrollHeight - list.scrollTop - list.clientHeight < LOAD_MORE_THRESHOLD) {
+            loadMore()
+        }
+    }
+
     const handleUserClick = (clickedUsername: string) => {
         navigate(`/${clickedUsername}`)
         onClose()
@@ -148,13 +197,15 @@ const FollowModal = ({ username, type, onClose }: FollowModalProps) => {
                         <X />
                     </CloseButton>
                 </Header>
-                <UserList>
+                <UserList onScroll={handleScroll}>
                     {loading ? (
                         <LoadingText>Carregando...</LoadingText>
                     ) : users.length > 0 ? (
                         users.map(user => (
-                            <UserItem key={user} onClick={() => handleUserClick(user)}>
-                                @{user}
+                            <UserItem key={user.id} onClick={() => handleUserClick(user.username)}>
+                                <UserAvatar src={resolveProfilePicture(user.profile_picture)} alt={user.username} />
+                                <UserName>@{user.username}</UserName>
+                                {user.is_following && <FollowState>Seguindo</FollowState>}
                             </UserItem>
                         ))
                     ) : (
@@ -6,9 +6,12 @@ import { HeartFill, Send } from "react-bootstrap-icons"
 import api from "../api"
 import { colors } from "../style"
 import { useAuth } from "../context/AuthContext"
+import useLiveEvent from "../hooks/useLiveEvent"
+import { watchPost } from "../utils/liveEvents"
 import { formatDateTime } from "../utils/date"
 import { resolveProfilePicture } from "../utils/profile"
 import { DEFAULT_PROFILE_PICTURE } from "../constants"
+import { Comment as CommentData, Paginated } from "../types"
 
 const PostContainer = styled.div`
     padding: 16px 0;
@@ -176,11 +179,14 @@ type Props = {
     published_at?: string;
     like_count?: number;
     is_liked?: boolean;
+    comment_count?: number;
+    // Últimos comentários já embutidos na listagem (?comments=)
+    latest_comments?: CommentData[];
     onUnlike?: (id: number) => void;
 }
 
 
-const Post = ({ id, title, content, author_username, author_pic, published_at, like_count = 0, is_liked = false, onUnlike }: Props) => {
+const Post = ({ id, title, content, author_username, author_pic, published_at, like_count = 0, is_liked = false, comment_count, latest_comments, onUnlike }: Props) => {
     const navigate = useNavigate()
     const [liked, setLiked] = useState(is_liked)
     const [likeCount, setLikeCount] = useState(like_count)
@@ -188,7 +194,10 @@ const Post = ({ id, title, content, author_username, author_pic, published_at, l
     const { isAuthenticated, profilePicture } = useAuth()
 
     // Comments logic
-    const [comments, setComments] = useState<any[]>([])
+    const [comments, setComments] = useState<CommentData[]>(latest_comments || [])
+    const [commentCount, setCommentCount] = useState(comment_count ?? 0)
+    const [nextComments, setNextComments] = useState<string | null>(null)
+    const [threadLoaded, setThreadLoaded] = useState(!latest_comments)
     const [commentInput, setCommentInput] = useState("")
     const [loadingComments, setLoadingComments] = useState(false)
     const [posting, setPosting] = useState(false)
@@ -206,21 +215,64 @@ const Post = ({ id, title, content, author_username, author_pic, published_at, l
         }
     }, [isAuthenticated, profilePicture])
 
-    useEffect(() => {
-        if (!id) return;
+    const appendComments = (incoming: CommentData[]) => {
+        setComments(current => {
+            const known = new Set(current.map(c => c.id));
+            return [...current, ...incoming.filter(c => !known.has(c.id))];
+        });
+    };
+
+    // Sem prévia embutida, busca o início da conversa; com prévia, só quando o usuário pede
+    const loadThread = async (url: string) => {
         setLoadingComments(true);
-        api.get(`posts/${id}/comments/`)
-            .then(res => setComments(res.data))
-            .catch(() => setComments([]))
-            .finally(() => setLoadingComments(false));
+        try {
+            const res = await api.get<Paginated<CommentData>>(url);
+            if (!threadLoaded) {
+                setComments(res.data.results || []);
+                setThreadLoaded(true);
+            } else {
+                appendComments(res.data.results || []);
+            }
+            setNextComments(res.data.next ?? null);
+        } catch {
+            if (!threadLoaded) setComments([]);
+        } finally {
+            setLoadingComments(false);
+        }
+    };
+
+    useEffect(() => {
+        if (!id || latest_comments) return;
+        loadThread(`posts/${id}/comments/`);
+        // eslint-disable-next-line react-hooks/exhaustive-deps
     }, [id]);
 
+    // Curtidas e comentários ao vivo enquanto o post está na tela
+    useEffect(() => {
+        if (!id || !isAuthenticated) return;
+        return watchPost(id);
+    }, [id, isAuthenticated]);
+
+    useLiveEvent('likes', (deltas) => {
+        if (id && deltas[id]) {
+            setLikeCount(count => Math.max(0, count + deltas[id]));
+        }
+    });
+
+    useLiveEvent('comment', ({ post, comment }) => {
+        if (post !== id) return;
+        if (comments.some(c => c.id === comment.id)) return;
+        setCommentCount(count => count + 1);
+        appendComments([comment]);
+    });
+
     const handleComment = async () => {
         if (!commentInput.trim() || !id) return;
         setPosting(true);
         try {
             const res = await api.post(`posts/${id}/comments/`, { content: commentInput });
-            setComments([...comments, res.data]);
+            setCommentCount(count => count + 1);
+            appendComments([res.data]);
             setCommentInput("");
             // Reset textarea height
             if (textareaRef.current) {
@@ -273,7 +325,7 @@ const Post = ({ id, title, content, author_username, author_pic, published_at, l
                 // Unlike
                 await api.post(`posts/${id}/unlike/`)
                 setLiked(false)
-                setLikeCount(Math.max(0, likeCount - 1))
+                setLikeCount(count => Math.max(0, count - 1))
                 if (onUnlike) {
                     onUnlike(id)
                 }
@@ -281,7 +333,7 @@ const Post = ({ id, title, content, author_username, author_pic, published_at, l
                 // Like
                 await api.post(`posts/${id}/like/`)
                 setLiked(true)
-                setLikeCount(likeCount + 1)
+                setLikeCount(count => count + 1)
             }
         } catch (err: any) {
             // Silently fail
@@ -349,6 +401,14 @@ const Post = ({ id, title, content, author_username, author_pic, published_at, l
                         <span style={{ color: colors.grayPink }}>Nenhum comentário ainda.</span>
                     )
                 )}
+                {!loadingComments && id && !threadLoaded && commentCount > comments.length && (
+                    <ShowMore onClick={() => loadThread(`posts/${id}/comments/`)}>
+                        ver todos os {commentCount} comentários
+                    </ShowMore>
+                )}
+                {!loadingComments && nextComments && (
+                    <ShowMore onClick={() => loadThread(nextComments)}>carregar mais comentários</ShowMore>
+                )}
             </Comments>
         </PostContainer>
     )
@@ -0,0 +1,18 @@
+import { useEffect, useRef } from "react"
+
+import { useAuth } from "../context/AuthContext"
+import { onLiveEvent } from "../utils/liveEvents"
+
+// Chama `handler` a cada evento `type` do stream ao vivo, enquanto logado
+const useLiveEvent = (type: 'post' | 'likes' | 'comment' | 'resync', handler: (data: any) => void) => {
+    const { isAuthenticated } = useAuth()
+    const handlerRef = useRef(handler)
+    handlerRef.current = handler
+
+    useEffect(() => {
+        if (!isAuthenticated) return
+        return onLiveEvent(type, data => handlerRef.current(data))
+    }, [type, isAuthenticated])
+}
+
+export default useLiveEvent
@@ -1,7 +1,8 @@
-import { useEffect, useMemo, useState } from "react"
+import { useCallback, useEffect, useState } from "react"
 
 import api from "../api"
-import { Post } from "../types"
+import { COMMENT_PREVIEWS } from "../constants"
+import { Paginated, Post } from "../types"
 
 type FeedTab = 'for-you' | 'following'
 
@@ -10,48 +11,66 @@ type UsePostsFeedResult = {
     loading: boolean
     error: string | null
     refresh: () => Promise<void>
+    loadMore: () => Promise<void>
+    hasMore: boolean
     filteredPosts: Post[]
 }
 
-const usePostsFeed = (activeTab: FeedTab, followingUsers: string[]) => {
+const FEED_ENDPOINTS: Record<FeedTab, string> = {
+    // Posts em alta: engajamento recente, com decaimento no tempo
+    'for-you': `posts/trending/?comments=${COMMENT_PREVIEWS}`,
+    // Filtrado no servidor: apenas posts de quem o usuário segue
+    'following': `posts/timeline/?comments=${COMMENT_PREVIEWS}`,
+}
+
+const usePostsFeed = (activeTab: FeedTab) => {
     const [posts, setPosts] = useState<Post[]>([])
     const [loading, setLoading] = useState(false)
     const [error, setError] = useState<string | null>(null)
+    const [nextPage, setNextPage] = useState<string | null>(null)
 
-    const fetchPosts = async () => {
+    const fetchPosts = useCallback(async () => {
         setLoading(true)
         setError(null)
         try {
-            const response = await api.get<Post[]>("posts/")
+            const response = await api.get<Paginated<Post>>(FEED_ENDPOINTS[activeTab])
             // Garantir que sempre temos um array
-            const postsData = Array.isArray(response.data) ? response.data : []
+            const postsData = Array.isArray(response.data?.results) ? response.data.results : []
             setPosts(postsData)
+            setNextPage(response.data?.next ?? null)
         } catch (err: any) {
             console.error("Erro ao carregar posts:", err)
             setError(err?.response?.data?.detail || "Erro ao carregar posts")
             setPosts([])
+            setNextPage(null)
         } finally {
             setLoading(false)
         }
+    }, [activeTab])
+
+    const loadMore = async () => {
+        if (!nextPage) return
+        try {
+            const response = await api.get<Paginated<Post>>(nextPage)
+            setPosts(current => [...current, ...(response.data?.results || [])])
+            setNextPage(response.data?.next ?? null)
+        } catch (err: any) {
+            setError(err?.response?.data?.detail || "Erro ao carregar posts")
+        }
     }
 
     useEffect(() => {
         fetchPosts()
-    }, [])
-
-    const filteredPosts = useMemo(() => {
-        if (activeTab === 'following') {
-            return posts.filter(post => followingUsers.includes(post.author_username))
-        }
-        return posts
-    }, [activeTab, posts, followingUsers])
+    }, [fetchPosts])
 
     return {
         posts,
-        filteredPosts,
+        filteredPosts: posts,
         loading,
         error,
         refresh: fetchPosts,
+        loadMore,
+        hasMore: nextPage !== null,
     } as UsePostsFeedResult
 }
 
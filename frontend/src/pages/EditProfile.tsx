@@ -5,8 +5,13 @@ import styled from "styled-components"
 import api from "../api"
 import { useAuth } from "../context/AuthContext"
 import { resolveProfilePicture } from "../utils/profile"
+import { setItem } from "../utils/storage"
 import { colors, screen_width } from "../style"
 
+// The uploaded picture goes live once the backend finishes processing it
+const PICTURE_POLL_ATTEMPTS = 10
+const PICTURE_POLL_INTERVAL_MS = 1000
+
 const Container = styled.div`
     height: 100vh;
     max-width: ${screen_width.mobile};
@@ -206,11 +211,16 @@ const EditProfile = () => {
             setSuccess("Foto de perfil atualizada com sucesso!")
             setProfilePictureFile(null)
 
-            // Fetch updated profile to get the new picture URL
+            // The picture is processed in the background; poll until the new URL is live
             try {
-                const updatedProfile = await api.get("accounts/auth/me/")
-                const pic = resolveProfilePicture(updatedProfile.data.profile?.profile_picture)
-                setProfilePicturePreview(pic)
+                for (let attempt = 0; attempt < PICTURE_POLL_ATTEMPTS; attempt++) {
+                    await new Promise(resolve => setTimeout(resolve, PICTURE_POLL_INTERVAL_MS))
+                    const updatedProfile = await api.get("accounts/auth/me/")
+                    if (!updatedProfile.data.profile?.profile_picture_processing) {
+                        setProfilePicturePreview(resolveProfilePicture(updatedProfile.data.profile?.profile_picture))
+                        break
+                    }
+                }
                 await refreshUser()
             } catch (err) {
                 // Silently fail - profile picture was updated successfully
@@ -295,7 +305,12 @@ const EditProfile = () => {
                 payload.new_password = newPassword
             }
 
-            await api.post("accounts/auth/update-email-password/", payload)
+            const response = await api.post("accounts/auth/update-email-password/", payload)
+            // A new password revokes the old tokens; keep the session with the new ones
+            if (response.data.access && response.data.refresh) {
+                setItem("access", response.data.access)
+                setItem("refresh", response.data.refresh)
+            }
 
             setSuccess("Email e/ou senha atualizados com sucesso!")
             await refreshUser()
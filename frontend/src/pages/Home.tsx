@@ -6,10 +6,10 @@ import { PersonFill } from "react-bootstrap-icons"
 import NewPost from "../components/PlusButton"
 import Post from "../components/Post"
 import usePostsFeed from "../hooks/usePostsFeed"
+import useLiveEvent from "../hooks/useLiveEvent"
 import { useAuth } from "../context/AuthContext"
 import { DEFAULT_PROFILE_PICTURE } from "../constants"
 
-import api from "../api"
 import { colors, screen_width } from "../style"
 
 const Container = styled.div`
@@ -89,37 +89,56 @@ const FeedOption = styled.div`
     }
 `
 
+const NewPostsBanner = styled.button`
+    width: 100%;
+    padding: 12px;
+    background: transparent;
+    color: ${colors.pink};
+    font-size: 14px;
+    font-weight: 600;
+    cursor: pointer;
+    border-bottom: 1px solid ${colors.grayPink};
+`
+
+const LoadMoreButton = styled.button`
+    width: 100%;
+    padding: 16px;
+    background: transparent;
+    color: ${colors.pink};
+    font-size: 16px;
+    font-weight: 600;
+    cursor: pointer;
+`
+
 const Home = () => {
     const navigate = useNavigate()
     const { isAuthenticated, user, profilePicture, refreshUser } = useAuth()
     const [activeTab, setActiveTab] = useState<'for-you' | 'following'>('for-you')
-    const [followingUsers, setFollowingUsers] = useState<string[]>([])
 
     // Keep auth data fresh (profile picture/username)
     useEffect(() => {
         refreshUser()
     }, [refreshUser])
 
-    // Fetch current user's following list when logged in
-    useEffect(() => {
-        if (!isAuthenticated) {
-            setFollowingUsers([])
-            return
-        }
-
-        const fetchFollowing = async () => {
-            try {
-                const response = await api.get("accounts/auth/following/")
-                setFollowingUsers(response.data.following || [])
-            } catch (err: any) {
-                setFollowingUsers([])
-            }
-        }
+    const { filteredPosts, loading: loadingPosts, error: postsError, hasMore, loadMore, refresh } = usePostsFeed(activeTab)
 
-        fetchFollowing()
-    }, [isAuthenticated])
+    // Posts publicados por quem o usuário segue desde o último carregamento
+    const [newPosts, setNewPosts] = useState(0)
 
-    const { filteredPosts, loading: loadingPosts, error: postsError } = usePostsFeed(activeTab, followingUsers)
+    useEffect(() => {
+        setNewPosts(0)
+    }, [activeTab])
+
+    useLiveEvent('post', () => setNewPosts(count => count + 1))
+    useLiveEvent('resync', () => {
+        setNewPosts(0)
+        refresh()
+    })
+
+    const showNewPosts = () => {
+        setNewPosts(0)
+        refresh()
+    }
 
     return (
         <Container>
@@ -152,6 +171,11 @@ const Home = () => {
                         </button>
                     )}
                 </FeedOption>
+                {newPosts > 0 && (
+                    <NewPostsBanner onClick={showNewPosts}>
+                        {newPosts === 1 ? 'Mostrar 1 novo post' : `Mostrar ${newPosts} novos posts`}
+                    </NewPostsBanner>
+                )}
                 {loadingPosts ? (
                     <p style={{ color: colors.white, padding: '16px', textAlign: 'center' }}>Carregando posts...</p>
                 ) : postsError ? (
@@ -169,12 +193,17 @@ const Home = () => {
                                 published_at={post.published_at}
                                 like_count={post.like_count}
                                 is_liked={post.is_liked}
+                                comment_count={post.comment_count}
+                                latest_comments={post.latest_comments}
                             />
                         ))
                     ) : (
                         <p style={{ color: colors.grayPink, padding: '16px', textAlign: 'center' }}>Nenhum post para mostrar.</p>
                     )
                 })()}
+                {!loadingPosts && hasMore && (
+                    <LoadMoreButton onClick={loadMore}>Carregar mais</LoadMoreButton>
+                )}
             </Feed>
         </Container>
     )
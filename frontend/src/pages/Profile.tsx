@@ -11,7 +11,7 @@ import { useAuth } from "../context/AuthContext"
 import { useToast } from "../context/ToastContext"
 import useProfileData from "../hooks/useProfileData"
 import { formatDate } from "../utils/date"
-import { DEFAULT_PROFILE_PICTURE } from "../constants"
+import { COMMENT_PREVIEWS, DEFAULT_PROFILE_PICTURE } from "../constants"
 
 import { colors, screen_width } from "../style"
 import ActionButton from "../components/ActionButton"
@@ -138,8 +138,8 @@ const Profile = () => {
 
         const fetchPosts = async () => {
             try {
-                const response = await api.get(`posts/user/${username}/`)
-                setPosts(response.data)
+                const response = await api.get(`posts/user/${username}/?comments=${COMMENT_PREVIEWS}`)
+                setPosts(response.data.results || [])
             } catch (err: any) {
                 setPosts([])
             }
@@ -154,8 +154,8 @@ const Profile = () => {
 
         const fetchLikedPosts = async () => {
             try {
-                const response = await api.get("posts/liked/")
-                setLikedPosts(response.data)
+                const response = await api.get(`posts/liked/?comments=${COMMENT_PREVIEWS}`)
+                setLikedPosts(response.data.results || [])
             } catch (err: any) {
                 setLikedPosts([])
             }
@@ -283,7 +283,7 @@ const Profile = () => {
                     activeTab === 'posts' && (
                         posts && posts.length > 0 ? (
                             posts.map((post: any) => (
-                                <Post key={post.id} id={post.id} title={post.title} content={post.content} author_username={post.author_username} author_pic={post.author_profile_picture} published_at={post.published_at} like_count={post.like_count} is_liked={post.is_liked} />
+                                <Post key={post.id} id={post.id} title={post.title} content={post.content} author_username={post.author_username} author_pic={post.author_profile_picture} published_at={post.published_at} like_count={post.like_count} is_liked={post.is_liked} comment_count={post.comment_count} latest_comments={post.latest_comments} />
                             ))
                         ) : (
                             <ZeroPost>Nenhuma publicação para mostrar.</ZeroPost>
@@ -294,7 +294,7 @@ const Profile = () => {
                     activeTab === 'likes' && isOwner && (
                         likedPosts && likedPosts.length > 0 ? (
                             likedPosts.map((post: any) => (
-                                <Post key={post.id} id={post.id} title={post.title} content={post.content} author_username={post.author_username} author_pic={post.author_profile_picture} published_at={post.published_at} like_count={post.like_count} is_liked={post.is_liked} onUnlike={(id) => setLikedPosts(prev => prev.filter(p => p.id !== id))} />
+                                <Post key={post.id} id={post.id} title={post.title} content={post.content} author_username={post.author_username} author_pic={post.author_profile_picture} published_at={post.published_at} like_count={post.like_count} is_liked={post.is_liked} comment_count={post.comment_count} latest_comments={post.latest_comments} onUnlike={(id) => setLikedPosts(prev => prev.filter(p => p.id !== id))} />
                             ))
                         ) : (
                             <ZeroPost>Você ainda não curtiu nenhum post.</ZeroPost>
@@ -1,5 +1,7 @@
 export type Profile = {
     profile_picture?: string | null
+    profile_picture_variants?: Record<string, string>
+    profile_picture_processing?: boolean
     created_at?: string
 }
 
@@ -9,6 +11,7 @@ export type User = {
     profile?: Profile
     followers_count?: number
     following_count?: number
+    posts_count?: number
     is_following?: boolean
 }
 
@@ -20,7 +23,9 @@ export type Post = {
     author_profile_picture?: string | null
     published_at?: string
     like_count: number
+    comment_count?: number
     is_liked: boolean
+    latest_comments?: Comment[]
 }
 
 export type Comment = {
@@ -29,3 +34,17 @@ export type Comment = {
     content: string
     created_at?: string
 }
+
+export type FollowEntry = {
+    id: number
+    username: string
+    profile_picture?: string | null
+    is_following: boolean
+    followed_at: string
+}
+
+export type Paginated<T> = {
+    next: string | null
+    previous: string | null
+    results: T[]
+}
@@ -0,0 +1,87 @@
+import api, { API_URL } from "../api"
+import { getItem } from "./storage"
+
+// Um único EventSource por aba, compartilhado por todos os componentes
+type Handler = (data: any) => void
+
+const EVENT_TYPES = ['post', 'likes', 'comment', 'resync']
+const RECONNECT_DELAY = 5000
+// Limite do servidor (posts/live.py MAX_WATCHED)
+const MAX_WATCHED = 200
+
+let source: EventSource | null = null
+let streamId: number | null = null
+let reconnectTimer: ReturnType<typeof setTimeout> | null = null
+let watchTimer: ReturnType<typeof setTimeout> | null = null
+const handlers = new Map<string, Set<Handler>>()
+// Post id -> quantos componentes o exibem
+const watched = new Map<number, number>()
+
+const emit = (type: string, data: any) => {
+    handlers.get(type)?.forEach(handler => handler(data))
+}
+
+const sendWatchList = () => {
+    if (watchTimer) clearTimeout(watchTimer)
+    // Agrupa as mudanças de um mesmo render em uma requisição
+    watchTimer = setTimeout(() => {
+        watchTimer = null
+        if (streamId === null) return
+        api.post("posts/stream/watch/", { stream: streamId, posts: Array.from(watched.keys()).slice(-MAX_WATCHED) })
+            .catch(() => {})
+    }, 300)
+}
+
+const disconnect = () => {
+    if (reconnectTimer) clearTimeout(reconnectTimer)
+    reconnectTimer = null
+    source?.close()
+    source = null
+    streamId = null
+}
+
+const connect = () => {
+    const token = getItem("access")
+    if (source || !token) return
+
+    source = new EventSource(`${API_URL}posts/stream/?access_token=${encodeURIComponent(token)}`)
+    source.addEventListener("ready", (event) => {
+        streamId = JSON.parse((event as MessageEvent).data).stream
+        sendWatchList()
+    })
+    EVENT_TYPES.forEach(type => {
+        source!.addEventListener(type, (event) => emit(type, JSON.parse((event as MessageEvent).data)))
+    })
+    source.onerror = () => {
+        // O navegador reconecta sozinho, exceto quando o servidor recusa
+        // a conexão (ex.: token expirado); então tentamos com o token atual
+        if (source?.readyState !== EventSource.CLOSED) return
+        disconnect()
+        reconnectTimer = setTimeout(() => {
+            connect()
+            // Eventos perdidos enquanto desconectado
+            emit("resync", {})
+        }, RECONNECT_DELAY)
+    }
+}
+
+export const onLiveEvent = (type: string, handler: Handler) => {
+    if (!handlers.has(type)) handlers.set(type, new Set())
+    handlers.get(type)!.add(handler)
+    connect()
+    return () => {
+        handlers.get(type)?.delete(handler)
+        if (Array.from(handlers.values()).every(set => set.size === 0)) disconnect()
+    }
+}
+
+export const watchPost = (id: number) => {
+    watched.set(id, (watched.get(id) || 0) + 1)
+    sendWatchList()
+    return () => {
+        const count = (watched.get(id) || 1) - 1
+        if (count > 0) watched.set(id, count)
+        else watched.delete(id)
+        sendWatchList()
+    }
+}